@@ -0,0 +1,33 @@
+"""The installer is one script, ulli-linux.py; tests load it as the module
+"ulli".  Importing it needs PyGObject with GTK 3 and VTE, so without those
+every test that uses the fixture is skipped."""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+SCRIPT = Path(__file__).resolve().parent.parent / "ulli-linux.py"
+
+
+def load_script():
+    """Import ulli-linux.py once per process and return the module."""
+    if "ulli" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("ulli", SCRIPT)
+        mod = importlib.util.module_from_spec(spec)
+        sys.modules["ulli"] = mod
+        try:
+            spec.loader.exec_module(mod)
+        except BaseException:
+            del sys.modules["ulli"]
+            raise
+    return sys.modules["ulli"]
+
+
+@pytest.fixture(scope="session")
+def ulli():
+    try:
+        return load_script()
+    except (ImportError, ValueError) as e:   # no gi, or no GTK 3 / VTE typelib
+        pytest.skip(f"cannot load {SCRIPT.name}: {e}")
@@ -0,0 +1,120 @@
+"""DiskCache: uevents for a loop device drop what is cached about it, and a
+re-read snapshot replaces the cached one without holding up the uevent
+reader."""
+
+import fcntl
+import os
+import shutil
+import struct
+import subprocess
+import threading
+import time
+
+import pytest
+
+BLKRRPART = 0x125F
+
+
+@pytest.fixture
+def cache(ulli):
+    cache = ulli.DiskCache()
+    if not cache.listening:
+        pytest.skip("no kernel uevent socket")
+    return cache
+
+
+@pytest.fixture
+def loop(tmp_path):
+    if os.geteuid() != 0 or not shutil.which("losetup"):
+        pytest.skip("needs root and losetup")
+    img = tmp_path / "disk.img"
+    with open(img, "wb") as f:
+        f.truncate(64 << 20)
+    res = subprocess.run(["losetup", "-fP", "--show", str(img)],
+                         capture_output=True, text=True)
+    if res.returncode != 0:
+        pytest.skip(f"losetup: {res.stderr.strip()}")
+    dev = res.stdout.strip()
+    try:
+        yield dev
+    finally:
+        subprocess.run(["losetup", "-d", dev], capture_output=True)
+
+
+def changed(cache, disk_path, before, timeout=5):
+    """Whether a uevent for disk_path arrives within timeout seconds.
+    settle() drops the disk itself, so this polls instead."""
+    deadline = time.monotonic() + timeout
+    while cache.generation(disk_path) == before:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_loop_device_events(ulli, cache, loop):
+    cache.settle(loop, timeout=5)
+    assert cache.partitions(loop) is None          # blank: nothing to cache
+
+    before = cache.generation(loop)
+    mbr = bytearray(512)
+    mbr[510:512] = b"\x55\xaa"
+    struct.pack_into("<B3xB3xII", mbr, 446, 0, 0x83, 2048, 40960)
+    fd = os.open(loop, os.O_RDWR)
+    try:
+        os.write(fd, mbr)
+        os.fsync(fd)
+        fcntl.ioctl(fd, BLKRRPART)
+    finally:
+        os.close(fd)
+    # without partition scanning the re-read raises no event; ask for the
+    # change event the way udevadm trigger does
+    with open(f"/sys/class/block/{os.path.basename(loop)}/uevent", "w") as f:
+        f.write("change")
+    assert changed(cache, loop, before)
+    cache.settle(loop, timeout=5)
+    parts, label, _ = cache.partitions(loop)
+    assert label == "msdos"
+    assert [(p["num"], p["start_mib"], p["end_mib"]) for p in parts if not p["is_free"]] \
+        == [(1, 1, 21)]
+    assert cache.partitions(loop)[0] is parts       # served from the cache
+
+    before = cache.generation(loop)
+    subprocess.run(["losetup", "-d", loop], check=True)
+    assert changed(cache, loop, before)
+    cache.settle(loop, timeout=5)
+    assert cache.partitions(loop) is None           # the cached table was dropped
+
+
+def test_inventory_is_read_outside_the_lock(ulli, cache, monkeypatch):
+    first = cache.inventory()
+    devices = dict(first.devices)
+    cache.invalidate("ulli-test0")
+
+    reads, entered, release = [], threading.Event(), threading.Event()
+    refresh = ulli.DiskInventory.refresh
+
+    def slow_refresh(self, disks=None):
+        reads.append(disks)
+        entered.set()
+        release.wait(5)
+        refresh(self, disks)
+
+    monkeypatch.setattr(ulli.DiskInventory, "refresh", slow_refresh)
+    got = []
+    reader = threading.Thread(target=lambda: got.append(cache.inventory()))
+    reader.start()
+    assert entered.wait(5)
+    start = time.monotonic()
+    cache.invalidate("ulli-test1")                  # what the uevent reader does
+    assert time.monotonic() - start < 1
+    release.set()
+    reader.join(10)
+
+    second = got[0]
+    assert second is not first
+    assert first.devices == devices                 # the old snapshot was not touched
+    assert reads == [["/dev/ulli-test0"]]
+    # the disk that changed during the read is still stale
+    assert cache.inventory() is not second
+    assert reads[-1] == ["/dev/ulli-test1"]
@@ -0,0 +1,180 @@
+"""Fat32Image: a plan written into a sparse image file must be a FAT32 volume
+that fsck.fat accepts and that reads back to the same tree."""
+
+import os
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+IMAGE_BYTES = 300 << 20     # smallest sizes give FAT32 with 4 KiB clusters
+SHORT_CHARS = set(b" ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&'()-@^_`{}~")
+
+
+@pytest.fixture
+def volume(ulli, tmp_path):
+    """(image path, {path: bytes} of every file, {path} of every directory)."""
+    src = tmp_path / "src.bin"
+    blob = os.urandom(6 << 20)
+    src.write_bytes(blob)
+    files = {
+        "casper/filesystem.squashfs": (0, 5 << 20),
+        "casper/vmlinuz": (5 << 20, 700_001),
+        "boot/grub/grub.cfg": None,
+        "EFI/BOOT/BOOTx64.EFI": ((5 << 20) + 700_001, 4096),
+        "README.diskdefines": ((6 << 20) - 10, 10),
+        "empty": (0, 0),
+    }
+    # enough long names for a directory that spans several clusters
+    files.update({f"pool/main/l/linux-signed/package-number-{i:03d}.deb": (i * 97, i)
+                  for i in range(200)})
+    plan = {"dirs": ["casper", "boot", "boot/grub", "EFI", "EFI/BOOT", "pool",
+                     "pool/main", "pool/main/l", "pool/main/l/linux-signed", ".disk"],
+            "files": []}
+    want = {}
+    for path, ext in files.items():
+        if ext is None:
+            data = b"set timeout=5\nsearch --label LINUX_LIVE\n"
+            plan["files"].append({"path": path, "size": len(data), "extents": [],
+                                  "data": data})
+            want[path] = data
+        else:
+            off, length = ext
+            plan["files"].append({"path": path, "size": length,
+                                  "extents": [(off, length)] if length else []})
+            want[path] = blob[off:off + length]
+
+    img = tmp_path / "live.img"
+    with open(img, "wb") as f:
+        f.truncate(IMAGE_BYTES)
+    src_fd = os.open(src, os.O_RDONLY)
+    dst_fd = os.open(img, os.O_RDWR)
+    try:
+        ulli.fat_image_from_plan(plan).write(dst_fd, IMAGE_BYTES, src_fd=src_fd)
+    finally:
+        os.close(src_fd)
+        os.close(dst_fd)
+    return img, want, set(plan["dirs"])
+
+
+def read_fat32(path):
+    """Parse a FAT32 image; returns (label, files, dirs, free clusters as
+    counted, FSInfo free count) and checks the invariants on the way."""
+    with open(path, "rb") as f:
+        image = f.read()
+    boot = image[:512]
+    assert boot[510:512] == b"\x55\xaa"
+    assert boot[82:90] == b"FAT32   "
+    bps, spc, reserved, nfats = struct.unpack_from("<HBHB", boot, 11)
+    total, fat_sectors = struct.unpack_from("<II", boot, 32)
+    root, fsinfo_sector, backup = struct.unpack_from("<IHH", boot, 44)
+    assert (bps, nfats) == (512, 2)
+    assert image[backup * 512:backup * 512 + 512] == boot
+    assert total * 512 <= len(image)
+
+    fsinfo = image[fsinfo_sector * 512:fsinfo_sector * 512 + 512]
+    assert struct.unpack_from("<I", fsinfo, 0)[0] == 0x41615252
+    assert struct.unpack_from("<I", fsinfo, 484)[0] == 0x61417272
+    assert struct.unpack_from("<I", fsinfo, 508)[0] == 0xAA550000
+    fsinfo_free = struct.unpack_from("<I", fsinfo, 488)[0]
+
+    fat_bytes = fat_sectors * 512
+    fat1 = image[reserved * 512:reserved * 512 + fat_bytes]
+    fat2 = image[reserved * 512 + fat_bytes:reserved * 512 + 2 * fat_bytes]
+    assert fat1 == fat2
+    clusters = (total - reserved - 2 * fat_sectors) // spc
+    assert clusters >= 65525
+    fat = [v & 0x0FFFFFFF for v in struct.unpack_from(f"<{clusters + 2}I", fat1)]
+    data_start = (reserved + 2 * fat_sectors) * 512
+    csize = spc * 512
+    owner = {}
+
+    def chain(first, who):
+        out = []
+        c = first
+        while c < 0x0FFFFFF8:
+            assert 2 <= c < clusters + 2, f"{who}: cluster {c} out of range"
+            assert c not in owner, f"{who}: cluster {c} also used by {owner.get(c)}"
+            owner[c] = who
+            out.append(c)
+            c = fat[c]
+        return out
+
+    def content(first, who):
+        return b"".join(image[data_start + (c - 2) * csize:data_start + (c - 1) * csize]
+                        for c in chain(first, who))
+
+    label, files, dirs = None, {}, set()
+
+    def walk(first, prefix, parent):
+        raw = content(first, prefix or "/")
+        lfn, shorts = [], set()
+        for i in range(0, len(raw), 32):
+            e = raw[i:i + 32]
+            if e[0] == 0:
+                break
+            attr = e[11]
+            if attr == 0x0F:
+                lfn.append(e)
+                continue
+            short = e[:11]
+            cluster = struct.unpack_from("<H", e, 20)[0] << 16 | struct.unpack_from("<H", e, 26)[0]
+            if attr & 0x08:
+                nonlocal label
+                label = short.rstrip().decode()
+                continue
+            if short in (b".          ", b"..         "):
+                assert cluster == (first if short[1] == 0x20 else parent), prefix
+                continue
+            assert short not in shorts and set(short) <= SHORT_CHARS, short
+            shorts.add(short)
+            if lfn:
+                csum = 0
+                for ch in short:
+                    csum = (((csum & 1) << 7) + (csum >> 1) + ch) & 0xFF
+                assert all(x[13] == csum for x in lfn)
+                assert lfn[0][0] & 0x40 and lfn[0][0] & 0x3F == len(lfn)
+                units = b"".join(x[1:11] + x[14:26] + x[28:32] for x in reversed(lfn))
+                name = units.decode("utf-16-le").split("\0")[0]
+                lfn = []
+            else:
+                stem, ext = short[:8].rstrip(), short[8:].rstrip()
+                name = (stem + (b"." + ext if ext else b"")).decode()
+            path = f"{prefix}/{name}".lstrip("/")
+            if attr & 0x10:
+                dirs.add(path)
+                walk(cluster, path, 0 if first == root else first)
+            else:
+                size = struct.unpack_from("<I", e, 28)[0]
+                body = content(cluster, path) if cluster else b""
+                assert len(body) == -(-size // csize) * csize, path
+                files[path] = body[:size]
+
+    walk(root, "", 0)
+    free = sum(1 for v in fat[2:] if v == 0)
+    assert free == clusters - len(owner), "FAT entries in use outside any chain"
+    return label, files, dirs, free, fsinfo_free
+
+
+def test_reads_back(volume):
+    img, want, want_dirs = volume
+    label, files, dirs, free, fsinfo_free = read_fat32(img)
+    assert label == "LINUX_LIVE"
+    assert files == want
+    assert dirs == want_dirs
+    assert fsinfo_free == free
+
+
+@pytest.mark.skipif(not shutil.which("fsck.fat"), reason="fsck.fat (dosfstools) not installed")
+def test_fsck_fat_accepts_it(volume):
+    img, _, _ = volume
+    res = subprocess.run(["fsck.fat", "-n", "-v", str(img)], capture_output=True, text=True)
+    assert res.returncode == 0, res.stdout + res.stderr
+
+
+def test_too_small_volume_is_refused(ulli, tmp_path):
+    img = ulli.Fat32Image()
+    with open(tmp_path / "tiny.img", "wb") as f:
+        with pytest.raises(ValueError):
+            img.write(f.fileno(), 32 << 20)
@@ -0,0 +1,176 @@
+"""read_partition_table: GPT and MBR/EBR labels built in image files must read
+back at sector precision, and legacy_partitions must turn them into the MiB
+dicts the strategies use."""
+
+import struct
+import uuid
+import zlib
+
+import pytest
+
+SECTOR = 512
+ESP = "c12a7328-f81f-11d2-ba4b-00a0c93ec93b"
+LINUX = "0fc63daf-8483-4772-8e79-3d69d8477de4"
+BASIC = "ebd0a0a2-b9e5-4433-87c0-68b6b72699c7"
+GPT_BYTES = 512 << 20
+GPT_PARTS = [(2048, 206847, ESP, "EFI"),          # 1 MiB .. 101 MiB
+             (206848, 411647, BASIC, "Windows"),  # 101 MiB .. 201 MiB
+             (614400, 819199, LINUX, "LINUX_LIVE")]
+
+
+def mbr_entry(buf, i, status, ptype, start, count):
+    struct.pack_into("<B3xB3xII", buf, 446 + 16 * i, status, ptype, start, count)
+
+
+def boot_record():
+    buf = bytearray(SECTOR)
+    buf[510:512] = b"\x55\xaa"
+    return buf
+
+
+def write_gpt(path, size, parts):
+    """GPT with primary and backup headers; parts are (first, last inclusive,
+    type GUID, name)."""
+    sectors = size // SECTOR
+    ents = bytearray(128 * 128)
+    for i, (first, last, ptype, name) in enumerate(parts):
+        struct.pack_into("<16s16sQQQ72s", ents, i * 128, uuid.UUID(ptype).bytes_le,
+                         uuid.uuid4().bytes_le, first, last, 0, name.encode("utf-16-le"))
+    ent_sectors = len(ents) // SECTOR
+    disk_guid = uuid.uuid4().bytes_le
+
+    def header(lba, alt, ent_lba):
+        hdr = bytearray(struct.pack("<8sIIIIQQQQ16sQIII", b"EFI PART", 0x10000, 92, 0, 0,
+                                    lba, alt, 2 + ent_sectors, sectors - 2 - ent_sectors,
+                                    disk_guid, ent_lba, 128, 128, zlib.crc32(ents)))
+        struct.pack_into("<I", hdr, 16, zlib.crc32(hdr))
+        return bytes(hdr).ljust(SECTOR, b"\0")
+
+    mbr = boot_record()
+    mbr_entry(mbr, 0, 0, 0xEE, 1, min(sectors - 1, 0xFFFFFFFF))
+    with open(path, "wb") as f:
+        f.truncate(size)
+        f.write(mbr)
+        f.write(header(1, sectors - 1, 2))
+        f.write(ents)
+        f.seek((sectors - 1 - ent_sectors) * SECTOR)
+        f.write(ents)
+        f.write(header(sectors - 1, 1, sectors - 1 - ent_sectors))
+    return sectors
+
+
+def corrupt(path, offset):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+
+@pytest.fixture
+def gpt_image(tmp_path):
+    path = tmp_path / "gpt.img"
+    return path, write_gpt(path, GPT_BYTES, GPT_PARTS)
+
+
+@pytest.fixture
+def mbr_image(tmp_path):
+    """NTFS primary (active), an extended partition holding two logicals
+    chained through EBRs, and an unaligned gap after the extended one."""
+    path = tmp_path / "mbr.img"
+    ext = 206848
+    mbr = boot_record()
+    mbr_entry(mbr, 0, 0x80, 0x07, 2048, 204800)
+    mbr_entry(mbr, 1, 0, 0x05, ext, 102400)
+    ebr1 = boot_record()
+    mbr_entry(ebr1, 0, 0, 0x83, 2048, 40960)
+    mbr_entry(ebr1, 1, 0, 0x05, 51200, 51200)
+    ebr2 = boot_record()
+    mbr_entry(ebr2, 0, 0, 0x82, 2048, 20480)
+    mbr_entry(mbr, 2, 0, 0x0C, 309311, 100000)   # starts 63 sectors past a MiB
+    with open(path, "wb") as f:
+        f.truncate(GPT_BYTES)
+        f.write(mbr)
+        f.seek(ext * SECTOR)
+        f.write(ebr1)
+        f.seek((ext + 51200) * SECTOR)
+        f.write(ebr2)
+    return path, ext
+
+
+def test_gpt_reads_at_sector_precision(ulli, gpt_image):
+    path, sectors = gpt_image
+    table = ulli.read_partition_table(str(path))
+    assert (table.label, table.sector, table.sectors) == ("gpt", SECTOR, sectors)
+    assert (table.first, table.last) == (34, sectors - 33)
+    assert [(p.num, p.start, p.end, p.type, p.name) for p in table.parts] == [
+        (i + 1, first, last + 1, ptype, name)
+        for i, (first, last, ptype, name) in enumerate(GPT_PARTS)]
+    assert table.parts[0].flags == ("boot", "esp")
+    assert table.free == [(34, 2048), (411648, 614400), (819200, sectors - 33)]
+
+
+def test_gpt_legacy_dicts(ulli, gpt_image):
+    path, sectors = gpt_image
+    parts, label, size_mib = ulli.legacy_partitions(ulli.read_partition_table(str(path)),
+                                                    {1: "vfat"})
+    assert (label, size_mib) == ("gpt", 512)
+    # 34..2048 holds no whole MiB; the tail loses the part under the backup array
+    assert [(p["num"], p["start_mib"], p["end_mib"], p["size_mib"]) for p in parts] == [
+        (1, 1, 101, 100), (2, 101, 201, 100), (0, 201, 300, 99), (3, 300, 400, 100),
+        (0, 400, 511, 111)]
+    assert parts[0]["fstype"] == "vfat" and parts[0]["flags"] == "boot, esp"
+
+
+def test_gpt_falls_back_to_backup_header(ulli, gpt_image):
+    path, sectors = gpt_image
+    corrupt(path, SECTOR + 40)                    # primary header
+    assert [p.num for p in ulli.read_partition_table(str(path)).parts] == [1, 2, 3]
+    corrupt(path, (sectors - 33) * SECTOR + 5)    # backup entry array
+    assert ulli.read_partition_table(str(path)) is None
+
+
+def test_mbr_follows_ebr_chain(ulli, mbr_image):
+    path, ext = mbr_image
+    table = ulli.read_partition_table(str(path))
+    assert table.label == "msdos"
+    assert [(p.num, p.start, p.end, p.type) for p in table.parts] == [
+        (1, 2048, 206848, "0x7"),
+        (2, ext, ext + 102400, "0x5"),
+        (5, ext + 2048, ext + 2048 + 40960, "0x83"),
+        (6, ext + 51200 + 2048, ext + 51200 + 2048 + 20480, "0x82"),
+        (3, 309311, 409311, "0xc")]
+    assert table.parts[0].flags == ("boot",)
+    # logicals sit inside the extended partition and leave no gaps of their own
+    assert table.free == [(1, 2048), (309248, 309311), (409311, table.sectors)]
+
+
+def test_free_gaps_round_inward_to_whole_mib(ulli, mbr_image):
+    path, _ = mbr_image
+    parts, _, size_mib = ulli.legacy_partitions(ulli.read_partition_table(str(path)))
+    free = [(p["start_mib"], p["end_mib"], p["size_mib"]) for p in parts if p["is_free"]]
+    # 409311 sectors is 199.8 MiB: the gap starts at the next whole MiB
+    assert free == [(200, size_mib, size_mib - 200)]
+    for p in parts:
+        assert p["start_mib"] <= p["end_mib"]
+
+
+def test_looping_ebr_chain_ends(ulli, mbr_image):
+    path, ext = mbr_image
+    ebr2 = boot_record()
+    mbr_entry(ebr2, 0, 0, 0x82, 2048, 20480)
+    mbr_entry(ebr2, 1, 0, 0x05, 0, 10)            # points back at the first EBR
+    with open(path, "r+b") as f:
+        f.seek((ext + 51200) * SECTOR)
+        f.write(ebr2)
+    assert [p.num for p in ulli.read_partition_table(str(path)).parts] == [1, 2, 5, 6, 3]
+
+
+def test_unlabelled_images_are_rejected(ulli, tmp_path):
+    fat = boot_record()
+    fat[446:462] = b"\x41" * 16                   # FAT boot code where entries would be
+    (tmp_path / "fat.img").write_bytes(bytes(fat) + bytes(1 << 20))
+    (tmp_path / "blank.img").write_bytes(bytes(1 << 20))
+    assert ulli.read_partition_table(str(tmp_path / "fat.img")) is None
+    assert ulli.read_partition_table(str(tmp_path / "blank.img")) is None
+    assert ulli.read_partition_table(str(tmp_path / "missing.img")) is None
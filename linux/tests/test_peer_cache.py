@@ -0,0 +1,76 @@
+"""LAN peer cache: one process shares its cache, another finds it over
+loopback and downloads from it."""
+
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SERVER = """
+import sys
+sys.path.insert(0, {tests!r})
+from conftest import load_script
+server = load_script().PeerCacheServer(http_port=0, udp_port={udp}).start()
+print(server.port, flush=True)
+sys.stdin.read()
+server.stop()
+"""
+
+
+def _free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def shared_iso(ulli, tmp_path, monkeypatch):
+    """A verified ISO in a cache served by a second process:
+    (sha256, data, udp port, http port)."""
+    monkeypatch.setenv("ULLI_CACHE_DIR", str(tmp_path / "server"))
+    monkeypatch.delenv("ULLI_PEERS", raising=False)
+    data = os.urandom(3 * 1024 * 1024 + 123)
+    sha = hashlib.sha256(data).hexdigest()
+    path = ulli.cache_iso_path(sha)
+    path.write_bytes(data)
+    ulli.record_verified(str(path), sha)
+    udp = _free_udp_port()
+    code = SERVER.format(tests=str(Path(__file__).parent), udp=udp)
+    proc = subprocess.Popen([sys.executable, "-c", code], stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, text=True)
+    try:
+        port = int(proc.stdout.readline())
+        monkeypatch.setenv("ULLI_CACHE_DIR", str(tmp_path / "client"))
+        yield sha, data, udp, port
+    finally:
+        proc.stdin.close()
+        proc.wait(timeout=10)
+
+
+def test_discover_and_download_from_peer(ulli, shared_iso, tmp_path):
+    sha, data, udp, port = shared_iso
+    urls = ulli.discover_peers(sha, timeout=2, port=udp)
+    assert f"http://127.0.0.1:{port}/sha256/{sha}" in urls
+
+    dest = tmp_path / "client.iso"
+    dl = ulli.SegmentedDownload(urls, str(dest), len(data), chunk_size=1 << 20)
+    assert dl.run()
+    assert dl.sha256 == sha
+    assert dest.read_bytes() == data
+
+
+def test_unknown_hash_is_not_offered(ulli, shared_iso):
+    _, _, udp, _ = shared_iso
+    assert ulli.discover_peers("0" * 64, timeout=0.5, port=udp) == []
+
+
+def test_no_broadcast_only_lists_configured_peers(ulli, shared_iso, monkeypatch):
+    sha, _, udp, port = shared_iso
+    assert ulli.discover_peers(sha, timeout=0.5, port=udp, broadcast=False) == []
+    monkeypatch.setenv("ULLI_PEERS", f"127.0.0.1:{port}")
+    assert ulli.discover_peers(sha, timeout=0.5, port=udp, broadcast=False) == [
+        f"http://127.0.0.1:{port}/sha256/{sha}"]
@@ -21,7 +21,9 @@ gi.require_version("Vte", "2.91")
 from gi.repository import Gtk, Gdk, GLib, Pango, Vte
 
 import os, sys, subprocess, threading, hashlib, shutil, json, time, signal, re
-import urllib.request, urllib.error
+import array, collections, copy, errno, fcntl, fnmatch, itertools, mmap, queue, socket, struct, uuid, zlib
+import urllib.request, urllib.error, http.server
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
@@ -30,6 +32,21 @@ from datetime import datetime
 MIN_BOOT_GB   = 7
 MIN_LINUX_GB  = 20
 GiB           = 1_073_741_824
+ISO_CACHE_QUOTA_GB = 12   # cached ISOs beyond this are evicted, least recently used first
+
+USER_AGENT          = "linux-installer/1.0"
+DOWNLOAD_CHUNK      = 8 << 20   # bytes per HTTP Range request
+DOWNLOAD_WORKERS    = 2         # parallel connections per mirror
+STATE_SYNC_SECS     = 2.0       # how often finished chunks are fsynced + recorded
+PROBE_BURST         = 1 << 20   # bytes fetched from each mirror to estimate throughput
+MIRROR_KEEP_RATIO   = 8         # skip mirrors this many times slower than the best
+SLOW_MIRROR_BPS     = 256 << 10 # a connection below this rate…
+SLOW_MIRROR_SECS    = 15        # …for this long makes us abandon its mirror
+PROGRESS_UPDATES_PER_SEC = 10   # cap on status/progress bar redraws
+DISK_PLAN_DEBOUNCE_MS = 120     # quiet time before the disk plan is redrawn
+HASH_CHUNK          = 4 << 20   # bytes per read when hashing a file
+HASH_BUFFERS        = 2         # read-ahead buffers (2 = double buffering)
+MANIFEST_CHUNK      = 4 << 20   # leaf size of the per-ISO chunk manifest
 
 DISTROS = {
     "mint": {
@@ -43,6 +60,11 @@ DISTROS = {
             "https://mirrors.seas.harvard.edu/linuxmint/stable/22.3/linuxmint-22.3-cinnamon-64bit.iso",
         ],
         "live_path": "casper/vmlinuz",
+        "loopback": {"kernel": "casper/vmlinuz", "initrd": "casper/initrd.lz",
+                     "args": "boot=casper iso-scan/filename={iso} quiet splash --"},
+        "payload": {"critical": ["EFI/*", "boot/grub/*", "casper/vmlinuz", "casper/initrd*",
+                                 "casper/filesystem.squashfs"],
+                    "optional": ["pool/*", "dists/*"]},
     },
     "ubuntu": {
         "label":    "Ubuntu 24.04.4 LTS – GNOME  (~5.9 GB)",
@@ -54,7 +76,13 @@ DISTROS = {
             "https://mirror.cs.uchicago.edu/ubuntu-releases/24.04.4/ubuntu-24.04.4-desktop-amd64.iso",
             "https://mirrors.mit.edu/ubuntu-releases/24.04.4/ubuntu-24.04.4-desktop-amd64.iso",
         ],
+        "zsync":    "https://releases.ubuntu.com/24.04.4/ubuntu-24.04.4-desktop-amd64.iso.zsync",
         "live_path": "casper/vmlinuz",
+        "loopback": {"kernel": "casper/vmlinuz", "initrd": "casper/initrd",
+                     "args": "boot=casper iso-scan/filename={iso} quiet splash ---"},
+        "payload": {"critical": ["EFI/*", "boot/grub/*", "casper/vmlinuz", "casper/initrd",
+                                 "casper/*.squashfs"],
+                    "optional": ["pool/*", "dists/*"]},
     },
     "kubuntu": {
         "label":    "Kubuntu 24.04.4 LTS – KDE Plasma  (~4.2 GB)",
@@ -65,7 +93,13 @@ DISTROS = {
             "https://cdimage.ubuntu.com/kubuntu/releases/24.04.4/release/kubuntu-24.04.4-desktop-amd64.iso",
             "https://ftpmirror.your.org/pub/ubuntu/cdimage/kubuntu/releases/24.04/release/kubuntu-24.04.4-desktop-amd64.iso",
         ],
+        "zsync":    "https://cdimage.ubuntu.com/kubuntu/releases/24.04.4/release/kubuntu-24.04.4-desktop-amd64.iso.zsync",
         "live_path": "casper/vmlinuz",
+        "loopback": {"kernel": "casper/vmlinuz", "initrd": "casper/initrd",
+                     "args": "boot=casper iso-scan/filename={iso} quiet splash ---"},
+        "payload": {"critical": ["EFI/*", "boot/grub/*", "casper/vmlinuz", "casper/initrd",
+                                 "casper/*.squashfs"],
+                    "optional": ["pool/*", "dists/*"]},
     },
     "debian": {
         "label":    "Debian Live 13.3.0 – KDE  (~3.2 GB)",
@@ -77,6 +111,11 @@ DISTROS = {
             "https://mirrors.kernel.org/debian-cd/current-live/amd64/iso-hybrid/debian-live-13.3.0-amd64-kde.iso",
         ],
         "live_path": "live/vmlinuz",
+        "loopback": {"kernel": "live/vmlinuz", "initrd": "live/initrd.img",
+                     "args": "boot=live components findiso={iso} quiet splash"},
+        "payload": {"critical": ["EFI/*", "boot/grub/*", "live/vmlinuz*", "live/initrd*",
+                                 "live/filesystem.squashfs"],
+                    "optional": ["pool/*", "pool-udeb/*", "dists/*", "install/*", "firmware/*"]},
     },
     "fedora": {
         "label":    "Fedora 43 – KDE Plasma Desktop  (~3.0 GB)",
@@ -88,6 +127,12 @@ DISTROS = {
             "https://mirror.web-ster.com/fedora/releases/43/KDE/x86_64/iso/Fedora-KDE-Desktop-Live-43-1.6.x86_64.iso",
         ],
         "live_path": "LiveOS/squashfs.img",
+        "loopback": {"kernel": "images/pxeboot/vmlinuz", "initrd": "images/pxeboot/initrd.img",
+                     "args": "root=live:CDLABEL={label} iso-scan/filename={iso} "
+                             "rd.live.image quiet rhgb"},
+        "payload": {"critical": ["EFI/*", "boot/grub2/*", "images/pxeboot/*",
+                                 "LiveOS/squashfs.img"],
+                    "optional": []},
         "hybrid": True,
     },
 }
@@ -103,103 +148,2797 @@ def run(cmd, **kw):
     err = r.stderr.strip() if r.stderr else ""
     return r.returncode, out, err
 
-def get_root_fs_info():
-    """Return dict with device, fstype, mountpoint for /."""
-    code, out, _ = run(["findmnt", "-n", "-o", "SOURCE,FSTYPE,TARGET", "/"])
-    if code != 0:
-        return None
-    parts = out.split()
-    if len(parts) < 3:
-        return None
-    device = parts[0]
-    # Strip btrfs subvolume suffix like [/@] or [/@home]
-    if "[" in device:
-        device = device.split("[")[0]
-    return {"device": device, "fstype": parts[1], "mountpoint": parts[2]}
-
-def get_partition_info(device):
-    """Return size_bytes, free_bytes for the filesystem on device."""
-    # Strip btrfs subvolume suffix like [/@] from device path
-    clean_dev = device.split("[")[0] if "[" in device else device
-    code, out, _ = run(["df", "--block-size=1", "--output=size,avail", clean_dev])
-    if code != 0:
-        # Fallback: try using the mountpoint instead
-        code, out, _ = run(["df", "--block-size=1", "--output=size,avail", "/"])
-        if code != 0:
-            return None, None
-    # Keep only lines that look like numbers (skip header)
-    lines = []
-    for l in out.strip().splitlines():
-        parts = l.split()
-        if parts and parts[0].isdigit():
-            lines.append(l)
-    if not lines:
-        return None, None
-    vals = lines[-1].split()
-    return int(vals[0]), int(vals[1])
-
 def bytes_to_gb(b):
     return round(b / 1e9, 2)
 
-def sha256_file(path, progress_cb=None):
-    h = hashlib.sha256()
+def sha256_file(path, progress_cb=None, chunk_size=HASH_CHUNK, buffers=HASH_BUFFERS,
+                leaves=None):
+    """SHA-256 of a file.  A reader thread fills preallocated buffers with
+    readinto while this thread hashes the previous one; hashlib drops the GIL
+    for large updates, so reading and hashing overlap.  If a list is passed as
+    leaves, the manifest chunk hashes are appended to it."""
+    h = hashlib.sha256() if leaves is None else ChunkHasher()
     size = os.path.getsize(path)
+    free, full = queue.Queue(), queue.Queue()
+    for _ in range(buffers):
+        free.put(bytearray(chunk_size))
+    err = []
+
+    def reader():
+        try:
+            with open(path, "rb", buffering=0) as f:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                while True:
+                    buf = free.get()
+                    if buf is None:
+                        return
+                    n = f.readinto(buf)
+                    full.put((buf, n))
+                    if not n:
+                        return
+        except OSError as e:
+            err.append(e)
+            full.put((None, 0))
+
+    t = threading.Thread(target=reader, daemon=True)
+    t.start()
     done = 0
-    with open(path, "rb") as f:
+    try:
         while True:
-            chunk = f.read(1 << 20)
-            if not chunk:
+            buf, n = full.get()
+            if not n:
                 break
-            h.update(chunk)
-            done += len(chunk)
+            h.update(memoryview(buf)[:n])
+            done += n
+            free.put(buf)
             if progress_cb:
                 progress_cb(done / size)
+    finally:
+        free.put(None)
+        t.join()
+    if err:
+        raise err[0]
+    if leaves is not None:
+        leaves.extend(h.leaves())
     return h.hexdigest()
 
+
+def bench_sha256(path, chunk_sizes=(1 << 20, 4 << 20, 16 << 20), out=print):
+    """Print hashing throughput for path: the plain read-then-hash loop
+    against sha256_file at several chunk sizes.  The file is dropped from the
+    page cache before each run so the disk is measured, not RAM."""
+    size = os.path.getsize(path)
+
+    def serial():
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(1 << 20)
+                if not chunk:
+                    break
+                h.update(chunk)
+        return h.hexdigest()
+
+    runs = [("read + hash, 1 MiB", serial)]
+    runs += [(f"sha256_file, {c >> 20} MiB × {HASH_BUFFERS}",
+              lambda c=c: sha256_file(path, chunk_size=c)) for c in chunk_sizes]
+    out(f"{path}: {round(size / 1e6, 1)} MB")
+    base = None
+    for name, fn in runs:
+        with open(path, "rb") as f:
+            os.fsync(f.fileno())
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        t0 = time.monotonic()
+        fn()
+        rate = size / max(time.monotonic() - t0, 1e-6) / 1e6
+        base = base or rate
+        out(f"  {name:<28} {rate:8.1f} MB/s  ({rate / base:.2f}×)")
+
+FS_IOC_GETVERSION     = 0x80087601   # _IOR('v', 1, long): inode generation
+FS_IOC_MEASURE_VERITY = 0xc0046686   # _IOWR('f', 134, struct fsverity_digest)
+
+def file_fingerprint(path):
+    """Return a dict identifying the current contents of path without reading it.
+
+    ctime changes on every write and cannot be set back from userspace (unlike
+    mtime), the inode generation catches a recycled inode number, and if the
+    file has fs-verity enabled its Merkle root digest is included as well.
+    """
+    st = os.stat(path)
+    fp = {"dev": st.st_dev, "ino": st.st_ino, "size": st.st_size,
+          "mtime_ns": st.st_mtime_ns, "ctime_ns": st.st_ctime_ns}
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        try:
+            gen = fcntl.ioctl(fd, FS_IOC_GETVERSION, struct.pack("l", 0))
+            fp["generation"] = struct.unpack("l", gen)[0]
+        except OSError:
+            pass
+        try:
+            buf = fcntl.ioctl(fd, FS_IOC_MEASURE_VERITY, struct.pack("HH", 0, 64) + bytes(64))
+            alg, size = struct.unpack_from("HH", buf)
+            fp["verity"] = f"{alg}:{buf[4:4 + size].hex()}"
+        except OSError:
+            pass
+    finally:
+        os.close(fd)
+    return fp
+
+def _verified_sidecar(path):
+    return f"{path}.verified.json"
+
+def record_verified(path, sha256):
+    """Remember that path hashed to sha256 in its current state."""
+    with open(_verified_sidecar(path), "w") as f:
+        json.dump({"sha256": sha256, "fingerprint": file_fingerprint(path)}, f)
+
+def is_known_verified(path, sha256):
+    """True if path was verified as sha256 and has not changed since."""
+    try:
+        with open(_verified_sidecar(path)) as f:
+            rec = json.load(f)
+        return rec["sha256"] == sha256 and rec["fingerprint"] == file_fingerprint(path)
+    except (OSError, ValueError, KeyError):
+        return False
+
+# Per-chunk manifest: <iso>.manifest.json holds the SHA-256 of every
+# MANIFEST_CHUNK slice of a verified ISO plus their Merkle root.  Chunks can be
+# checked on all cores at once, and a corrupt one can be re-fetched on its own.
+
+class ChunkHasher:
+    """SHA-256 of a byte stream, plus the SHA-256 of each chunk_size slice of
+    it (the manifest leaves)."""
+
+    def __init__(self, chunk_size=MANIFEST_CHUNK):
+        self.chunk_size = chunk_size
+        self._whole = hashlib.sha256()
+        self._leaf = hashlib.sha256()
+        self._leaf_len = 0
+        self._leaves = []
+
+    def update(self, data):
+        self._whole.update(data)
+        view = memoryview(data)
+        while view:
+            n = min(len(view), self.chunk_size - self._leaf_len)
+            self._leaf.update(view[:n])
+            self._leaf_len += n
+            view = view[n:]
+            if self._leaf_len == self.chunk_size:
+                self._leaves.append(self._leaf.hexdigest())
+                self._leaf = hashlib.sha256()
+                self._leaf_len = 0
+
+    def hexdigest(self):
+        return self._whole.hexdigest()
+
+    def leaves(self):
+        return self._leaves + ([self._leaf.hexdigest()] if self._leaf_len else [])
+
+
+def merkle_root(leaves):
+    level = [bytes.fromhex(x) for x in leaves] or [hashlib.sha256().digest()]
+    while len(level) > 1:
+        level = [hashlib.sha256(b"".join(level[i:i + 2])).digest()
+                 for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+def _manifest_path(path):
+    return f"{path}.manifest.json"
+
+def write_manifest(path, sha256, leaves, chunk_size=MANIFEST_CHUNK):
+    """Store the chunk hashes of path, which has just been verified as sha256."""
+    man = {"sha256": sha256, "size": os.path.getsize(path), "chunk_size": chunk_size,
+           "root": merkle_root(leaves), "leaves": leaves}
+    with open(f"{_manifest_path(path)}.tmp", "w") as f:
+        json.dump(man, f)
+    os.replace(f"{_manifest_path(path)}.tmp", _manifest_path(path))
+
+def load_manifest(path, sha256):
+    """Return the manifest of path if there is a consistent one for sha256."""
+    try:
+        with open(_manifest_path(path)) as f:
+            man = json.load(f)
+        cs, leaves = man["chunk_size"], man["leaves"]
+        if (man["sha256"] != sha256 or cs <= 0
+                or len(leaves) != (man["size"] + cs - 1) // cs
+                or merkle_root(leaves) != man["root"]):
+            return None
+        return man
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def check_chunks(path, man, indices=None, progress_cb=None, workers=None):
+    """Hash the given chunks of path (default: all) against the manifest on
+    every core.  Returns the sorted indices of chunks that do not match."""
+    cs, size = man["chunk_size"], man["size"]
+    indices = range(len(man["leaves"])) if indices is None else indices
+    done = [0]
+    lock = threading.Lock()
+    fd = os.open(path, os.O_RDONLY)
+
+    def check(i):
+        want = min(cs, size - i * cs)
+        data = os.pread(fd, want, i * cs)
+        ok = len(data) == want and hashlib.sha256(data).hexdigest() == man["leaves"][i]
+        with lock:
+            done[0] += 1
+            if progress_cb:
+                progress_cb(done[0] / len(indices))
+        return ok
+
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            results = list(pool.map(check, indices))
+    finally:
+        os.close(fd)
+    return sorted(i for i, ok in zip(indices, results) if not ok)
+
 def iso_cache_dir():
-    d = Path.home() / ".cache" / "linux-installer"
+    d = Path(os.environ.get("ULLI_CACHE_DIR") or Path.home() / ".cache" / "linux-installer")
     d.mkdir(parents=True, exist_ok=True)
     return d
 
-# ─── disk enumeration helpers ────────────────────────────────────────────────
+# ─── mount table ─────────────────────────────────────────────────────────────
+#
+# Mount lookups read /proc/self/mountinfo directly and size filesystems with
+# os.statvfs instead of running findmnt and df.  btrfs mounts carry an
+# anonymous device number, so a mount is matched to its block device through
+# /sys/dev/block when the number is real and through the source path
+# otherwise.
+
+MOUNTINFO = "/proc/self/mountinfo"
+SYS_DEV_BLOCK = "/sys/dev/block"
+
+
+def _mountinfo_unescape(s):
+    """Undo the octal escapes (\\040 for space …) used in mountinfo."""
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), s)
+
+
+def block_device_path(majmin):
+    """/dev path of the block device numbered "maj:min", or None."""
+    try:
+        name = os.path.basename(os.readlink(os.path.join(SYS_DEV_BLOCK, majmin)))
+    except OSError:
+        return None
+    return f"/dev/{name}"
+
+
+def strip_subvol(device):
+    """/dev/sda2[/@] -> /dev/sda2 (findmnt's btrfs subvolume notation)."""
+    return device.split("[")[0] if "[" in device else device
+
+
+def read_mountinfo(path=MOUNTINFO):
+    """List of mounts in mount order: dicts with dev ("maj:min"), root (the
+    subvolume or bind-mounted directory), target, fstype, source and device
+    (the block device's /dev path, or None for virtual filesystems)."""
+    mounts = []
+    try:
+        with open(path, encoding="utf-8", errors="surrogateescape") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return mounts
+    for line in lines:
+        left, sep, right = line.partition(" - ")
+        cols, rcols = left.split(), right.split()
+        if not sep or len(cols) < 5 or len(rcols) < 2:
+            continue
+        source = _mountinfo_unescape(rcols[1])
+        device = None
+        if source.startswith("/dev/") and os.path.exists(source):
+            device = os.path.realpath(source)
+        elif not cols[2].startswith("0:"):
+            device = block_device_path(cols[2])    # e.g. /dev/root
+        mounts.append({
+            "dev": cols[2],
+            "root": _mountinfo_unescape(cols[3]),
+            "target": _mountinfo_unescape(cols[4]),
+            "fstype": rcols[0],
+            "source": source,
+            "device": device,
+        })
+    return mounts
+
+
+def device_mounts(dev_path, mounts=None):
+    """Mounts of dev_path, its top-level mount first: for btrfs that is the
+    one whose root is the filesystem root, then the shortest target."""
+    want = os.path.realpath(strip_subvol(dev_path))
+    found = [m for m in (read_mountinfo() if mounts is None else mounts)
+             if m["device"] == want]
+    return sorted(found, key=lambda m: (m["root"] != "/", len(m["target"])))
+
+
+def mount_target(dev_path, mounts=None):
+    """Where dev_path is mounted, or None."""
+    found = device_mounts(dev_path, mounts)
+    return found[0]["target"] if found else None
+
+
+def fs_usage(path):
+    """(total_bytes, free_bytes) of the filesystem holding path, where free
+    is what an unprivileged user can allocate (as df reports), or
+    (None, None)."""
+    try:
+        st = os.statvfs(path)
+    except OSError:
+        return None, None
+    return st.f_blocks * st.f_frsize, st.f_bavail * st.f_frsize
+
+
+def get_root_fs_info():
+    """Return dict with device, fstype, mountpoint for /."""
+    roots = [m for m in read_mountinfo() if m["target"] == "/"]
+    if not roots:
+        return None
+    m = roots[-1]                                   # the one not mounted over
+    # keep the name it was mounted by (/dev/mapper/…) unless it does not
+    # exist, as with /dev/root
+    device = m["source"] if m["device"] and os.path.realpath(m["source"]) == m["device"] \
+        else (m["device"] or m["source"])
+    return {"device": device, "fstype": m["fstype"], "mountpoint": "/"}
+
+def get_partition_info(device):
+    """Return size_bytes, free_bytes for the filesystem on device."""
+    return fs_usage(mount_target(device) or "/")
+
+# ─── ISO cache ───────────────────────────────────────────────────────────────
+#
+# Downloaded ISOs live under iso_cache_dir()/iso/<sha256>.iso.  index.json
+# records, per SHA-256: the original filename, distro key, size, when the
+# file was last used and when it was last verified.  The cache is kept under
+# ISO_CACHE_QUOTA_GB by evicting the least recently used ISOs.
+
+_CACHE_LOCK = threading.RLock()
+
+
+def cache_iso_path(sha256):
+    d = iso_cache_dir() / "iso"
+    d.mkdir(exist_ok=True)
+    return d / f"{sha256}.iso"
+
+
+def _cache_index_path():
+    return iso_cache_dir() / "index.json"
+
+
+def load_cache_index():
+    """Return {sha256: entry} for every cached ISO that still exists on disk."""
+    with _CACHE_LOCK:
+        try:
+            with open(_cache_index_path()) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        return {sha: e for sha, e in index.items() if cache_iso_path(sha).exists()}
+
+
+def save_cache_index(index):
+    with _CACHE_LOCK:
+        path = _cache_index_path()
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(f"{path}.tmp", path)
+
+
+def cache_touch(sha256, **fields):
+    """Mark a cached ISO as just used, updating any extra index fields given."""
+    with _CACHE_LOCK:
+        index = load_cache_index()
+        entry = index.setdefault(sha256, {"verified": 0})
+        entry.update(fields)
+        entry["size"] = cache_iso_path(sha256).stat().st_size
+        entry["last_used"] = int(time.time())
+        save_cache_index(index)
+
+
+def _cache_unlink(sha256):
+    """Remove a cached ISO together with its sidecar and partial files."""
+    for f in cache_iso_path(sha256).parent.glob(f"{sha256}.iso*"):
+        f.unlink()
+
+
+def cache_forget(sha256):
+    """Delete a cached ISO and its index entry."""
+    with _CACHE_LOCK:
+        index = load_cache_index()
+        index.pop(sha256, None)
+        _cache_unlink(sha256)
+        save_cache_index(index)
+
+
+def cache_evict(reserve_bytes=0, keep=(), quota_bytes=None):
+    """Evict least recently used ISOs (and stray partial downloads) until the
+    cache plus reserve_bytes fits in the quota.  Returns the evicted entries."""
+    quota = ISO_CACHE_QUOTA_GB * GiB if quota_bytes is None else quota_bytes
+    with _CACHE_LOCK:
+        index = load_cache_index()
+        keep_names = {f"{sha}.iso" for sha in keep}
+        for part in (iso_cache_dir() / "iso").glob("*.iso.part*"):
+            if part.name.split(".part")[0] not in keep_names:
+                part.unlink()
+        used = sum(e.get("size", 0) for e in index.values())
+        evicted = []
+        for sha, entry in sorted(index.items(), key=lambda kv: kv[1].get("last_used", 0)):
+            if used + reserve_bytes <= quota:
+                break
+            if sha in keep:
+                continue
+            _cache_unlink(sha)
+            used -= entry.get("size", 0)
+            evicted.append(dict(entry, sha256=sha))
+            del index[sha]
+        save_cache_index(index)
+        return evicted
+
+
+def cache_adopt_legacy(distro):
+    """Move an ISO cached under its plain filename by older versions into the
+    content-addressed layout.  It is recorded as unverified."""
+    legacy = iso_cache_dir() / distro["filename"]
+    target = cache_iso_path(distro["sha256"])
+    if legacy.exists() and not target.exists():
+        os.replace(legacy, target)
+        cache_touch(distro["sha256"], name=distro["filename"], verified=0)
+
+# ─── segmented download ──────────────────────────────────────────────────────
+
+def _http_get(url, start=None, end=None, timeout=30):
+    """Open url for reading, optionally only the inclusive byte range start–end."""
+    headers = {"User-Agent": USER_AGENT}
+    if start is not None:
+        headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+    req = urllib.request.Request(url, headers=headers)
+    return urllib.request.urlopen(req, timeout=timeout)
+
+
+def _host(url):
+    return url.split("/")[2]
+
+
+def probe_mirror(url, burst=PROBE_BURST, timeout=15):
+    """Measure a mirror with two small Range requests.
+
+    Returns {"size", "latency", "bps"} – the total file size, seconds until the
+    first response and bytes/s over a burst-sized read from mid-file – or None
+    if the mirror is unreachable or doesn't honour Range requests.
+    """
+    try:
+        t0 = time.monotonic()
+        with _http_get(url, 0, 0, timeout=timeout) as resp:
+            latency = time.monotonic() - t0
+            if resp.status != 206:
+                return None
+            m = re.match(r"bytes\s+0-0/(\d+)", resp.headers.get("Content-Range", ""))
+            if not m:
+                return None
+            size = int(m.group(1))
+        start = max(0, size // 2 - burst // 2)
+        got = 0
+        t0 = time.monotonic()
+        with _http_get(url, start, min(size, start + burst) - 1, timeout=timeout) as resp:
+            if resp.status != 206:
+                return None
+            while True:
+                buf = resp.read(1 << 16)
+                if not buf:
+                    break
+                got += len(buf)
+        bps = got / max(time.monotonic() - t0, 1e-3)
+        return {"size": size, "latency": latency, "bps": bps}
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
+
+def _mirror_scores_path():
+    return iso_cache_dir() / "mirror_scores.json"
+
+
+def load_mirror_scores(path=None):
+    """Return {host: {"bps", "latency", "updated"}} remembered from earlier runs."""
+    try:
+        with open(path or _mirror_scores_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_mirror_scores(scores, path=None):
+    path = str(path or _mirror_scores_path())
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(scores, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def update_mirror_score(scores, url, bps, latency=None, weight=0.5):
+    """Blend a new measurement into the mirror's running average."""
+    s = scores.setdefault(_host(url), {})
+    s["bps"] = bps if "bps" not in s else (1 - weight) * s["bps"] + weight * bps
+    if latency is not None:
+        s["latency"] = (latency if "latency" not in s
+                        else (1 - weight) * s["latency"] + weight * latency)
+    s["updated"] = int(time.time())
+
+
+def rank_mirrors(urls, scores):
+    """Order urls best first: highest throughput score, then lowest latency."""
+    def key(url):
+        s = scores.get(_host(url), {})
+        return (-s.get("bps", 0), s.get("latency", float("inf")))
+    return sorted(urls, key=key)
+
+
+class _SlowMirror(Exception):
+    pass
+
+
+class _OrderedHasher:
+    """SHA-256 over chunks of one file that may finish out of order.
+
+    Workers hand each finished chunk to submit(); a background thread hashes
+    them strictly in file order.  A chunk's download buffer is kept for the
+    hasher while the backlog stays under max_pending bytes; past that, or for
+    chunks already on disk from an earlier run, the hasher re-reads the chunk
+    from path, which normally still hits the page cache.
+    """
+
+    def __init__(self, path, size, chunk_size, max_pending=64 << 20):
+        self.path = path
+        self.size = size
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+        self.nchunks = (size + chunk_size - 1) // chunk_size
+        self._h = ChunkHasher()
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._pending_bytes = 0
+        self._next = 0
+        self._aborted = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, idx, data=None):
+        """Queue chunk idx for hashing; data=None means read it back from disk."""
+        with self._cond:
+            if (data is not None and idx != self._next
+                    and self._pending_bytes + len(data) > self.max_pending):
+                data = None
+            self._pending[idx] = data
+            self._pending_bytes += len(data) if data is not None else 0
+            self._cond.notify_all()
+
+    def _read_chunk(self, fd, idx):
+        start = idx * self.chunk_size
+        want = min(self.chunk_size, self.size - start)
+        parts = []
+        while want:
+            buf = os.pread(fd, want, start)
+            if not buf:
+                raise OSError(f"short read at offset {start} of {self.path}")
+            parts.append(buf)
+            start += len(buf)
+            want -= len(buf)
+        return b"".join(parts)
+
+    def _run(self):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            while True:
+                with self._cond:
+                    while self._next not in self._pending and not self._aborted:
+                        if self._next >= self.nchunks:
+                            return
+                        self._cond.wait()
+                    if self._aborted:
+                        return
+                    data = self._pending.pop(self._next)
+                    self._pending_bytes -= len(data) if data is not None else 0
+                if data is None:
+                    data = self._read_chunk(fd, self._next)
+                self._h.update(data)
+                with self._cond:
+                    self._next += 1
+                    self._cond.notify_all()
+        except OSError as e:
+            self._error = e
+        finally:
+            os.close(fd)
+
+    def finish(self):
+        """Wait for the last chunk and return the hex digest."""
+        self._thread.join()
+        if self._error:
+            raise self._error
+        return self._h.hexdigest()
+
+    def leaves(self):
+        return self._h.leaves()
+
+    def abort(self):
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+        self._thread.join()
+
+
+class SegmentedDownload:
+    """Fetch one file as fixed-size Range chunks from several mirrors at once.
+
+    Each mirror gets workers_per_mirror connections.  A connection takes the
+    next missing chunk from a shared queue and writes it at its offset in
+    dest, so faster mirrors simply end up serving more chunks.  A chunk that
+    fails goes back on the queue for another connection; a mirror that fails
+    MAX_MIRROR_ERRORS chunks in a row is dropped.  progress_cb(done_bytes,
+    total_bytes) is called from the worker threads.
+
+    A connection that stays below slow_bps for slow_secs abandons its chunk and
+    retires its mirror, as long as another mirror is still serving; retired
+    mirrors come back if every other one is dropped.  Per-mirror
+    (bytes, connection-seconds) totals are kept in .stats for scoring.
+
+    With state_path set the download is resumable: finished chunks are
+    fsynced and listed in a small JSON file every STATE_SYNC_SECS, and a new
+    SegmentedDownload for the same dest/size/key only fetches what is missing.
+
+    The SHA-256 of the whole file is computed while the chunks arrive and is
+    available as .sha256 after a successful run(), with the manifest chunk
+    hashes in .leaves.
+    """
+
+    MAX_MIRROR_ERRORS = 3
+
+    def __init__(self, urls, dest, size, chunk_size=DOWNLOAD_CHUNK,
+                 workers_per_mirror=DOWNLOAD_WORKERS, progress_cb=None, log=None,
+                 state_path=None, key="", slow_bps=SLOW_MIRROR_BPS,
+                 slow_secs=SLOW_MIRROR_SECS):
+        self.urls = list(urls)
+        self.dest = dest
+        self.size = size
+        self.chunk_size = chunk_size
+        self.workers_per_mirror = workers_per_mirror
+        self.progress_cb = progress_cb
+        self.log = log or (lambda msg, error=False: None)
+        self.errors = {u: 0 for u in self.urls}
+        self.retired = set()
+        self.stats = {u: [0, 0.0] for u in self.urls}
+        self.slow_bps = slow_bps
+        self.slow_secs = slow_secs
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._fd = None
+        self.state_path = state_path
+        self.key = key
+        self._unsynced = set()     # chunks written but not yet fsynced
+        self._last_sync = time.monotonic()
+        nchunks = (size + chunk_size - 1) // chunk_size
+        # chunks fsynced and recorded in state_path
+        self._durable = self._load_state() & set(range(nchunks))
+        self._todo = collections.deque(i for i in range(nchunks) if i not in self._durable)
+        self.done_bytes = self.resumed_bytes = sum(
+            self._chunk_range(i)[1] + 1 - self._chunk_range(i)[0] for i in self._durable)
+        self.sha256 = None
+        self.leaves = None
+        self._hasher = None
+
+    def _load_state(self):
+        """Return the set of durable chunks from a previous run, or an empty set."""
+        if not self.state_path or not os.path.exists(self.dest):
+            return set()
+        try:
+            with open(self.state_path) as f:
+                st = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        if (st.get("size") != self.size or st.get("chunk_size") != self.chunk_size
+                or st.get("key") != self.key or os.path.getsize(self.dest) != self.size):
+            return set()
+        return set(st.get("done", []))
+
+    def _save_state(self):
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"size": self.size, "chunk_size": self.chunk_size,
+                       "key": self.key, "done": sorted(self._durable)}, f)
+        os.replace(tmp, self.state_path)
+
+    def _sync(self, force=False):
+        """fsync the data written so far and record those chunks as durable."""
+        if not self.state_path:
+            return
+        with self._cond:
+            if not self._unsynced or (not force and
+                    time.monotonic() - self._last_sync < STATE_SYNC_SECS):
+                return
+            batch, self._unsynced = self._unsynced, set()
+            self._last_sync = time.monotonic()
+        os.fsync(self._fd)
+        with self._cond:
+            self._durable |= batch
+            self._save_state()
+
+    def run(self):
+        """Download every missing chunk.  Returns True once the whole file is written."""
+        self._fd = os.open(self.dest, os.O_WRONLY | os.O_CREAT, 0o644)
+        self._hasher = _OrderedHasher(self.dest, self.size, self.chunk_size)
+        complete = False
+        try:
+            os.ftruncate(self._fd, self.size)
+            self._hasher.start()
+            for idx in sorted(self._durable):
+                self._hasher.submit(idx)
+            threads = [threading.Thread(target=self._worker, args=(url,), daemon=True)
+                       for url in self.urls for _ in range(self.workers_per_mirror)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self._sync(force=True)
+            complete = not self._todo and self._inflight == 0
+            if complete:
+                self.sha256 = self._hasher.finish()
+                self.leaves = self._hasher.leaves()
+        finally:
+            if not complete:
+                self._hasher.abort()
+            os.close(self._fd)
+            self._fd = None
+        return complete
+
+    def _chunk_range(self, idx):
+        start = idx * self.chunk_size
+        return start, min(start + self.chunk_size, self.size) - 1
+
+    def _next_chunk(self, url):
+        """Block until a chunk is available for url; None when there is nothing
+        left.  A retired mirror waits while another one is serving, and is
+        taken back – with every other retired one – once none is."""
+        with self._cond:
+            while True:
+                if self.errors[url] >= self.MAX_MIRROR_ERRORS:
+                    return None
+                if url in self.retired:
+                    if not self._todo and self._inflight == 0:
+                        return None
+                    if self._alive(url):
+                        self._cond.wait()
+                        continue
+                    self.retired.clear()
+                if self._todo:
+                    self._inflight += 1
+                    return self._todo.popleft()
+                if self._inflight == 0:
+                    return None
+                self._cond.wait()
+
+    def _finish_chunk(self, idx, ok):
+        with self._cond:
+            self._inflight -= 1
+            if ok:
+                self._unsynced.add(idx)
+            else:
+                self._todo.appendleft(idx)
+            self._cond.notify_all()
+        if ok:
+            self._sync()
+
+    def _alive(self, url):
+        return any(u != url and u not in self.retired
+                   and self.errors[u] < self.MAX_MIRROR_ERRORS for u in self.urls)
+
+    def _others_alive(self, url):
+        with self._cond:
+            return self._alive(url)
+
+    def _add_progress(self, n):
+        with self._cond:
+            self.done_bytes += n
+            done = self.done_bytes
+        if self.progress_cb:
+            self.progress_cb(done, self.size)
+
+    def _worker(self, url):
+        host = _host(url)
+        while True:
+            idx = self._next_chunk(url)
+            if idx is None:
+                return
+            start, end = self._chunk_range(idx)
+            buf = bytearray(end + 1 - start)
+            view = memoryview(buf)
+            got = 0
+            t0 = win_start = time.monotonic()
+            win_bytes = 0
+            try:
+                with _http_get(url, start, end) as resp:
+                    if resp.status != 206:
+                        raise ValueError("server ignored the Range request")
+                    while got < len(buf):
+                        n = resp.readinto(view[got:got + (1 << 17)])
+                        if not n:
+                            raise ValueError("connection closed mid-chunk")
+                        if os.pwrite(self._fd, view[got:got + n], start + got) != n:
+                            raise OSError(f"short write to {self.dest}")
+                        got += n
+                        self._add_progress(n)
+                        win_bytes += n
+                        now = time.monotonic()
+                        if now - win_start >= self.slow_secs:
+                            rate = win_bytes / (now - win_start)
+                            if rate < self.slow_bps and self._others_alive(url):
+                                raise _SlowMirror(f"{rate / 1024:.0f} KB/s for "
+                                                  f"{now - win_start:.0f} s")
+                            win_start, win_bytes = now, 0
+            except _SlowMirror as e:
+                self._add_progress(-got)
+                with self._cond:
+                    self.retired.add(url)
+                    self.stats[url][0] += got
+                    self.stats[url][1] += time.monotonic() - t0
+                self.log(f"{host} is too slow ({e}) – switching to the other mirrors")
+                self._finish_chunk(idx, False)
+                continue
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                self._add_progress(-got)
+                with self._cond:
+                    self.errors[url] += 1
+                    dropped = self.errors[url] >= self.MAX_MIRROR_ERRORS
+                self.log(f"{host}: chunk {idx} failed: {e}"
+                         + ("  – dropping mirror" if dropped else ""), error=True)
+                self._finish_chunk(idx, False)
+                continue
+            with self._cond:
+                self.errors[url] = 0
+                self.stats[url][0] += got
+                self.stats[url][1] += time.monotonic() - t0
+            self._finish_chunk(idx, True)
+            self._hasher.submit(idx, buf)
+
+# ─── zsync delta ─────────────────────────────────────────────────────────────
+#
+# A .zsync control file lists, for each Blocksize block of the new ISO, a weak
+# rolling checksum and a truncated MD4.  Blocks that an older cached ISO of the
+# same distro already contains are copied from it; only the rest is fetched
+# with Range requests.  ISO9660 places every file on a 2048-byte sector, so the
+# old ISO is compared at sector offsets instead of rolling over every byte –
+# relocated files are still found, at a fraction of the cost.
+
+ZSYNC_MAX_FETCH = 0.6   # fall back to a full download above this fraction of new data
+
+
+def md4_func():
+    """Return a function computing the MD4 digest of a bytes-like object, or
+    None.  OpenSSL 3 hides MD4 from hashlib, but libcrypto still exports it."""
+    try:
+        hashlib.new("md4")
+        return lambda data: hashlib.new("md4", data).digest()
+    except ValueError:
+        pass
+    import ctypes, ctypes.util
+    try:
+        fn = ctypes.CDLL(ctypes.util.find_library("crypto") or "libcrypto.so.3").MD4
+    except (OSError, AttributeError):
+        return None
+    fn.restype = ctypes.c_void_p
+    fn.argtypes = [ctypes.c_char_p, ctypes.c_size_t, ctypes.c_char_p]
+
+    def md4(data):
+        out = ctypes.create_string_buffer(16)
+        fn(bytes(data), len(data), out)
+        return out.raw
+    return md4
+
+
+def parse_zsync(data):
+    """Parse a .zsync control file.
+
+    Returns {"blocksize", "length", "seq_matches", "md4_bytes", "sums"} where
+    sums[i] is the truncated MD4 of block i (the final block zero-padded)."""
+    head, sep, body = data.partition(b"\n\n")
+    if not sep:
+        raise ValueError("not a zsync file")
+    hdr = {}
+    for line in head.decode("utf-8", "replace").splitlines():
+        key, _, val = line.partition(":")
+        hdr[key.strip()] = val.strip()
+    if "Z-Map2" in hdr:
+        raise ValueError("compressed zsync targets are not supported")
+    bs, length = int(hdr["Blocksize"]), int(hdr["Length"])
+    seq, rsum_bytes, md4_bytes = (int(x) for x in hdr["Hash-Lengths"].split(","))
+    n = (length + bs - 1) // bs
+    rec = rsum_bytes + md4_bytes
+    if len(body) < n * rec:
+        raise ValueError("truncated block list")
+    sums = [body[i * rec + rsum_bytes:(i + 1) * rec] for i in range(n)]
+    return {"blocksize": bs, "length": length, "seq_matches": seq,
+            "md4_bytes": md4_bytes, "sums": sums}
+
+
+def zsync_match(zs, old_path, md4, progress_cb=None, step=2048):
+    """Look for the blocks of the new file in old_path, checking every step
+    bytes.  Like zsync, a block only counts when the block after it matches
+    too (if the control file asks for seq_matches > 1), or when it directly
+    continues a run of blocks that already matched.
+
+    Returns {block index: offset of an identical block in old_path}."""
+    bs, sums, cut = zs["blocksize"], zs["sums"], zs["md4_bytes"]
+    n = len(sums)
+    seq = zs["seq_matches"] > 1
+    want = {}   # md4 → md4 of the following block (None: no check) → [block indices]
+    for i, s in enumerate(sums):
+        nxt = sums[i + 1] if seq and i + 1 < n else None
+        want.setdefault(s, {}).setdefault(nxt, []).append(i)
+    found = {}
+    size = os.path.getsize(old_path)
+    if size < bs:
+        return found
+    with open(old_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        view = memoryview(m)
+        ahead = None   # (offset, md4) of the block computed for the last sequence check
+        report = 0
+        try:
+            for off in range(0, size - bs + 1, step):
+                if ahead and ahead[0] == off:
+                    d = ahead[1]
+                else:
+                    d = md4(view[off:off + bs])[:cut]
+                by_next = want.get(d)
+                if by_next:
+                    for i in by_next.pop(None, ()):
+                        found[i] = off
+                    if by_next and off + 2 * bs <= size:
+                        ahead = (off + bs, md4(view[off + bs:off + 2 * bs])[:cut])
+                        for i in by_next.pop(ahead[1], ()):
+                            found[i] = off
+                    for nxt, idxs in list(by_next.items()):
+                        rest = [i for i in idxs if found.get(i - 1) != off - bs]
+                        for i in idxs:
+                            if found.get(i - 1) == off - bs:
+                                found[i] = off
+                        if rest:
+                            by_next[nxt] = rest
+                        else:
+                            del by_next[nxt]
+                    if not by_next:
+                        del want[d]
+                    if not want:
+                        break
+                if progress_cb and off >= report:
+                    progress_cb(off / size)
+                    report = off + (64 << 20)
+        finally:
+            view.release()
+    return found
+
+
+def zsync_assemble(zs, old_path, found, dest):
+    """Create dest at the new file's length holding every block in found,
+    copied from old_path.  Returns the byte ranges [(start, end), …] (end
+    exclusive) that still have to be fetched, adjacent blocks merged."""
+    bs, length = zs["blocksize"], zs["length"]
+    missing = []
+    with open(old_path, "rb") as src, open(dest, "wb") as out:
+        out.truncate(length)
+        run = None   # [first new offset, first old offset, length] of a contiguous copy
+
+        def flush():
+            start, old, left = run
+            while left:
+                n = min(left, DOWNLOAD_CHUNK)
+                os.pwrite(out.fileno(), os.pread(src.fileno(), n, old), start)
+                start, old, left = start + n, old + n, left - n
+
+        for i in range(len(zs["sums"])):
+            start, end = i * bs, min((i + 1) * bs, length)
+            old = found.get(i)
+            if old is None:
+                if missing and missing[-1][1] == start:
+                    missing[-1] = (missing[-1][0], end)
+                else:
+                    missing.append((start, end))
+            elif run and run[0] + run[2] == start and run[1] + run[2] == old:
+                run[2] += end - start
+            else:
+                if run:
+                    flush()
+                run = [start, old, end - start]
+        if run:
+            flush()
+        out.flush()
+        os.fsync(out.fileno())
+    return missing
+
+
+def fetch_ranges(urls, path, ranges, progress_cb=None, workers=DOWNLOAD_WORKERS,
+                 max_range=DOWNLOAD_CHUNK):
+    """Fill the byte ranges [(start, end), …] of the existing file path from
+    the mirrors, splitting long ranges and spreading them over every mirror.
+    A range that fails is retried on the next mirror.  True if all arrived."""
+    jobs = [(s, min(s + max_range, end)) for start, end in ranges
+            for s in range(start, end, max_range)]
+    lock = threading.Lock()
+    done = [0]
+    fd = os.open(path, os.O_WRONLY)
+
+    def fetch(k):
+        start, end = jobs[k]
+        buf = bytearray(end - start)
+        view = memoryview(buf)
+        for j in range(len(urls)):
+            url = urls[(k + j) % len(urls)]
+            got = 0
+            try:
+                with _http_get(url, start, end - 1) as resp:
+                    if resp.status != 206:
+                        continue
+                    while got < len(buf):
+                        n = resp.readinto(view[got:])
+                        if not n:
+                            raise ValueError("connection closed mid-range")
+                        got += n
+            except (urllib.error.URLError, OSError, ValueError):
+                continue
+            try:
+                if os.pwrite(fd, buf, start) != len(buf):
+                    return False
+            except OSError:
+                return False     # ENOSPC/EIO: no other mirror can help
+            with lock:
+                done[0] += len(buf)
+                if progress_cb:
+                    progress_cb(done[0])
+            return True
+        return False
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers * len(urls))) as pool:
+            ok = all(list(pool.map(fetch, range(len(jobs)))))
+        os.fsync(fd)
+    except OSError:
+        ok = False
+    finally:
+        os.close(fd)
+    return ok
+
+# ─── LAN peer cache ──────────────────────────────────────────────────────────
+#
+# Machines on the same subnet share their cache: PeerCacheServer exports every
+# verified ISO at http://<host>:PEER_PORT/sha256/<sha256> (with Range support)
+# and answers "who has <sha256>" UDP broadcasts on the same port number.
+# discover_peers() sends that broadcast – the installer only does so while it
+# shares its own cache – and peers listed in $ULLI_PEERS (host:port, comma
+# separated) are always included.  Whatever a peer sends is checked against
+# the distro's SHA-256 like any other mirror.
+
+PEER_PORT           = int(os.environ.get("ULLI_PEER_PORT", 45781))
+PEER_DISCOVERY_SECS = 1.5
+_PEER_MAGIC         = b"ULLI1"
+
+
+def _peer_file(sha256):
+    """Return the path of a cached ISO we may hand out, or None."""
+    if not re.fullmatch(r"[0-9a-f]{64}", sha256):
+        return None
+    path = cache_iso_path(sha256)
+    if path.exists() and is_known_verified(str(path), sha256):
+        return path
+    return None
+
+
+class _PeerHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "linux-installer-peer/1.0"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def _serve(self, body):
+        m = re.fullmatch(r"/sha256/([0-9a-f]{64})", self.path)
+        path = _peer_file(m.group(1)) if m else None
+        if path is None:
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            start, end = 0, size - 1
+            rng = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", "").strip())
+            if rng and any(rng.groups()):
+                if rng.group(1):
+                    start = int(rng.group(1))
+                    if rng.group(2):
+                        end = min(int(rng.group(2)), size - 1)
+                else:
+                    start = max(size - int(rng.group(2)), 0)
+                if start > end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(end + 1 - start))
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            if body:
+                try:
+                    self.connection.sendfile(f, start, end + 1 - start)
+                except OSError:
+                    pass   # client went away
+
+
+class PeerCacheServer:
+    """Share verified cached ISOs with other machines until stop() is called.
+
+    http_port=0 picks a free port (self.port); discovery is answered on
+    udp_port, if it can be bound."""
+
+    def __init__(self, http_port=PEER_PORT, udp_port=PEER_PORT, log=None):
+        self.log = log or (lambda msg, error=False: None)
+        self.http = http.server.ThreadingHTTPServer(("", http_port), _PeerHandler)
+        self.http.daemon_threads = True
+        self.port = self.http.server_address[1]
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.udp.bind(("", udp_port))
+        except OSError as e:
+            self.log(f"Peer discovery disabled (UDP port {udp_port}: {e})", error=True)
+            self.udp.close()
+            self.udp = None
+
+    def start(self):
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+        if self.udp:
+            threading.Thread(target=self._answer, daemon=True).start()
+        self.log(f"Sharing cached ISOs on port {self.port}")
+        return self
+
+    def stop(self):
+        self.http.shutdown()
+        self.http.server_close()
+        if self.udp:
+            self.udp.close()
+
+    def _answer(self):
+        while True:
+            try:
+                msg, addr = self.udp.recvfrom(512)
+            except OSError:
+                return   # socket closed by stop()
+            parts = msg.split()
+            if len(parts) == 3 and parts[:2] == [_PEER_MAGIC, b"WHO-HAS"]:
+                sha = parts[2].decode("ascii", "replace")
+                if _peer_file(sha):
+                    reply = b" ".join([_PEER_MAGIC, b"HAVE", parts[2], str(self.port).encode()])
+                    try:
+                        self.udp.sendto(reply, addr)
+                    except OSError:
+                        pass
+
+
+def discover_peers(sha256, timeout=PEER_DISCOVERY_SECS, port=PEER_PORT, broadcast=True):
+    """Return URLs of peers offering a verified copy of sha256: those named
+    in $ULLI_PEERS, then, with broadcast, any that answer a broadcast within
+    timeout seconds."""
+    urls = [f"http://{p.strip()}/sha256/{sha256}"
+            for p in os.environ.get("ULLI_PEERS", "").split(",") if p.strip()]
+    if not broadcast:
+        return urls
+    query = b" ".join([_PEER_MAGIC, b"WHO-HAS", sha256.encode()])
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sent = False
+        for dest in ("255.255.255.255", "127.0.0.1"):
+            try:
+                s.sendto(query, (dest, port))
+                sent = True
+            except OSError:
+                pass    # no route for broadcasts still leaves this host
+        if not sent:
+            return urls
+        deadline = time.monotonic() + timeout
+        while (left := deadline - time.monotonic()) > 0:
+            s.settimeout(left)
+            try:
+                msg, addr = s.recvfrom(512)
+            except OSError:
+                break
+            parts = msg.split()
+            if (len(parts) == 4 and parts[:3] == [_PEER_MAGIC, b"HAVE", sha256.encode()]
+                    and parts[3].isdigit()):
+                url = f"http://{addr[0]}:{int(parts[3])}/sha256/{sha256}"
+                if url not in urls:
+                    urls.append(url)
+    return urls
+
+# ─── ISO9660 reader ──────────────────────────────────────────────────────────
+#
+# Just enough of ISO9660 (plus Rock Ridge and Joliet names) to list an image
+# and copy its files out without mounting it.  Every function takes a
+# read_at(offset, length) callable so the same code works on a local file
+# and on the front of an image that is still downloading.
+
+ISO_SECTOR = 2048
+
+
+class IsoNeedMore(Exception):
+    """A streaming read_at() was asked for bytes that have not arrived yet."""
+
+    def __init__(self, end):
+        super().__init__(f"need image bytes up to offset {end}")
+        self.end = end
+
+
+class IsoStreamError(Exception):
+    """The image cannot be extracted front to back as it streams in."""
+
+
+def _dir_extent(rec):
+    """(lba, size) of the directory described by a 34-byte directory record."""
+    return int.from_bytes(rec[2:6], "little"), int.from_bytes(rec[10:14], "little")
+
+
+def iso_volume_info(read_at):
+    """Parse the volume descriptors of an ISO9660 image.
+
+    Returns a dict with the volume "label", the "root" and (if present) Joliet
+    "joliet_root" directory extents as (lba, size), the El Torito
+    "boot_catalog" LBA (or None) and the image size in "blocks".
+    """
+    info = {"label": "", "root": None, "joliet_root": None,
+            "boot_catalog": None, "blocks": 0}
+    for sector in range(16, 80):
+        vd = read_at(sector * ISO_SECTOR, ISO_SECTOR)
+        if vd[1:6] != b"CD001" or vd[0] == 255:
+            break
+        if vd[0] == 0 and vd[7:30] == b"EL TORITO SPECIFICATION":
+            info["boot_catalog"] = int.from_bytes(vd[71:75], "little")
+        elif vd[0] == 1 and info["root"] is None:
+            info["label"] = vd[40:72].decode("ascii", "replace").strip()
+            info["blocks"] = int.from_bytes(vd[80:84], "little")
+            info["root"] = _dir_extent(vd[156:190])
+        elif vd[0] == 2 and vd[88:90] == b"%/" and vd[90:91] in (b"@", b"C", b"E"):
+            info["joliet_root"] = _dir_extent(vd[156:190])
+    if info["root"] is None:
+        raise ValueError("not an ISO9660 image (no primary volume descriptor)")
+    return info
+
+
+def _iso_records(data):
+    """Yield the raw directory records of one directory extent."""
+    off = 0
+    while off < len(data):
+        n = data[off]
+        if n == 0:
+            # Records never cross a sector boundary; the rest is padding
+            off = (off // ISO_SECTOR + 1) * ISO_SECTOR
+            continue
+        yield data[off:off + n]
+        off += n
+
+
+def _susp_entries(read_at, su):
+    """Yield (signature, body) for the SUSP/Rock Ridge entries in a record's
+    system use area, following CE continuation areas."""
+    for _ in range(32):
+        ce = None
+        off = 0
+        while off + 4 <= len(su):
+            sig, length = bytes(su[off:off + 2]), su[off + 2]
+            if length < 4 or sig == b"ST":
+                break
+            body = su[off + 4:off + length]
+            if sig == b"CE":
+                ce = (int.from_bytes(body[0:4], "little"),
+                      int.from_bytes(body[8:12], "little"),
+                      int.from_bytes(body[16:20], "little"))
+            else:
+                yield sig, body
+            off += length
+        if not ce:
+            return
+        su = read_at(ce[0] * ISO_SECTOR + ce[1], ce[2])
+
+
+def _iso_parse_record(read_at, rec, joliet):
+    """Decode one directory record into a dict (name, lba, size, flags, RR data)."""
+    nlen = rec[32]
+    raw = bytes(rec[33:33 + nlen])
+    e = {"lba": int.from_bytes(rec[2:6], "little") + rec[1],
+         "size": int.from_bytes(rec[10:14], "little"),
+         "is_dir": bool(rec[25] & 0x02), "multi": bool(rec[25] & 0x80),
+         "special": raw in (b"\0", b"\1"), "rr": False,
+         "target": None, "child": None, "relocated": False}
+    if joliet:
+        name = raw.decode("utf-16-be", "replace")
+    else:
+        name = raw.decode("ascii", "replace").lower()
+    name = name.split(";")[0]
+    if not e["is_dir"] and name.endswith("."):
+        name = name[:-1]
+
+    nm, sl, cont = [], [], False
+    for sig, body in _susp_entries(read_at, rec[33 + nlen + (1 - nlen % 2):]):
+        if sig in (b"NM", b"PX", b"SL", b"RR", b"TF"):
+            e["rr"] = True
+        if sig == b"NM" and body and not body[0] & 0x06:
+            nm.append(bytes(body[1:]))
+        elif sig == b"SL" and body:
+            i = 1
+            while i + 2 <= len(body):
+                cflags, clen = body[i], body[i + 1]
+                text = bytes(body[i + 2:i + 2 + clen]).decode("utf-8", "surrogateescape")
+                i += 2 + clen
+                part = ("" if cflags & 0x08 else "." if cflags & 0x02
+                        else ".." if cflags & 0x04 else text)
+                if cont and sl:
+                    sl[-1] += part
+                else:
+                    sl.append(part)
+                cont = bool(cflags & 0x01)
+        elif sig == b"CL" and len(body) >= 4:
+            e["child"] = int.from_bytes(body[0:4], "little")
+        elif sig == b"RE":
+            e["relocated"] = True
+    if nm:
+        name = b"".join(nm).decode("utf-8", "surrogateescape")
+    if sl:
+        e["target"] = "/".join(sl) if sl != [""] else "/"
+    e["name"] = name
+    return e
+
+
+def iso_list(read_at, boot_images=False):
+    """List every directory, file and symlink in an ISO9660 image.
+
+    Returns (info, entries) where info comes from iso_volume_info() and each
+    entry is a dict with "path" ('/'-separated, relative to the image root),
+    "name", "type" ("dir", "file" or "symlink"), "size", "extents" – a list
+    of (byte_offset, length) – and "target" for symlinks.  Rock Ridge names
+    are used when present, then Joliet, then plain ISO9660 names lower-cased
+    the way the kernel's default mount shows them.  With boot_images the El
+    Torito images are added under "[BOOT]/", named the way 7z extracts them.
+    """
+    info = iso_volume_info(read_at)
+    root_lba, root_size = info["root"]
+    root_recs = list(_iso_records(read_at(root_lba * ISO_SECTOR, root_size)))
+    rr = any(_iso_parse_record(read_at, r, False)["rr"] for r in root_recs[:3])
+    joliet = not rr and info["joliet_root"] is not None
+    if joliet:
+        root_lba, root_size = info["joliet_root"]
+
+    entries = []
+    visited = set()
+    queue = collections.deque([(root_lba, root_size, "")])
+    while queue:
+        lba, size, path = queue.popleft()
+        if lba in visited:
+            continue
+        visited.add(lba)
+        prev = None
+        for rec in _iso_records(read_at(lba * ISO_SECTOR, size)):
+            e = _iso_parse_record(read_at, rec, joliet)
+            if e["special"] or e["relocated"]:
+                continue
+            if prev and prev["multi"] and prev["name"] == e["name"]:
+                # Next extent of a file larger than 4 GiB
+                prev["extents"].append((e["lba"] * ISO_SECTOR, e["size"]))
+                prev["size"] += e["size"]
+                prev["multi"] = e["multi"]
+                continue
+            name = e["name"]
+            if not name or name in (".", "..") or "/" in name or "\0" in name:
+                continue
+            child_path = f"{path}/{name}" if path else name
+            if e["child"] is not None:
+                # Rock Ridge deep-directory relocation: the real directory
+                # lives elsewhere; its "." record carries its size
+                first = next(_iso_records(read_at(e["child"] * ISO_SECTOR, ISO_SECTOR)))
+                e["lba"], e["size"], e["is_dir"] = e["child"], _dir_extent(first)[1], True
+            if e["target"] is not None:
+                kind = "symlink"
+            elif e["is_dir"]:
+                kind = "dir"
+                queue.append((e["lba"], e["size"], child_path))
+            else:
+                kind = "file"
+            prev = {"path": child_path, "name": name, "type": kind,
+                    "size": e["size"] if kind == "file" else 0,
+                    "extents": [(e["lba"] * ISO_SECTOR, e["size"])] if kind == "file" else [],
+                    "target": e["target"], "multi": e["multi"]}
+            entries.append(prev)
+    for e in entries:
+        del e["multi"]
+    if boot_images and info["boot_catalog"] is not None:
+        images = iso_boot_images(read_at, info["boot_catalog"])
+        if images:
+            entries.append({"path": "[BOOT]", "name": "[BOOT]", "type": "dir", "size": 0,
+                            "extents": [], "target": None})
+        for i, (media, off, size) in enumerate(images, 1):
+            name = f"{i}-Boot-{ELTORITO_MEDIA.get(media, 'NoEmul')}.img"
+            entries.append({"path": f"[BOOT]/{name}", "name": name, "type": "file",
+                            "size": size, "extents": [(off, size)], "target": None})
+    return info, entries
+
+
+ELTORITO_MEDIA = {0: "NoEmul", 1: "1.2M", 2: "1.44M", 3: "2.88M", 4: "HardDisk"}
+
+
+def iso_boot_images(read_at, catalog_lba):
+    """The images in an El Torito boot catalog as (media type, byte offset,
+    size).  Catalogs often under-state the size of an EFI image; when one
+    starts with a FAT boot sector its size is taken from there instead (if
+    that sector can be read – not while streaming the head of an image)."""
+    cat = read_at(catalog_lba * ISO_SECTOR, ISO_SECTOR)
+    if cat[0] != 1 or cat[30:32] != b"\x55\xaa":
+        return []
+    images = []
+
+    def add(rec):
+        if rec[0] not in (0x88, 0x00):
+            return
+        media = rec[1] & 0x0F
+        count, lba = struct.unpack_from("<HI", rec, 6)
+        if not lba:
+            return
+        size = {1: 1200 << 10, 2: 1440 << 10, 3: 2880 << 10}.get(media, count * 512)
+        try:
+            bs = read_at(lba * ISO_SECTOR, 512)
+        except IsoNeedMore:
+            bs = b""
+        if len(bs) == 512 and bs[510:512] == b"\x55\xaa" and b"FAT" in (bs[54:57], bs[82:85]):
+            bps, total16 = struct.unpack_from("<H", bs, 11)[0], struct.unpack_from("<H", bs, 19)[0]
+            total = total16 or struct.unpack_from("<I", bs, 32)[0]
+            if bps in (512, 1024, 2048, 4096) and total:
+                size = max(size, bps * total)
+        images.append((media, lba * ISO_SECTOR, size))
+
+    add(cat[32:64])
+    pos = 64
+    while pos + 32 <= len(cat) and cat[pos] in (0x90, 0x91):
+        final, n = cat[pos] == 0x91, struct.unpack_from("<H", cat, pos + 2)[0]
+        pos += 32
+        for _ in range(n):
+            if pos + 32 > len(cat):
+                break
+            add(cat[pos:pos + 32])
+            pos += 32
+            while pos + 32 <= len(cat) and cat[pos] == 0x44:   # entry extension
+                pos += 32
+        if final:
+            break
+    return images
+
+
+def iso_copy_plan(entries, log=None):
+    """Work out what `cp -rL` of the mounted image would write.
+
+    Returns {"dirs": [path, …], "files": [{"path", "size", "extents"}, …]}.
+    Symlinks are replaced by copies of what they point to, like rsync
+    --copy-links; links to an enclosing directory (e.g. ubuntu -> .) and links
+    that leave the image are skipped.
+    """
+    log = log or (lambda msg, error=False: None)
+    by_path = {"": {"path": "", "type": "dir"}}
+    children = collections.defaultdict(list)
+    for e in entries:
+        by_path[e["path"]] = e
+        children[e["path"].rpartition("/")[0]].append(e)
+
+    def resolve(path, depth=0):
+        parts = []
+        for comp in path.split("/"):
+            if comp in ("", "."):
+                continue
+            if comp == "..":
+                if not parts:
+                    return None
+                parts.pop()
+                continue
+            parts.append(comp)
+            e = by_path.get("/".join(parts))
+            if e is None:
+                return None
+            if e["type"] == "symlink":
+                if depth > 40 or e["target"].startswith("/"):
+                    return None
+                r = resolve("/".join(parts[:-1] + [e["target"]]), depth + 1)
+                if r is None:
+                    return None
+                parts = r["path"].split("/") if r["path"] else []
+        return by_path.get("/".join(parts))
+
+    plan = {"dirs": [], "files": []}
+
+    def emit(src_dir, dest_dir, stack):
+        for child in children[src_dir]:
+            dest = f"{dest_dir}/{child['name']}" if dest_dir else child["name"]
+            e = child
+            if child["type"] == "symlink":
+                e = resolve(child["path"])
+                if e is None:
+                    log(f"Skipping symlink {child['path']} -> {child['target']} "
+                        "(points outside the image)")
+                    continue
+            if e["type"] == "dir":
+                if e["path"] in stack:
+                    log(f"Skipping self-referential symlink: {child['path']} -> "
+                        f"{child['target']}")
+                    continue
+                plan["dirs"].append(dest)
+                emit(e["path"], dest, stack + [e["path"]])
+            else:
+                plan["files"].append({"path": dest, "size": e["size"],
+                                      "extents": e["extents"]})
+
+    emit("", "", [""])
+    return plan
+
+
+def plan_rewrite(plan, read_at, rewrite):
+    """Swap the files of plan named in rewrite ({path: fn(bytes) -> bytes})
+    for their rewritten contents, kept in memory under "data"."""
+    for f in plan["files"]:
+        fn = rewrite.get(f["path"])
+        if fn and "data" not in f:
+            f["data"] = fn(b"".join(read_at(off, n) for off, n in f["extents"]))
+            f["size"], f["extents"] = len(f["data"]), []
+    return plan
+
+
+def path_matches(path, globs):
+    """True if path matches one of globs ('*' also crosses '/')."""
+    return any(fnmatch.fnmatchcase(path, g) for g in globs)
+
+
+def plan_filter(plan, skip):
+    """plan without the files matching the skip globs, or the directories
+    left with nothing in them."""
+    if not skip:
+        return plan
+    files = [f for f in plan["files"] if not path_matches(f["path"], skip)]
+    used = set()
+    for f in files:
+        parts = f["path"].split("/")[:-1]
+        used.update("/".join(parts[:i]) for i in range(1, len(parts) + 1))
+    dirs = [d for d in plan["dirs"] if d in used or not path_matches(d + "/", skip)]
+    return {"dirs": dirs, "files": files}
+
+
+def _makedirs_for_plan(dest_dir, plan):
+    for d in plan["dirs"]:
+        os.makedirs(os.path.join(dest_dir, d), exist_ok=True)
+
+
+class IsoStreamExtractor:
+    """Extract an ISO9660 image into dest_dir while it is still downloading.
+
+    feed() takes the image bytes strictly in order.  The front of the image
+    is buffered until the volume descriptors, directory records and Rock
+    Ridge continuation areas have all arrived – mastering tools put them
+    ahead of the file data – so the file tree is known and every later byte
+    can be written straight to the file it belongs to.  If the metadata runs
+    past head_limit the image can't be streamed and IsoStreamError is raised.
+    Files named in rewrite ({path: fn}) are gathered in memory and written
+    as fn(contents) once complete, files matching the skip globs are left
+    out, and boot_images is passed on to iso_list().
+    """
+
+    HEAD_LIMIT = 64 << 20
+
+    def __init__(self, dest_dir, log=None, head_limit=HEAD_LIMIT, boot_images=False,
+                 rewrite=None, skip=()):
+        self.dest_dir = dest_dir
+        self.log = log or (lambda msg, error=False: None)
+        self.head_limit = head_limit
+        self.boot_images = boot_images
+        self.rewrite = rewrite or {}
+        self.skip = skip
+        self.pos = 0
+        self.info = None
+        self.plan = None
+        self._head = bytearray()
+        self._need = 0
+        self._pieces = []        # (start, end, path, file_offset) sorted by start
+        self._next = 0
+        self._active = []
+        self._fds = {}
+        self._remaining = {}     # path -> bytes still to be written
+        self._held = {}          # path -> (buffer, fn) for rewritten files
+
+    def _read_head(self, offset, length):
+        if offset + length > len(self._head):
+            raise IsoNeedMore(offset + length)
+        return bytes(self._head[offset:offset + length])
+
+    def feed(self, data):
+        if self.plan is not None:
+            self._write(self.pos, data)
+            self.pos += len(data)
+            return
+        self._head += data
+        self.pos += len(data)
+        if len(self._head) < self._need:
+            return
+        try:
+            self.info, entries = iso_list(self._read_head, self.boot_images)
+        except IsoNeedMore as e:
+            if e.end > self.head_limit:
+                raise IsoStreamError("ISO metadata is not at the start of the image")
+            self._need = e.end
+            return
+        self._start(plan_filter(iso_copy_plan(entries, self.log), self.skip))
+        head, self._head = self._head, None
+        self._write(0, head)
+
+    def _start(self, plan):
+        self.plan = plan
+        _makedirs_for_plan(self.dest_dir, plan)
+        for f in plan["files"]:
+            full = os.path.join(self.dest_dir, f["path"])
+            if f["size"] == 0:
+                open(full, "wb").close()
+                continue
+            self._remaining[full] = f["size"]
+            if f["path"] in self.rewrite:
+                self._held[full] = (bytearray(f["size"]), self.rewrite[f["path"]])
+            foff = 0
+            for off, length in f["extents"]:
+                self._pieces.append((off, off + length, full, foff))
+                foff += length
+        self._pieces.sort()
+
+    def _write(self, base, data):
+        end = base + len(data)
+        view = memoryview(data)
+        while self._next < len(self._pieces) and self._pieces[self._next][0] < end:
+            self._active.append(self._pieces[self._next])
+            self._next += 1
+        still = []
+        for piece in self._active:
+            start, stop, full, foff = piece
+            a, b = max(start, base), min(stop, end)
+            if a < b:
+                held = self._held.get(full)
+                if held:
+                    held[0][foff + a - start:foff + b - start] = view[a - base:b - base]
+                else:
+                    fd = self._fds.get(full)
+                    if fd is None:
+                        fd = self._fds[full] = os.open(
+                            full, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                    os.pwrite(fd, view[a - base:b - base], foff + a - start)
+                self._remaining[full] -= b - a
+                if self._remaining[full] == 0:
+                    if held:
+                        with open(full, "wb") as f:
+                            f.write(held[1](bytes(self._held.pop(full)[0])))
+                    else:
+                        os.close(self._fds.pop(full))
+            if stop > end:
+                still.append(piece)
+        self._active = still
+
+    def abort(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
+
+    def close(self):
+        """Finish extraction; raises IsoStreamError if the image was truncated."""
+        self.abort()
+        if self.plan is None:
+            raise IsoStreamError("image ended before its directory tree")
+        missing = [p for p, n in self._remaining.items() if n]
+        if missing:
+            raise IsoStreamError(f"image ended before {len(missing)} file(s) were complete")
+
+
+# Files that dominate the copy; each gets a worker of its own from the start.
+BIG_PAYLOADS = ("casper/filesystem.squashfs", "live/filesystem.squashfs",
+                "LiveOS/squashfs.img")
+BIG_FILE     = 256 << 20   # …as does any other file at least this large
+COPY_WORKERS = 4           # threads sharing the remaining (small) files
+
+def copy_range(src_fd, dst_fd, src_off, dst_off, length, progress=None, step=8 << 20,
+               unsupported=None):
+    """Copy length bytes from src_fd to dst_fd at the given offsets inside the
+    kernel – copy_file_range, else sendfile – falling back to pread/pwrite
+    where neither works between the two filesystems.  The kernel calls that
+    failed as unsupported are added to the set unsupported and not tried
+    again; share one set only between copies with the same two filesystems."""
+    if unsupported is None:
+        unsupported = set()
+    while length:
+        n = min(length, step)
+        done = 0
+        if "copy_file_range" not in unsupported:
+            try:
+                done = os.copy_file_range(src_fd, dst_fd, n, src_off, dst_off)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+                unsupported.add("copy_file_range")
+        if not done and "sendfile" not in unsupported:
+            try:
+                os.lseek(dst_fd, dst_off, os.SEEK_SET)
+                done = os.sendfile(dst_fd, src_fd, src_off, n)
+            except OSError as e:
+                if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+                    raise
+                unsupported.add("sendfile")
+        if not done:
+            data = os.pread(src_fd, n, src_off)
+            if not data:
+                raise OSError(f"source ends at offset {src_off}")
+            done = os.pwrite(dst_fd, data, dst_off)
+        src_off, dst_off, length = src_off + done, dst_off + done, length - done
+        if progress:
+            progress(done)
+
+
+def copy_plan_files(src_fd, dest_dir, plan, progress_cb=None, workers=COPY_WORKERS,
+                    first=()):
+    """Write every file of plan (see iso_copy_plan) from the image open on
+    src_fd into dest_dir, whose directories must already exist.
+
+    The big payloads start first, one thread each; the small files follow in
+    on-disc order, spread over `workers` more threads – those matching the
+    `first` globs ahead of the rest.  progress_cb(done, total) is called
+    from the workers."""
+    files = plan["files"]
+    big = [f for f in files if f["path"] in BIG_PAYLOADS or f["size"] >= BIG_FILE]
+    small = sorted((f for f in files if f not in big),
+                   key=lambda f: f["extents"][0][0] if f["extents"] else 0)
+    total = sum(f["size"] for f in files) or 1
+    lock = threading.Lock()
+    done = [0]
+    unsupported = set()     # every file goes from the same image to dest_dir
+
+    def progress(n):
+        with lock:
+            done[0] += n
+            if progress_cb:
+                progress_cb(done[0], total)
+
+    def copy(f):
+        fd = os.open(os.path.join(dest_dir, f["path"]),
+                     os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if "data" in f:
+                os.write(fd, f["data"])
+                progress(f["size"])
+            foff = 0
+            for off, length in f["extents"]:
+                copy_range(src_fd, fd, off, foff, length, progress,
+                           unsupported=unsupported)
+                foff += length
+        finally:
+            os.close(fd)
+
+    with ThreadPoolExecutor(max_workers=len(big) + workers) as pool:
+        order = sorted(big + small, key=lambda f: not path_matches(f["path"], first))
+        for fut in [pool.submit(copy, f) for f in order]:
+            fut.result()
+
+
+def iso_extract(iso_path, dest_dir, log=None, progress_cb=None, workers=COPY_WORKERS,
+                boot_images=False, rewrite=None, skip=(), first=()):
+    """Copy the file tree of a local ISO into dest_dir, like `cp -rL` from a
+    loop mount but without one (see copy_plan_files).  boot_images adds the
+    El Torito images as iso_list() does, the files named in rewrite are
+    written as plan_rewrite() makes them and those matching the skip globs
+    are left out.  Returns the plan."""
+    fd = os.open(iso_path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        read_at = lambda off, n: os.pread(fd, n, off)
+        _, entries = iso_list(read_at, boot_images)
+        plan = plan_filter(plan_rewrite(iso_copy_plan(entries, log), read_at, rewrite or {}),
+                           skip)
+        _makedirs_for_plan(dest_dir, plan)
+        copy_plan_files(fd, dest_dir, plan, progress_cb, workers, first)
+        return plan
+    finally:
+        os.close(fd)
+
+
+class MirrorStream:
+    """Iterate over the bytes of one file front to back.
+
+    When a connection drops, the next url picks up where it left off with a
+    Range request.  .size is set from the first response's Content-Length.
+    """
+
+    def __init__(self, urls, log=None, block=1 << 17):
+        self.urls = list(urls)
+        self.log = log or (lambda msg, error=False: None)
+        self.block = block
+        self.size = 0
+        self.pos = 0
+
+    def __iter__(self):
+        for url in self.urls:
+            try:
+                with _http_get(url, self.pos or None) as resp:
+                    if self.pos and resp.status != 206:
+                        self.log(f"{_host(url)} cannot resume at byte {self.pos}", error=True)
+                        continue
+                    expected = self.pos + int(resp.headers.get("Content-Length", 0))
+                    if not self.size:
+                        self.size = expected
+                    while True:
+                        buf = resp.read(self.block)
+                        if not buf:
+                            break
+                        self.pos += len(buf)
+                        yield buf
+                    if self.pos < expected:
+                        raise ValueError("connection closed early")
+                    return
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                self.log(f"{_host(url)}: interrupted at byte {self.pos}: {e}", error=True)
+        raise OSError("every mirror failed")
+
+
+# ─── copy verification ───────────────────────────────────────────────────────
+#
+# After the ISO has been copied to the boot partition every file is read back
+# from disk and hashed.  Files listed in the image's own checksum list are
+# compared with it; the rest are compared with the same bytes hashed straight
+# from the ISO.
+
+CHECKSUM_LISTS = (("sha256sum.txt", "sha256"), ("SHA256SUMS", "sha256"),
+                  ("md5sum.txt", "md5"))
+# Fedora boot configs whose volume label references are rewritten as they are copied
+FEDORA_PATCHED_CFGS = ("EFI/BOOT/grub.cfg", "boot/grub2/grub.cfg", "isolinux/isolinux.cfg")
+
+
+def patch_boot_labels(data, label):
+    """Point the root=live:CDLABEL= / isolabel references in a boot config at label."""
+    data = re.sub(rb"(root=live:(?:CD)?LABEL=)(\S+)", rb"\g<1>" + label.encode(), data)
+    return re.sub(rb"(set isolabel=)(\S+)", rb"\g<1>" + label.encode(), data)
+
+
+def parse_checksum_list(text):
+    """{relative path: hex digest} from `md5sum`/`sha256sum` style output."""
+    sums = {}
+    for line in text.splitlines():
+        m = re.match(r"([0-9a-fA-F]{32,128})\s+\*?(?:\./)?(.+)$", line.strip())
+        if m:
+            sums[m.group(2)] = m.group(1).lower()
+    return sums
+
+
+def _hash_extents(fd, algo, extents, progress=None, also=None):
+    """Hash the (offset, length) byte runs of fd in order.  The hash object
+    also, if given, is fed the same bytes."""
+    h = hashlib.new(algo)
+    buf = bytearray(HASH_CHUNK)
+    view = memoryview(buf)
+    for off, length in extents:
+        while length:
+            n = os.preadv(fd, [view[:min(length, len(buf))]], off)
+            if not n:
+                raise OSError(f"unexpected end of file at offset {off}")
+            h.update(view[:n])
+            if also is not None:
+                also.update(view[:n])
+            if progress:
+                progress(n)
+            off, length = off + n, length - n
+    return h.hexdigest()
+
+
+def copy_check_jobs(dest_dir, plan=None, skip=()):
+    """List what verify_copy should check under dest_dir.
+
+    Files named in a checksum list found in dest_dir are checked against it;
+    with plan (from iso_copy_plan) every other copied file is checked against
+    its source extents, or its rewritten "data".  Without plan only the
+    checksum list is used.  Paths matching the skip globs are not checked."""
+    jobs = {}
+    planned = {f["path"]: f for f in plan["files"]} if plan else None
+    for name, algo in CHECKSUM_LISTS:
+        try:
+            with open(os.path.join(dest_dir, name), errors="replace") as f:
+                sums = parse_checksum_list(f.read())
+        except OSError:
+            continue
+        for path, digest in sums.items():
+            if path in jobs or path_matches(path, skip):
+                continue
+            if planned is not None and (path not in planned or "data" in planned[path]):
+                continue   # not copied as is (e.g. reached only through a skipped symlink)
+            if planned:
+                size = planned[path]["size"]
+            else:
+                try:
+                    size = os.path.getsize(os.path.join(dest_dir, path))
+                except OSError:
+                    size = 0
+            jobs[path] = {"path": path, "size": size, "algo": algo, "digest": digest}
+    for path, f in (planned or {}).items():
+        if path in jobs or path_matches(path, skip):
+            continue
+        if "data" in f:
+            jobs[path] = {"path": path, "size": f["size"], "algo": "sha256",
+                          "digest": hashlib.sha256(f["data"]).hexdigest()}
+        else:
+            jobs[path] = {"path": path, "size": f["size"], "algo": "sha256",
+                          "extents": f["extents"]}
+    return list(jobs.values())
+
+
+def verify_copy(dest_dir, jobs, iso_path=None, workers=None, progress_cb=None,
+                digests=None):
+    """Hash the files in jobs on a worker pool, largest first, reading them
+    back from disk rather than the page cache.  progress_cb(done_bytes) is
+    called from the workers.  If a dict is passed as digests, the SHA-256 of
+    every file that checks out is recorded in it from the same read.
+    Returns [(path, problem), …] for every file that is missing or
+    differs."""
+    os.sync()
+    lock = threading.Lock()
+    done = [0]
+
+    def progress(n):
+        with lock:
+            done[0] += n
+            if progress_cb:
+                progress_cb(done[0])
+
+    iso_fd = os.open(iso_path, os.O_RDONLY) if iso_path else None
+
+    def check(job):
+        try:
+            fd = os.open(os.path.join(dest_dir, job["path"]), os.O_RDONLY)
+        except OSError as e:
+            return job["path"], f"missing ({e.strerror})"
+        side = hashlib.sha256() if digests is not None and job["algo"] != "sha256" else None
+        try:
+            size = os.fstat(fd).st_size
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            actual = _hash_extents(fd, job["algo"], [(0, size)], progress, side)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError as e:
+            return job["path"], f"unreadable ({e.strerror or e})"
+        finally:
+            os.close(fd)
+        expected = job.get("digest")
+        if expected is None:
+            expected = _hash_extents(iso_fd, job["algo"], job["extents"])
+        if actual != expected:
+            return job["path"], f"{job['algo']} mismatch"
+        if digests is not None:
+            digests[job["path"]] = side.hexdigest() if side else actual
+        return None
+
+    try:
+        jobs = sorted(jobs, key=lambda j: j["size"], reverse=True)
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            return [r for r in pool.map(check, jobs) if r]
+    finally:
+        if iso_fd is not None:
+            os.close(iso_fd)
+
+# ─── LINUX_LIVE refresh ──────────────────────────────────────────────────────
+#
+# A populated LINUX_LIVE partition carries a manifest of the size and SHA-256
+# of every file copied from the ISO.  Installing another ISO onto it then only
+# rewrites the files whose digest changed and deletes the ones that are gone.
+
+LIVE_MANIFEST = ".ulli-manifest.json"
+
+
+def find_live_partition(inv=None):
+    """Device of an existing LINUX_LIVE partition (filesystem label or GPT
+    partition name), or None."""
+    if inv is not None:
+        return inv.find_label("LINUX_LIVE")
+    for tag in ("LABEL=LINUX_LIVE", "PARTLABEL=LINUX_LIVE"):
+        code, out, _ = run(["blkid", "-t", tag, "-o", "device"])
+        if code == 0 and out.split():
+            return out.split()[0]
+    return None
+
+
+def plan_digests(src_fd, plan, workers=None, progress_cb=None):
+    """{path: SHA-256} of every file in plan (see iso_copy_plan), hashed from
+    the image open on src_fd – or from "data" for rewritten files."""
+    lock = threading.Lock()
+    done = [0]
+
+    def progress(n):
+        with lock:
+            done[0] += n
+            if progress_cb:
+                progress_cb(done[0])
+
+    def digest(f):
+        if "data" in f:
+            progress(f["size"])
+            return f["path"], hashlib.sha256(f["data"]).hexdigest()
+        return f["path"], _hash_extents(src_fd, "sha256", f["extents"], progress)
+
+    files = sorted(plan["files"], key=lambda f: f["size"], reverse=True)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        return dict(pool.map(digest, files))
+
+
+def write_live_manifest(dest_dir, plan, digests, iso_name=""):
+    tmp = os.path.join(dest_dir, LIVE_MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"iso": iso_name,
+                   "files": {p["path"]: {"size": p["size"], "sha256": digests[p["path"]]}
+                             for p in plan["files"]}}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(dest_dir, LIVE_MANIFEST))
+
+
+def load_live_manifest(dest_dir):
+    """{path: {"size", "sha256"}} from dest_dir's manifest, or {} if it has none."""
+    try:
+        with open(os.path.join(dest_dir, LIVE_MANIFEST)) as f:
+            files = json.load(f)["files"]
+        return files if isinstance(files, dict) else {}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def refresh_diff(dest_dir, plan, digests, manifest):
+    """Compare the files under dest_dir with plan.  Returns (the plan entries
+    to rewrite, the paths under dest_dir to delete).  A file is kept only if
+    the manifest has its new digest and its size on disk still matches."""
+    wanted = {f["path"] for f in plan["files"]}
+    changed = []
+    for f in plan["files"]:
+        old = manifest.get(f["path"])
+        try:
+            on_disk = os.lstat(os.path.join(dest_dir, f["path"])).st_size
+        except OSError:
+            on_disk = None
+        if not (old and old.get("sha256") == digests[f["path"]]
+                and old.get("size") == f["size"] == on_disk):
+            changed.append(f)
+    stale = []
+    for root, _, names in os.walk(dest_dir):
+        for name in names:
+            rel = os.path.relpath(os.path.join(root, name), dest_dir)
+            if rel not in wanted and rel != LIVE_MANIFEST:
+                stale.append(rel)
+    return changed, stale
+
+# ─── FAT32 image writer ──────────────────────────────────────────────────────
+#
+# Rather than mkfs.fat + mount + copying through the vfat driver, the whole
+# LINUX_LIVE filesystem is laid out up front – every directory and file gets
+# one contiguous run of clusters – and then written front to back: reserved
+# sectors, both FATs, and the data region in cluster order, in large
+# sequential writes.  Free clusters are left as they are.
+
+FAT_RESERVED_SECTORS = 32
+FAT_EOC              = 0x0FFFFFFF
+_FAT_SHORT_CHARS     = set(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&'()-@^_`{}~")
+
+
+def fat_cluster_size(size_bytes):
+    """The cluster size mkfs.fat picks for a FAT32 volume of size_bytes."""
+    for limit, cluster in ((260 << 20, 512), (8 << 30, 4096),
+                           (16 << 30, 8192), (32 << 30, 16384)):
+        if size_bytes <= limit:
+            return cluster
+    return 32768
+
+
+def _fat_stamp(t=None):
+    """(time, date) words in FAT format for the local time t."""
+    tm = time.localtime(t)
+    return ((tm.tm_hour << 11) | (tm.tm_min << 5) | (tm.tm_sec // 2),
+            ((max(tm.tm_year, 1980) - 1980) << 9) | (tm.tm_mon << 5) | tm.tm_mday)
+
+
+def _fat_short_name(name, taken):
+    """Pick the 11-byte 8.3 name for name that is not yet in taken (and add
+    it).  Returns (short name, whether a long-name entry is needed)."""
+    stem, ext = name, ""
+    dot = name.rfind(".")
+    if dot > 0:
+        stem, ext = name[:dot], name[dot + 1:]
+
+    def clean(s):
+        return bytes(c if c in _FAT_SHORT_CHARS else ord("_")
+                     for c in s.upper().encode("ascii", "replace") if c not in b" .")
+
+    base, e = clean(stem) or b"_", clean(ext)[:3]
+    exact = (name == name.upper() and len(base) <= 8 and base == stem.encode("ascii", "replace")
+             and e == ext.encode("ascii", "replace"))
+    short = base.ljust(8) + e.ljust(3)
+    if not exact or short in taken:
+        for n in itertools.count(1):
+            tail = f"~{n}".encode()
+            short = (base[:8 - len(tail)] + tail).ljust(8) + e.ljust(3)
+            if short not in taken:
+                break
+        exact = False
+    taken.add(short)
+    return short, not exact
+
+
+def _fat_lfn_entries(name, short):
+    """The long-file-name directory entries that go in front of short."""
+    csum = 0
+    for c in short:
+        csum = (((csum & 1) << 7) + (csum >> 1) + c) & 0xFF
+    units = name.encode("utf-16-le")
+    chars = [units[i:i + 2] for i in range(0, len(units), 2)]
+    if len(chars) > 255:
+        raise ValueError(f"file name too long for FAT: {name}")
+    if len(chars) % 13:
+        chars += [b"\0\0"] + [b"\xff\xff"] * (12 - len(chars) % 13)
+    count = len(chars) // 13
+    out = []
+    for seq in range(count, 0, -1):
+        part = chars[(seq - 1) * 13:seq * 13]
+        out.append(bytes([seq | (0x40 if seq == count else 0)]) + b"".join(part[0:5])
+                   + bytes([0x0F, 0, csum]) + b"".join(part[5:11])
+                   + b"\0\0" + b"".join(part[11:13]))
+    return b"".join(out)
+
+
+def _fat_dirent(short, attr, cluster, size, stamp):
+    t, d = stamp
+    return struct.pack("<11sBBBHHHHHHHI", short, attr, 0, 0, t, d, d,
+                       cluster >> 16, t, d, cluster & 0xFFFF, size)
+
+
+class _SeqWriter:
+    """Buffer small writes into large ones at an ever-increasing offset."""
+
+    def __init__(self, fd, progress=None, bufsize=8 << 20):
+        self.fd = fd
+        self.pos = 0
+        self.progress = progress
+        self.bufsize = bufsize
+        self._buf = bytearray()
+        self._unsupported = set()     # see copy_range
+
+    def write(self, data):
+        self._buf += data
+        if len(self._buf) >= self.bufsize:
+            self.flush()
+
+    def zeros(self, n):
+        while n:
+            k = min(n, self.bufsize)
+            self.write(bytes(k))
+            n -= k
+
+    def copy(self, src_fd, extents):
+        self.flush()
+        for off, length in extents:
+            copy_range(src_fd, self.fd, off, self.pos, length, self.progress,
+                       unsupported=self._unsupported)
+            self.pos += length
+
+    def flush(self):
+        view = memoryview(self._buf)
+        while view:
+            n = os.pwrite(self.fd, view, self.pos)
+            self.pos += n
+            view = view[n:]
+            if self.progress:
+                self.progress(n)
+        self._buf = bytearray()
+
+
+class Fat32Image:
+    """A FAT32 filesystem described in memory and written in one pass.
+
+    add_dir()/add_file() build the tree – file data is either bytes or
+    (offset, length) extents of the src_fd later passed to write().  Names
+    are matched case-insensitively, as FAT does."""
+
+    def __init__(self, label="LINUX_LIVE"):
+        self.label = label.upper().encode("ascii")[:11].ljust(11)
+        self.root = {"name": "", "dir": True, "children": {}}
+        self.stamp = _fat_stamp()
+
+    def _node(self, path, create_dirs=True):
+        node = self.root
+        for comp in [c for c in path.split("/") if c][:-1]:
+            child = node["children"].get(comp.upper())
+            if child is None:
+                if not create_dirs:
+                    return None, comp
+                child = node["children"][comp.upper()] = {"name": comp, "dir": True,
+                                                         "children": {}}
+            if not child["dir"]:
+                raise ValueError(f"{path}: {comp} is a file")
+            node = child
+        return node, [c for c in path.split("/") if c][-1]
+
+    def add_dir(self, path):
+        parent, name = self._node(path)
+        existing = parent["children"].get(name.upper())
+        if existing and not existing["dir"]:
+            raise ValueError(f"{path} already exists as a file")
+        if not existing:
+            parent["children"][name.upper()] = {"name": name, "dir": True, "children": {}}
+
+    def add_file(self, path, size, extents=None, data=None):
+        parent, name = self._node(path)
+        if name.upper() in parent["children"]:
+            raise ValueError(f"{path} clashes with an existing name on FAT")
+        parent["children"][name.upper()] = {"name": name, "dir": False, "size": size,
+                                            "extents": extents, "data": data}
+
+    def _dir_entries(self, node):
+        """Short names and entry bytes for node's children (clusters filled in later)."""
+        taken = set()
+        items = []
+        for child in node["children"].values():
+            short, lfn = _fat_short_name(child["name"], taken)
+            child["short"] = short
+            items.append((child, _fat_lfn_entries(child["name"], short) if lfn else b""))
+        node["items"] = items
+        n = (1 if node is self.root else 2) + sum(len(l) // 32 + 1 for _, l in items)
+        return n * 32
+
+    def write(self, dst_fd, size_bytes, src_fd=None, hidden_sectors=0, progress_cb=None):
+        """Write the filesystem to dst_fd (a partition or image file of
+        size_bytes).  progress_cb(done, total) gets bytes written.  Raises
+        ValueError if the files do not fit."""
+        spc = fat_cluster_size(size_bytes) // 512
+        csize = spc * 512
+        total_sectors = min(size_bytes // 512, 0xFFFFFFFF)
+        fat_sectors = 1
+        while True:
+            clusters = (total_sectors - FAT_RESERVED_SECTORS - 2 * fat_sectors) // spc
+            need = ((clusters + 2) * 4 + 511) // 512
+            if need <= fat_sectors:
+                break
+            fat_sectors = need
+        if clusters < 65525:
+            raise ValueError(f"{size_bytes} bytes is too small for FAT32")
+
+        # allocate: directories breadth-first, then files in on-disc order
+        dirs, files, pending = [], [], [self.root]
+        while pending:
+            node = pending.pop(0)
+            dirs.append(node)
+            node["bytes"] = self._dir_entries(node)
+            for child, _ in node["items"]:
+                (pending if child["dir"] else files).append(child)
+        files.sort(key=lambda f: f["extents"][0][0] if f.get("extents") else 1 << 62)
+        nxt = 2
+        order = []
+        for node in dirs + files:
+            length = node["bytes"] if node["dir"] else node["size"]
+            node["clusters"] = (length + csize - 1) // csize
+            node["cluster"] = nxt if node["clusters"] else 0
+            nxt += node["clusters"]
+            if node["clusters"]:
+                order.append(node)
+        used = nxt - 2
+        if used > clusters:
+            raise ValueError(f"files need {used * csize} bytes, the volume holds "
+                             f"{clusters * csize}")
+
+        fat = array.array("I", bytes(4 * (clusters + 2)))
+        fat[0], fat[1] = 0x0FFFFFF8, FAT_EOC
+        for node in order:
+            s, n = node["cluster"], node["clusters"]
+            fat[s:s + n - 1] = array.array("I", range(s + 1, s + n))
+            fat[s + n - 1] = FAT_EOC
+        if sys.byteorder != "little":
+            fat.byteswap()
+        fat_bytes = fat.tobytes()
+        fat_bytes += bytes(fat_sectors * 512 - len(fat_bytes))
+
+        boot = bytearray(512)
+        boot[0:3] = b"\xeb\x58\x90"
+        boot[3:11] = b"MSWIN4.1"
+        struct.pack_into("<HBHBHHBHHHII", boot, 11, 512, spc, FAT_RESERVED_SECTORS, 2,
+                         0, 0, 0xF8, 0, 32, 64, hidden_sectors, total_sectors)
+        struct.pack_into("<IHHIHH", boot, 36, fat_sectors, 0, 0, 2, 1, 6)
+        struct.pack_into("<BBBI11s8s", boot, 64, 0x80, 0, 0x29,
+                         int(time.time()) & 0xFFFFFFFF, self.label, b"FAT32   ")
+        boot[510:512] = b"\x55\xaa"
+        fsinfo = bytearray(512)
+        struct.pack_into("<I", fsinfo, 0, 0x41615252)
+        struct.pack_into("<III", fsinfo, 484, 0x61417272, clusters - used, nxt)
+        struct.pack_into("<I", fsinfo, 508, 0xAA550000)
+        reserved = bytearray(FAT_RESERVED_SECTORS * 512)
+        for sector, data in ((0, boot), (1, fsinfo), (6, boot), (7, fsinfo)):
+            reserved[sector * 512:(sector + 1) * 512] = data
+
+        total = len(reserved) + 2 * len(fat_bytes) + sum(n["clusters"] for n in order) * csize
+        done = [0]
+
+        def progress(n):
+            done[0] += n
+            if progress_cb:
+                progress_cb(done[0], total)
+
+        out = _SeqWriter(dst_fd, progress)
+        out.write(reserved)
+        out.write(fat_bytes)
+        out.write(fat_bytes)
+        for node in order:
+            if node["dir"]:
+                out.write(self._render_dir(node))
+                length = node["bytes"]
+            else:
+                if node.get("data") is not None:
+                    out.write(node["data"])
+                else:
+                    out.copy(src_fd, node["extents"])
+                length = node["size"]
+            out.zeros(node["clusters"] * csize - length)
+        out.flush()
+        os.fsync(dst_fd)
+
+    def _render_dir(self, node):
+        parts = []
+        if node is self.root:
+            parts.append(_fat_dirent(self.label, 0x08, 0, 0, self.stamp))
+        else:
+            parent = node["parent_cluster"]
+            parts.append(_fat_dirent(b".          ", 0x10, node["cluster"], 0, self.stamp))
+            parts.append(_fat_dirent(b"..         ", 0x10, parent, 0, self.stamp))
+        for child, lfn in node["items"]:
+            if child["dir"]:
+                child["parent_cluster"] = 0 if node is self.root else node["cluster"]
+            parts.append(lfn)
+            parts.append(_fat_dirent(child["short"], 0x10 if child["dir"] else 0x20,
+                                     child["cluster"], 0 if child["dir"] else child["size"],
+                                     self.stamp))
+        return b"".join(parts)
+
+def payload_boot_gb(plan):
+    """GiB of FAT32 that hold plan's files, cluster slack included, with a
+    little room to spare."""
+    csize = fat_cluster_size(MIN_BOOT_GB * GiB)
+    need = (sum(-(-f["size"] // csize) * csize for f in plan["files"])
+            + len(plan["dirs"]) * csize)
+    return max(1, -(-int(need * 1.05 + (256 << 20)) // GiB))
+
+
+def fat_image_from_plan(plan, label="LINUX_LIVE"):
+    """A Fat32Image holding the files of an ISO copy plan (see iso_copy_plan)."""
+    img = Fat32Image(label)
+    for d in plan["dirs"]:
+        img.add_dir(d)
+    for f in plan["files"]:
+        img.add_file(f["path"], f["size"], extents=f["extents"], data=f.get("data"))
+    return img
+
+
+def partition_start_sector(dev):
+    """Start sector of a partition from sysfs, 0 for whole disks and files."""
+    try:
+        with open(f"/sys/class/block/{os.path.basename(os.path.realpath(dev))}/start") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+# ─── ISO loopback boot ───────────────────────────────────────────────────────
+
+LOOPBACK_GRUB_SCRIPT = "/etc/grub.d/42_linux_live"
+
+
+def loopback_boot_gb(iso_bytes):
+    """GiB of ext4 needed to hold one ISO of iso_bytes plus filesystem overhead."""
+    return -(-int(iso_bytes * 1.03 + (256 << 20)) // GiB)
+
+
+def loopback_grub_entry(title, fs_uuid, iso_name, spec, label=""):
+    """A GRUB menuentry that loop-mounts /iso_name from the filesystem with
+    fs_uuid and boots the live system inside it with spec's kernel, initrd
+    and arguments ({iso} and {label} are filled in)."""
+    iso = "/" + iso_name
+    args = spec["args"].format(iso=iso, label=label)
+    title = title.replace("'", "'\\''")
+    return (f"menuentry '{title}' --class gnu-linux {{\n"
+            "\tinsmod part_gpt\n\tinsmod part_msdos\n\tinsmod ext2\n"
+            "\tinsmod loopback\n\tinsmod iso9660\n"
+            f"\tsearch --no-floppy --fs-uuid --set=root {fs_uuid}\n"
+            f"\tloopback loop {iso}\n"
+            f"\tlinux (loop)/{spec['kernel']} {args}\n"
+            f"\tinitrd (loop)/{spec['initrd']}\n"
+            "}\n")
+
+
+def write_loopback_grub_script(entry, path=LOOPBACK_GRUB_SCRIPT):
+    """Install entry as a grub.d script that update-grub copies verbatim."""
+    with open(path, "w") as f:
+        f.write("#!/bin/sh\nexec tail -n +3 $0\n" + entry)
+    os.chmod(path, 0o755)
+
+# ─── partition table reader ──────────────────────────────────────────────────
+#
+# GPT (header and entry array CRC-checked, falling back to the backup copy at
+# the end of the disk) and MBR with its chain of extended boot records, read
+# straight from the block device or an image file.  Offsets are kept in
+# sectors; get_disk_partitions turns them into the MiB dicts the rest of the
+# installer uses.
+
+BLKSSZGET        = 0x1268       # _IO(0x12, 104): logical sector size
+GPT_SIGNATURE    = b"EFI PART"
+GPT_ESP_GUID     = "c12a7328-f81f-11d2-ba4b-00a0c93ec93b"
+GPT_FLAG_TYPES   = {GPT_ESP_GUID: ("boot", "esp"),
+                    "21686148-6449-6e6f-744e-656564454649": ("bios_grub",),
+                    "e3c9e316-0b5c-4db8-817d-f92df00215ae": ("msftres",)}
+MBR_EXTENDED_TYPES = ("0x5", "0xf", "0x85")
+
+# start/end are sectors, end exclusive; type is a GPT type GUID or an MBR
+# type byte as "0x83"; flags are parted's names
+PartEntry = collections.namedtuple("PartEntry", "num start end type name flags")
+# first/last bound the usable sectors (last exclusive); free is a list of
+# (start, end) gaps between them
+PartTable = collections.namedtuple("PartTable", "label sector sectors first last parts free")
+
+
+def part_flags(ptype, active=False):
+    """parted's flag names for a partition of type ptype."""
+    flags = ("boot",) if active else ()
+    if ptype == "0xef":
+        return ("boot", "esp")
+    return flags + tuple(f for f in GPT_FLAG_TYPES.get(ptype, ()) if f not in flags)
+
+
+def table_free(label, parts, first, last):
+    """Gaps between first and last not covered by a partition.  Logical MBR
+    partitions sit inside the extended one, so only primaries count."""
+    free, pos = [], first
+    top = [p for p in parts if label != "msdos" or p.num <= 4]
+    for p in sorted(top, key=lambda p: p.start):
+        if p.start > pos:
+            free.append((pos, p.start))
+        pos = max(pos, p.end)
+    if last > pos:
+        free.append((pos, last))
+    return free
+
+
+def _read_gpt(f, sector, sectors, lba):
+    """(first, last, parts) from the GPT header at lba, or None if the header
+    or its entry array fails the CRC check."""
+    f.seek(lba * sector)
+    hdr = f.read(sector)
+    if len(hdr) < 92 or hdr[:8] != GPT_SIGNATURE:
+        return None
+    hsize, hcrc, my_lba, _alt, first, last = struct.unpack_from("<II4xQQQQ", hdr, 12)
+    if not 92 <= hsize <= sector or my_lba != lba:
+        return None
+    if zlib.crc32(hdr[:16] + b"\0\0\0\0" + hdr[20:hsize]) != hcrc:
+        return None
+    ent_lba, count, esize, ecrc = struct.unpack_from("<QIII", hdr, 72)
+    if esize < 128 or count > 4096 or ent_lba >= sectors:
+        return None
+    f.seek(ent_lba * sector)
+    ents = f.read(count * esize)
+    if len(ents) != count * esize or zlib.crc32(ents) != ecrc:
+        return None
+    parts = []
+    for i in range(count):
+        e = ents[i * esize:(i + 1) * esize]
+        if not any(e[:16]):
+            continue
+        start, end = struct.unpack_from("<QQ", e, 32)
+        ptype = str(uuid.UUID(bytes_le=e[:16]))
+        name = e[56:128].decode("utf-16-le", "replace").split("\0")[0]
+        parts.append(PartEntry(i + 1, start, end + 1, ptype, name, part_flags(ptype)))
+    return first, last + 1, parts
+
+
+def _read_mbr(f, sector, sectors, mbr):
+    """Partitions of a DOS label, following the extended boot record chain."""
+    def entries(buf):
+        for i in range(4):
+            status, ptype, start, count = struct.unpack_from("<B3xB3xII", buf, 446 + 16 * i)
+            yield i, status, ptype, start, count
+
+    parts = []
+    for i, status, ptype, start, count in entries(mbr):
+        if not ptype or not count:
+            continue
+        ptype = f"{ptype:#x}"
+        parts.append(PartEntry(i + 1, start, start + count, ptype, "",
+                               part_flags(ptype, status == 0x80)))
+        if ptype not in MBR_EXTENDED_TYPES:
+            continue
+        ext, ebr, num, seen = start, start, 5, set()
+        while ebr and ebr not in seen and ebr < sectors and num < 5 + 128:
+            seen.add(ebr)
+            f.seek(ebr * sector)
+            buf = f.read(sector)
+            if len(buf) < 512 or buf[510:512] != b"\x55\xaa":
+                break
+            nxt = 0
+            for j, st, t, s, c in entries(buf):
+                if not t or not c:
+                    continue
+                if f"{t:#x}" in MBR_EXTENDED_TYPES:
+                    nxt = ext + s
+                elif j == 0:
+                    lt = f"{t:#x}"
+                    parts.append(PartEntry(num, ebr + s, ebr + s + c, lt, "",
+                                           part_flags(lt, st == 0x80)))
+                    num += 1
+            ebr = nxt
+    return parts
+
+
+def read_partition_table(path):
+    """PartTable of the disk or image at path, or None if it has no label
+    this reader trusts (unreadable, corrupt GPT, not partitioned)."""
+    try:
+        with open(path, "rb", buffering=0) as f:
+            try:
+                sector = struct.unpack("I", fcntl.ioctl(f.fileno(), BLKSSZGET,
+                                                        struct.pack("I", 0)))[0]
+            except OSError:
+                sector = 512            # image file
+            sectors = f.seek(0, os.SEEK_END) // sector
+            f.seek(0)
+            mbr = f.read(sector)
+            if len(mbr) < 512 or mbr[510:512] != b"\x55\xaa":
+                return None
+            types = [mbr[446 + 16 * i + 4] for i in range(4)]
+            if 0xee in types:
+                gpt = (_read_gpt(f, sector, sectors, 1)
+                       or _read_gpt(f, sector, sectors, sectors - 1))
+                if gpt is None:
+                    return None
+                first, last, parts = gpt
+                label = "gpt"
+            else:
+                # a FAT boot sector also ends in 55aa; its "status" bytes
+                # are not 0x00/0x80
+                if any(mbr[446 + 16 * i] not in (0, 0x80) for i in range(4)):
+                    return None
+                parts = _read_mbr(f, sector, sectors, mbr)
+                first, last, label = 1, sectors, "msdos"
+    except OSError:
+        return None
+    parts.sort(key=lambda p: p.start)
+    return PartTable(label, sector, sectors, first, last, parts,
+                     table_free(label, parts, first, last))
+
+
+def legacy_partitions(table, fstypes=None):
+    """(partitions, label, size_mib) dicts, as get_disk_partitions returns,
+    from a PartTable.  The strategies work in whole MiB, so free gaps are
+    rounded inward to MiB boundaries and left out when no whole MiB remains
+    (alignment padding); fstypes maps partition numbers to filesystem types."""
+    mib = 1 << 20
+    out = []
+    for start, end, num, flags, name in sorted(
+            [(p.start, p.end, p.num, ", ".join(p.flags), p.name) for p in table.parts]
+            + [(s, e, 0, "", "") for s, e in table.free]):
+        start_b, end_b = start * table.sector, end * table.sector
+        start_mib, end_mib = start_b // mib, end_b // mib
+        if num == 0:
+            start_mib = -(-start_b // mib)
+            if end_mib <= start_mib:
+                continue
+        out.append({"num": num, "start_mib": start_mib, "end_mib": end_mib,
+                    "size_mib": end_mib - start_mib if num == 0 else (end_b - start_b) // mib,
+                    "fstype": (fstypes or {}).get(num, ""), "name": name,
+                    "flags": flags, "is_free": num == 0})
+    return out, table.label, table.sectors * table.sector // mib
+
+# ─── disk enumeration helpers ────────────────────────────────────────────────
+#
+# One DiskInventory snapshot answers every question the disk plan dialog asks:
+# disks and partitions from a single `lsblk --json -b -O`, partition offsets
+# from sysfs and mountpoints from /proc/self/mountinfo.  The get_* helpers
+# below query a snapshot they are handed, or take a fresh one.
+
+SYS_CLASS_BLOCK = "/sys/class/block"
+
+
+def _sysfs_int(name, attr):
+    """Integer from /sys/class/block/<name>/<attr>, or None."""
+    try:
+        with open(os.path.join(SYS_CLASS_BLOCK, name, attr)) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+class DiskInventory:
+    """Snapshot of disks, partitions, filesystems, mounts and free regions."""
+
+    def __init__(self):
+        self.disks = []         # [{name, path, size_bytes, model}]
+        self.devices = {}       # /dev path -> lsblk record
+        self.layouts = {}       # disk path -> (partitions, label, size_mib)
+        self.mounts = []        # read_mountinfo()
+        self._entries = {}      # disk path -> (disk, devices, layout)
+        self.ok = False         # the full lsblk --json listing worked
+        self.refresh()
+
+    def refresh(self, disks=None):
+        """Re-read lsblk, sysfs and mountinfo – only for the disk paths in
+        disks if given, keeping the rest of the snapshot."""
+        self.mounts = read_mountinfo()
+        # Bytes, not text: a model string or label that is not valid UTF-8
+        # must not lose the whole snapshot.  With several disks named, lsblk
+        # still reports the ones that exist when another has gone.
+        code, out, _ = run(["lsblk", "--json", "-b", "-O"] + list(disks or []),
+                           text=False)
+        try:
+            data = json.loads(out.decode("utf-8", "replace")) if out else {}
+        except ValueError:
+            data = {}
+        found = {}
+        for dev in data.get("blockdevices", []):
+            if dev.get("type") != "disk":
+                continue
+            path = dev.get("path") or f"/dev/{dev['name']}"
+            devices = {path: dev}
+            children = []
+            stack = list(dev.get("children") or [])
+            while stack:
+                child = stack.pop()
+                cpath = child.get("path") or f"/dev/{child['name']}"
+                devices.setdefault(cpath, child)
+                if child.get("type") == "part":
+                    children.append(child)
+                stack.extend(child.get("children") or [])
+            found[path] = ({"name": dev["name"],
+                            "path": path,
+                            "size_bytes": int(dev.get("size") or 0),
+                            "model": (dev.get("model") or "").strip()},
+                           devices, self._layout(dev, children))
+        if disks is None:
+            self.ok = code == 0 and "blockdevices" in data
+            entries = found
+        else:
+            entries = dict(self._entries)
+            for path in disks:
+                entries.pop(path, None)
+            entries.update(found)
+        self._entries = entries
+        self.disks = [e[0] for e in entries.values()]
+        self.devices = {p: d for e in entries.values() for p, d in e[1].items()}
+        self.layouts = {p: e[2] for p, e in entries.items()}
+
+    def updated(self, disks=()):
+        """A copy of the snapshot with the disk paths in disks re-read, or
+        only the mounts if there are none.  This snapshot is left as it is,
+        so threads still reading it see one consistent state."""
+        inv = copy.copy(self)
+        if disks:
+            inv.refresh(disks)
+        else:
+            inv.mounts = read_mountinfo()
+        return inv
+
+    def _layout(self, disk, children):
+        """(partitions, label, size_mib) in get_disk_partitions' shape,
+        including the free regions between partitions."""
+        size = int(disk.get("size") or 0)
+        sector = int(disk.get("log-sec") or 512)
+        if not disk.get("pttype") and not children:
+            return [], "gpt", 0     # no partition table: what parted reports
+        label = {"dos": "msdos", None: "gpt"}.get(disk.get("pttype"),
+                                                   disk.get("pttype"))
+        parts, fstypes = [], {}
+        for child in children:
+            ck = child.get("kname") or child["name"]
+            num = _sysfs_int(ck, "partition") or 0
+            # sysfs start/size are always in 512-byte units
+            start = _sysfs_int(ck, "start")
+            if start is None:
+                start = child.get("start")
+            if start is None:
+                continue
+            ptype = (child.get("parttype") or "").lower()
+            active = (child.get("partflags") or "").lower() == "0x80"
+            parts.append(PartEntry(num, start, start + int(child.get("size") or 0) // 512,
+                                   ptype, child.get("partlabel") or "",
+                                   part_flags(ptype, active)))
+            fstypes[num] = child.get("fstype") or ""
+        # An extended partition reports a token size; it really spans its
+        # logical partitions.
+        if label == "msdos":
+            end = max([p.end for p in parts if p.num > 4], default=0)
+            parts = [p._replace(end=max(p.end, end)) if p.type in MBR_EXTENDED_TYPES
+                     else p for p in parts]
+        if label == "gpt":
+            first, last = (2 * sector + 16384) // 512, (size - sector - 16384) // 512
+        else:
+            first, last = sector // 512, size // 512
+        table = PartTable(label, 512, size // 512, first, last, parts,
+                          table_free(label, parts, first, last))
+        return legacy_partitions(table, fstypes)
+
+    def partitions(self, disk_path):
+        """(partitions, label, size_mib) for disk_path, or None if the disk
+        is not in the snapshot."""
+        return self.layouts.get(disk_path)
+
+    def fstype(self, dev_path):
+        """Filesystem type on dev_path, or ""."""
+        return (self.devices.get(dev_path) or {}).get("fstype") or ""
+
+    def find_label(self, label):
+        """First device whose filesystem label or partition name is label."""
+        for path, dev in self.devices.items():
+            if dev.get("type") == "part" and label in (dev.get("label"),
+                                                        dev.get("partlabel")):
+                return path
+        return None
 
-def get_all_disks():
-    """Return list of dicts with disk info: name, path, size_bytes, model, partitions."""
-    code, out, _ = run(["lsblk", "-b", "-n", "-d", "-o", "NAME,SIZE,MODEL,TYPE", "--json"])
+    def mountpoint(self, dev_path):
+        """Where dev_path is mounted – its top-level mount if it has several
+        (btrfs subvolumes) – or None."""
+        return mount_target(dev_path, self.mounts)
+
+    def usage(self, dev_path):
+        """(total_bytes, free_bytes) of the mounted filesystem on dev_path,
+        or (None, None)."""
+        mountpoint = self.mountpoint(dev_path)
+        return fs_usage(mountpoint) if mountpoint else (None, None)
+
+def get_all_disks(inv=None):
+    """Return list of dicts with disk info: name, path, size_bytes, model."""
+    inv = inv or DiskInventory()
+    if inv.ok:
+        return list(inv.disks)
+    # lsblk without --json or -O support: the plain listing still names the disks
+    code, out, _ = run(["lsblk", "-b", "-n", "-d", "-o", "NAME,SIZE,TYPE,MODEL"])
     if code != 0:
-        # Fallback without JSON
-        code, out, _ = run(["lsblk", "-b", "-n", "-d", "-o", "NAME,SIZE,MODEL,TYPE"])
-        if code != 0:
-            return []
-        disks = []
-        for line in out.splitlines():
-            parts = line.split(None, 3)
-            if len(parts) >= 4 and parts[3].strip() == "disk":
-                disks.append({
-                    "name": parts[0],
-                    "path": f"/dev/{parts[0]}",
-                    "size_bytes": int(parts[1]),
-                    "model": parts[2] if len(parts) > 2 else "",
-                })
-        return disks
-
-    data = json.loads(out)
+        return []
     disks = []
-    for dev in data.get("blockdevices", []):
-        if dev.get("type") != "disk":
-            continue
-        disks.append({
-            "name": dev["name"],
-            "path": f"/dev/{dev['name']}",
-            "size_bytes": int(dev.get("size", 0)),
-            "model": (dev.get("model") or "").strip(),
-        })
+    for line in out.splitlines():
+        parts = line.split(None, 3)
+        if len(parts) >= 3 and parts[2] == "disk":
+            disks.append({
+                "name": parts[0],
+                "path": f"/dev/{parts[0]}",
+                "size_bytes": int(parts[1]),
+                "model": parts[3].strip() if len(parts) > 3 else "",
+            })
     return disks
 
 
-def get_disk_partitions(disk_path):
-    """Return list of partition dicts from parted for a disk.
-    Each dict has: num, start_mib, end_mib, size_mib, fstype, name, flags, is_free."""
+def get_disk_partitions(disk_path, inv=None):
+    """Return (partitions, disk_label, disk_size_mib) for a disk.
+    Each partition dict has: num, start_mib, end_mib, size_mib, fstype, name,
+    flags, is_free.  inv is a DiskInventory snapshot or a DiskCache; without
+    one the partition table is read from the disk itself.  parted is the
+    fallback for labels the reader does not handle."""
+    if inv is not None:
+        layout = inv.partitions(disk_path)
+        if layout is not None:
+            return layout
+    table = read_partition_table(disk_path)
+    if table is not None:
+        return legacy_partitions(table)
+    return _parted_partitions(disk_path)
+
+
+def _parted_partitions(disk_path):
+    """get_disk_partitions via `parted -m … print free`."""
     code, out, _ = run(["parted", "-m", disk_path, "unit", "MiB", "print", "free"])
     if code != 0:
         return [], "gpt", 0
@@ -256,32 +2995,29 @@ def get_disk_partitions(disk_path):
     return partitions, disk_label, disk_size_mib
 
 
-def get_partition_fstype(dev_path):
-    """Get filesystem type for a partition device (e.g. /dev/sdb1)."""
+def get_partition_fstype(dev_path, inv=None):
+    """Get filesystem type for a partition device (e.g. /dev/sdb1).  Without
+    a snapshot blkid probes the device, so a filesystem made a moment ago
+    is seen."""
+    if inv is not None:
+        return inv.fstype(dev_path)
     code, out, _ = run(["blkid", "-o", "value", "-s", "TYPE", dev_path])
     if code == 0 and out.strip():
         return out.strip()
     return ""
 
 
-def get_partition_usage(dev_path):
-    """Get total and free bytes for a mounted or mountable partition."""
-    # Check if mounted
-    code, out, _ = run(["findmnt", "-n", "-o", "TARGET", dev_path])
-    if code == 0 and out.strip():
-        mountpoint = out.strip()
-        code2, df_out, _ = run(["df", "--block-size=1", "--output=size,avail", mountpoint])
-        if code2 == 0:
-            for line in df_out.strip().splitlines():
-                parts = line.split()
-                if parts and parts[0].isdigit():
-                    return int(parts[0]), int(parts[1])
-    return None, None
+def get_partition_usage(dev_path, inv=None):
+    """Get total and free bytes for a mounted partition."""
+    if inv is not None:
+        return inv.usage(dev_path)
+    mountpoint = mount_target(dev_path)
+    return fs_usage(mountpoint) if mountpoint else (None, None)
 
 
-def get_disk_unallocated_mib(disk_path):
+def get_disk_unallocated_mib(disk_path, inv=None):
     """Return total unallocated MiB on a disk."""
-    parts, _, disk_size_mib = get_disk_partitions(disk_path)
+    parts, _, disk_size_mib = get_disk_partitions(disk_path, inv)
     total = 0
     for p in parts:
         if p["is_free"] and p["size_mib"] > 1:
@@ -296,9 +3032,10 @@ def get_disk_unallocated_mib(disk_path):
     return total
 
 
-def get_disk_layout_text(disk_path):
+def get_disk_layout_text(disk_path, inv=None):
     """Return list of text lines describing partition layout of a disk."""
-    parts, label, total_mib = get_disk_partitions(disk_path)
+    inv = inv or DiskInventory()
+    parts, label, total_mib = get_disk_partitions(disk_path, inv)
     lines = []
     if not parts:
         lines.append(f"  [Empty disk]  {round(total_mib / 1024, 2)} GB")
@@ -312,7 +3049,7 @@ def get_disk_layout_text(disk_path):
             continue
         # Build label
         dev_path = _part_dev_path(disk_path, p["num"])
-        fstype = get_partition_fstype(dev_path)
+        fstype = inv.fstype(dev_path) or p["fstype"]
         name = p["name"] or ""
         flags = p["flags"] or ""
 
@@ -325,12 +3062,10 @@ def get_disk_layout_text(disk_path):
         else:
             label_str = "Partition            "
 
-        # Check for mountpoint
-        code, mnt_out, _ = run(["findmnt", "-n", "-o", "TARGET", dev_path])
+        mountpoint = inv.mountpoint(dev_path)
         mount_info = ""
-        if code == 0 and mnt_out.strip():
-            mountpoint = mnt_out.strip()
-            total, free = get_partition_usage(dev_path)
+        if mountpoint:
+            total, free = inv.usage(dev_path)
             if total and free:
                 mount_info = f"  [mounted: {mountpoint}, Free: {round(free / 1e9, 2)} GB]"
             else:
@@ -379,6 +3114,207 @@ def _ntfs_info(dev_path):
         return current_size, free
     return None, None
 
+# ─── disk change watcher ─────────────────────────────────────────────────────
+#
+# DiskCache keeps a DiskInventory and per-disk partition tables for the life
+# of the window.  A thread listens for kernel uevents on a netlink socket;
+# a block event drops only the affected disk's entries, and settle() waits
+# for a disk's events to stop rather than sleeping a fixed time after
+# partprobe.  Without the socket every query goes to the disk as before.
+
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_KERNEL_GROUP    = 1
+UEVENT_QUIET_SECS      = 0.5    # a disk with no events for this long has settled
+
+
+def parse_uevent(msg):
+    """{KEY: value} of a kernel uevent datagram ("add@/devices/…\\0ACTION=add\\0…"),
+    or None for anything else."""
+    fields = msg.split(b"\0")
+    if b"@" not in fields[0]:
+        return None
+    ev = {}
+    for f in fields[1:]:
+        key, sep, value = f.partition(b"=")
+        if sep:
+            ev[key.decode("ascii", "replace")] = value.decode("utf-8", "replace")
+    return ev
+
+
+def uevent_disk(ev):
+    """Name of the disk a block uevent concerns (sdb for sdb3), or None."""
+    devpath = ev.get("DEVPATH", "")
+    if ev.get("SUBSYSTEM") != "block" or not devpath:
+        return None
+    if ev.get("DEVTYPE") == "partition":
+        devpath = os.path.dirname(devpath)
+    return os.path.basename(devpath)
+
+
+class DiskCache:
+    """DiskInventory and partition tables kept until a uevent says a disk
+    changed."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._inv = None
+        self._stale = set()       # disk names changed since _inv was taken
+        self._tables = {}         # disk path -> get_disk_partitions result
+        self._gen = collections.Counter()   # disk name -> uevents seen
+        self._epoch = 0           # invalidations of every disk
+        self._last_event = {}     # disk name -> monotonic time of last uevent
+        self.listening = self._listen()
+
+    def _listen(self):
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC,
+                                 NETLINK_KOBJECT_UEVENT)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            sock.bind((0, UEVENT_KERNEL_GROUP))
+        except (OSError, AttributeError):
+            return False
+        threading.Thread(target=self._read_events, args=(sock,), daemon=True).start()
+        return True
+
+    def _read_events(self, sock):
+        while True:
+            try:
+                msg = sock.recv(65536)
+            except OSError as e:
+                # ENOBUFS: events were dropped, so nothing cached can be trusted
+                self.invalidate()
+                if e.errno == errno.ENOBUFS:
+                    continue
+                with self._cond:
+                    self.listening = False
+                sock.close()
+                return
+            ev = parse_uevent(msg)
+            disk = uevent_disk(ev) if ev else None
+            if disk:
+                self.invalidate(disk)
+
+    def invalidate(self, disk=None):
+        """Forget what is cached about disk (a name such as "sdb"), or about
+        every disk."""
+        with self._cond:
+            if disk is None:
+                self._inv = None
+                self._tables.clear()
+                self._epoch += 1
+            else:
+                self._drop(disk)
+                self._last_event[disk] = time.monotonic()
+            self._cond.notify_all()
+
+    def _drop(self, disk):
+        self._stale.add(disk)
+        self._tables.pop(f"/dev/{disk}", None)
+        self._gen[disk] += 1
+
+    def generation(self, disk_path):
+        """A value that changes whenever what is cached about disk_path is
+        dropped."""
+        with self._cond:
+            return self._epoch, self._gen[os.path.basename(disk_path)]
+
+    def inventory(self):
+        """A DiskInventory with the disks that changed since the last call
+        re-read.  Mounts raise no block events, so they are always re-read.
+        lsblk runs outside the lock, and a new snapshot replaces the cached
+        one rather than changing it under threads still reading it."""
+        with self._cond:
+            if not self.listening:
+                base = None
+            else:
+                base, stale = self._inv, sorted(self._stale)
+                epoch, gens = self._epoch, collections.Counter(self._gen)
+        if base is None:
+            inv = DiskInventory()
+        else:
+            inv = base.updated([f"/dev/{d}" for d in stale])
+        if not self.listening:
+            return inv
+        with self._cond:
+            # an event during the read leaves its disk stale; a full
+            # invalidation or a newer snapshot wins over this one
+            if self._epoch == epoch and self._inv is base:
+                self._inv = inv
+                self._stale = {d for d in self._stale if self._gen[d] != gens[d]}
+        return inv
+
+    def partitions(self, disk_path):
+        """get_disk_partitions result for disk_path read from the partition
+        table, or None if it has none this reader trusts."""
+        name = os.path.basename(disk_path)
+        with self._cond:
+            if self.listening and disk_path in self._tables:
+                return self._tables[disk_path]
+            gen = self._epoch, self._gen[name]
+        table = read_partition_table(disk_path)
+        layout = legacy_partitions(table) if table else None
+        with self._cond:
+            # an event while reading means the table may be half-written
+            if (self.listening and layout is not None
+                    and (self._epoch, self._gen[name]) == gen):
+                self._tables[disk_path] = layout
+        return layout
+
+    def settle(self, disk_path, devices=(), timeout=10, fallback=1):
+        """Wait until disk_path has had no uevents for UEVENT_QUIET_SECS and
+        every path in devices exists, up to timeout seconds.  Without the
+        uevent socket, sleep fallback seconds.  What was cached about the disk
+        is dropped either way – not every table change raises an event (a
+        BLKPG resize does not).  Returns whether devices all exist."""
+        if not self.listening:
+            time.sleep(fallback)
+            return all(os.path.exists(d) for d in devices)
+        name = os.path.basename(disk_path)
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                quiet = now - max(start, self._last_event.get(name, 0))
+                present = all(os.path.exists(d) for d in devices)
+                if (quiet >= UEVENT_QUIET_SECS and present) or now - start >= timeout:
+                    self._drop(name)
+                    return present
+                self._cond.wait(max(0.05, UEVENT_QUIET_SECS - quiet))
+
+# ─── UI progress bus ─────────────────────────────────────────────────────────
+
+class ProgressBus:
+    """Coalesce widget updates posted from worker threads.
+
+    Only the latest arguments per setter are kept, and pending updates reach
+    the GTK main loop at most `rate` times a second.  The last value posted
+    is always delivered."""
+
+    def __init__(self, rate=PROGRESS_UPDATES_PER_SEC):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._pending = {}        # setter → latest args
+        self._scheduled = False
+        self._last = 0.0
+
+    def post(self, setter, *args):
+        with self._lock:
+            self._pending[setter] = args
+            if self._scheduled:
+                return
+            self._scheduled = True
+            delay = max(0.0, self._last + self.interval - time.monotonic())
+        GLib.timeout_add(int(delay * 1000), self._flush)
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._scheduled = False
+            self._last = time.monotonic()
+        for setter, args in pending.items():
+            setter(*args)
+        return False
+
 # ─── application ─────────────────────────────────────────────────────────────
 
 class InstallerApp(Gtk.Application):
@@ -403,6 +3339,9 @@ class InstallerWindow(Gtk.ApplicationWindow):
         self.fs_info = None
         self.running = False
         self.cancel_restart = False
+        self.peer_server = None
+        self.ui = ProgressBus()
+        self.disk_cache = DiskCache()
 
         self._apply_css()
         self._build_ui()
@@ -639,6 +3578,19 @@ class InstallerWindow(Gtk.ApplicationWindow):
         left = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
         self.delete_check = Gtk.CheckButton(label="Delete ISO after installation")
         left.pack_start(self.delete_check, False, False, 0)
+        self.stream_check = Gtk.CheckButton(
+            label="Stream ISO straight to the boot partition (no cached copy)")
+        left.pack_start(self.stream_check, False, False, 0)
+        self.loopback_check = Gtk.CheckButton(
+            label="Boot the ISO file directly (one file on an ext4 partition, via GRUB)")
+        left.pack_start(self.loopback_check, False, False, 0)
+        self.minimal_check = Gtk.CheckButton(
+            label="Copy only what the live system needs (skip offline package pools)")
+        left.pack_start(self.minimal_check, False, False, 0)
+        self.share_check = Gtk.CheckButton(
+            label="Share cached ISOs with other machines on this network, and use theirs")
+        self.share_check.connect("toggled", self._on_share_toggled)
+        left.pack_start(self.share_check, False, False, 0)
         self.restart_check = Gtk.CheckButton(label="Update GRUB and restart")
         self.restart_check.set_active(True)
         left.pack_start(self.restart_check, False, False, 0)
@@ -661,6 +3613,18 @@ class InstallerWindow(Gtk.ApplicationWindow):
         if btn.get_active():
             self.selected_distro = key
 
+    def _on_share_toggled(self, btn):
+        if btn.get_active():
+            try:
+                self.peer_server = PeerCacheServer(log=self.log).start()
+            except OSError as e:
+                self.log(f"Cannot share cached ISOs: {e}", error=True)
+                btn.set_active(False)
+        elif self.peer_server:
+            self.peer_server.stop()
+            self.peer_server = None
+            self.log("Stopped sharing cached ISOs")
+
     def _on_custom_toggled(self, btn):
         on = btn.get_active()
         self.custom_entry.set_sensitive(on)
@@ -712,7 +3676,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
         )
 
         # Check if there are other disks available
-        all_disks = get_all_disks()
+        all_disks = get_all_disks(self.disk_cache.inventory())
         root_disk_path = ""
         if dev:
             disk_d, _ = self._resolve_disk_and_part(dev)
@@ -757,24 +3721,72 @@ class InstallerWindow(Gtk.ApplicationWindow):
             print(line, end="")
 
     def set_status(self, msg):
-        GLib.idle_add(self.status_label.set_text, msg)
+        self.ui.post(self.status_label.set_text, msg)
 
     def set_progress(self, frac):
-        GLib.idle_add(self.progress.set_fraction, min(1.0, max(0.0, frac)))
+        self.ui.post(self.progress.set_fraction, min(1.0, max(0.0, frac)))
 
     def pulse(self):
-        GLib.idle_add(self.progress.pulse)
+        self.ui.post(self.progress.pulse)
+
+    def _loopback_mode(self, distro):
+        """True if the boot partition should hold the ISO file for GRUB to
+        loop-mount rather than the ISO's extracted files."""
+        return (self.loopback_check.get_active() and not self.custom_radio.get_active()
+                and "loopback" in distro)
+
+    def _payload_skip(self, distro):
+        """Globs of the ISO files left off LINUX_LIVE (minimal payload mode)."""
+        if not self.minimal_check.get_active() or self.custom_radio.get_active():
+            return ()
+        return tuple(distro.get("payload", {}).get("optional", ()))
+
+    def _payload_critical(self, distro):
+        """Globs of the files the live system cannot boot without."""
+        if self.custom_radio.get_active():
+            return ()
+        return tuple(distro.get("payload", {}).get("critical", ()))
+
+    def _boot_gb(self):
+        """Size of the LINUX_LIVE partition in GiB."""
+        distro = DISTROS[self.selected_distro]
+        cached = cache_iso_path(distro["sha256"])
+        if self._payload_skip(distro) and cached.exists() and not self._loopback_mode(distro):
+            # minimal payload: sized to the files that are actually copied
+            try:
+                return payload_boot_gb(
+                    self._boot_copy_plan(str(cached), distro, self.selected_distro))
+            except (IsoStreamError, IsoNeedMore, OSError, ValueError, struct.error):
+                return MIN_BOOT_GB
+        if not self._loopback_mode(distro):
+            return MIN_BOOT_GB
+        # size_gb is rounded – leave 10 % headroom until the real size is known
+        size = cached.stat().st_size if cached.exists() else distro["size_gb"] * 1.1e9
+        return loopback_boot_gb(size)
 
     # ── disk plan dialog ────────────────────────────────────────────────────
     def _show_disk_plan(self, distro_label):
         """Show a GTK dialog with disk selection, size, before/after layout, strategy.
-        Returns dict with approved, strategy, target_disk, shrink_dev, shrink_gb, linux_gb
-        or None if cancelled. Must be called on the GTK main thread."""
-
-        boot_gb = MIN_BOOT_GB
+        Returns dict with approved, strategy, target_disk, shrink_dev, shrink_gb, linux_gb,
+        boot_gb or None if cancelled. Must be called on the GTK main thread."""
+
+        boot_gb = self._boot_gb()
+        boot_fs = "ext4" if self._loopback_mode(DISTROS[self.selected_distro]) else "FAT32"
+        boot_row = f"LINUX_LIVE ({boot_fs})".ljust(23)
+        # one snapshot of disks, partitions and mounts answers every query below
+        inv = self.disk_cache.inventory()
+        # an earlier run's partition can be refreshed in place (not in loopback mode)
+        live_dev = None if boot_fs == "ext4" else find_live_partition(inv)
+        if live_dev and get_partition_fstype(live_dev, inv) != "vfat":
+            live_dev = None
+        # …and only from the disk that holds it
+        live_disk = None
+        if live_dev:
+            pkname = (inv.devices.get(live_dev) or {}).get("pkname")
+            live_disk = f"/dev/{pkname}" if pkname else self._resolve_disk_and_part(live_dev)[0]
 
         # Gather disk info
-        all_disks = get_all_disks()
+        all_disks = get_all_disks(inv)
         root_info = self.fs_info
         root_dev = root_info["device"] if root_info else ""
         # Find which disk contains the root partition
@@ -788,7 +3800,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
         disk_entries = []
         for d in all_disks:
             size_gb = round(d["size_bytes"] / 1e9, 1)
-            free_mib = get_disk_unallocated_mib(d["path"])
+            free_mib = get_disk_unallocated_mib(d["path"], inv)
             free_gb = round(free_mib / 1024, 1)
             is_root = (d["path"] == root_disk_path)
             prefix = f"{d['name']} (current OS)" if is_root else d["name"]
@@ -847,6 +3859,10 @@ class InstallerWindow(Gtk.ApplicationWindow):
             disk_combo.append_text(de["label"])
             if de["is_root"]:
                 root_index = i
+        # start on the disk an existing LINUX_LIVE is on, offering its refresh
+        for i, de in enumerate(disk_entries):
+            if live_disk and de["path"] == live_disk:
+                root_index = i
         disk_combo.set_active(root_index)
         disk_frame.add(disk_combo)
         disk_frame.set_margin_top(4)
@@ -890,6 +3906,11 @@ class InstallerWindow(Gtk.ApplicationWindow):
         radio_primary = Gtk.RadioButton.new_with_label(None, "")
         radio_secondary = Gtk.RadioButton.new_with_label_from_widget(radio_primary, "")
         radio_wipe = Gtk.RadioButton.new_with_label_from_widget(radio_primary, "")
+        radio_refresh = Gtk.RadioButton.new_with_label_from_widget(
+            radio_primary, f"Refresh the existing LINUX_LIVE partition ({live_dev}) – "
+                           "rewrite only changed files, no partitioning")
+        radio_refresh.set_no_show_all(True)     # shown by update_all on live_disk
+        strat_box.pack_start(radio_refresh, False, False, 0)
         strat_box.pack_start(radio_primary, False, False, 0)
         strat_box.pack_start(radio_secondary, False, False, 0)
         strat_box.pack_start(radio_wipe, False, False, 0)
@@ -933,26 +3954,156 @@ class InstallerWindow(Gtk.ApplicationWindow):
             "shrink_gb": 0,
         }
 
+        # ── Disk facts ──
+        # What the plan needs to know about a disk, apart from the chosen
+        # size, is read once per disk on a worker thread and kept until the
+        # disk cache sees the disk change.  Every disk's layout is read when
+        # the dialog opens; ntfsresize --info, which can take seconds per
+        # partition, only runs for the disk that is selected.
+        SHRINKABLE_FS = ("btrfs", "ext4", "ext3", "ext2", "ntfs")
+        cache = self.disk_cache
+        facts_memo = {}           # disk path -> (cache generation, disk_facts())
+        pending = set()           # disk paths being read
+        state = {"source": None, "shown": None, "closed": False}
+
+        def fresh(path, full=False):
+            memo = facts_memo.get(path)
+            return (memo is not None and memo[0] == cache.generation(path)
+                    and (memo[1]["full"] or not full))
+
+        def no_facts():
+            # full: no unmounted NTFS partition was left unmeasured
+            return {"layout": [], "free_mib": 0, "parts": [], "shrinkable": [],
+                    "non_shrinkable": [], "root_total": None, "full": True}
+
+        def disk_facts(sel, reread, full):
+            # the generation is taken first, so a change while reading reads
+            # again; a re-read cannot use the snapshot the dialog opened with
+            path = sel["path"]
+            gen = cache.generation(path)
+            try:
+                return gen, read_disk_facts(sel, cache.inventory() if reread else inv, full)
+            except Exception as e:
+                facts = no_facts()
+                facts["layout"] = [f"  Cannot read {path}: {e}"]
+                return gen, facts
+
+        def read_disk_facts(sel, inv, full):
+            path = sel["path"]
+            facts = no_facts()
+            facts["layout"] = get_disk_layout_text(path, inv)
+            facts["free_mib"] = get_disk_unallocated_mib(path, inv)
+            if sel["is_root"] and root_dev:
+                facts["root_total"] = get_partition_info(root_dev)[0]
+            parts, _, _ = get_disk_partitions(path, inv)
+            for p in parts:
+                if p["is_free"] or p["num"] == 0:
+                    continue
+                dev_p = _part_dev_path(path, p["num"])
+                fs = get_partition_fstype(dev_p, inv)
+                size_gb = round(p["size_mib"] / 1024, 2)
+                facts["parts"].append({"num": p["num"], "dev": dev_p, "size_gb": size_gb,
+                                       "label": p["name"] or fs or "Partition"})
+                if sel["is_root"]:
+                    continue
+                # btrfs can be shrunk live; ext4 can be shrunk if unmounted
+                if fs in SHRINKABLE_FS:
+                    total_b, free_b = get_partition_usage(dev_p, inv)
+                    if not total_b or not free_b:
+                        # Partition might not be mounted — try fs-specific queries
+                        if fs == "ntfs" and full:
+                            total_b, free_b = _ntfs_info(dev_p)
+                        elif fs == "ntfs":
+                            facts["full"] = False
+                        if not total_b or not free_b:
+                            # Fallback: estimate from partition size (assume 50% free)
+                            part_size_b = p["size_mib"] * 1024 * 1024
+                            total_b = part_size_b
+                            free_b = part_size_b // 2
+                    facts["shrinkable"].append({
+                        "dev": dev_p,
+                        "num": p["num"],
+                        "fstype": fs,
+                        "size_gb": size_gb,
+                        "free_gb": round(free_b / 1e9, 2),
+                        "free_bytes": free_b,
+                    })
+                elif fs and fs not in ("vfat", "swap", ""):
+                    facts["non_shrinkable"].append({"dev": dev_p, "fstype": fs,
+                                                    "size_gb": size_gb})
+            return facts
+
+        def request_facts(sel, full=True):
+            path = sel["path"]
+            if fresh(path, full) or path in pending:
+                return
+            pending.add(path)
+            reread = path in facts_memo
+            threading.Thread(
+                target=lambda: GLib.idle_add(facts_ready, path,
+                                             disk_facts(sel, reread, full)),
+                daemon=True).start()
+
+        def facts_ready(path, facts):
+            pending.discard(path)
+            if state["closed"]:
+                return False
+            facts_memo[path] = facts
+            idx = disk_combo.get_active()
+            if 0 <= idx < len(disk_entries) and disk_entries[idx]["path"] == path:
+                update_all()
+            return False
+
+        def schedule_update(*_args):
+            # a held spin arrow or a radio pair toggling fires many signals;
+            # only the last one within DISK_PLAN_DEBOUNCE_MS redraws, and
+            # the plan on screen is stale until it does
+            confirm_btn.set_sensitive(False)
+            if state["source"]:
+                GLib.source_remove(state["source"])
+            state["source"] = GLib.timeout_add(DISK_PLAN_DEBOUNCE_MS, update_all)
+
         # ── Update function ──
         def update_all(*_args):
+            state["source"] = None
             idx = disk_combo.get_active()
             if idx < 0 or idx >= len(disk_entries):
-                return
+                return False
             linux_gb = int(size_spin.get_value())
             total_needed_gb = linux_gb + boot_gb
             sel = disk_entries[idx]
             sel_path = sel["path"]
             is_root_disk = sel["is_root"]
+            on_live_disk = bool(live_dev) and sel_path == live_disk
+            radio_refresh.set_visible(on_live_disk)
+            if radio_refresh.get_active() and not on_live_disk:
+                radio_primary.set_active(True)
+            refreshing = radio_refresh.get_active()
+
+            if not fresh(sel_path, full=True):
+                # nothing can be confirmed until the facts are in – not
+                # even by a Confirm click that arrived before this redraw
+                request_facts(sel)
+                plan_state["strategy"] = "blocked"
+                state["shown"] = None
+                layout_text.get_buffer().set_text(f"  Reading {sel['name']}…")
+                changes_text.get_buffer().set_text("")
+                after_text.get_buffer().set_text("")
+                confirm_btn.set_sensitive(False)
+                return False
+            facts = facts_memo[sel_path][1]
             plan_state["target_disk"] = sel_path
 
-            # Current layout
-            layout_lines = get_disk_layout_text(sel_path)
-            free_mib = get_disk_unallocated_mib(sel_path)
+            # Current layout – redrawn only when another disk is shown
+            free_mib = facts["free_mib"]
             free_gb = round(free_mib / 1024, 1)
-            if free_gb > 0.01:
-                layout_lines.append("")
-                layout_lines.append(f"  Total unallocated space: {free_gb} GB")
-            layout_text.get_buffer().set_text("\n".join(layout_lines))
+            if state["shown"] != sel_path:
+                layout_lines = list(facts["layout"])
+                if free_gb > 0.01:
+                    layout_lines.append("")
+                    layout_lines.append(f"  Total unallocated space: {free_gb} GB")
+                layout_text.get_buffer().set_text("\n".join(layout_lines))
+                state["shown"] = sel_path
 
             has_free = (free_gb >= (boot_gb + 1))
 
@@ -1003,17 +4154,15 @@ class InstallerWindow(Gtk.ApplicationWindow):
                     plan_state["shrink_dev"] = None
                     plan_state["shrink_gb"] = 0
 
-                    root_size_gb = round(
-                        (get_partition_info(root_dev)[0] or 0) / 1e9, 2)
                     change_lines.append("  1. Root partition is NOT modified")
                     change_lines.append(
-                        f"  2. Create {boot_gb} GB FAT32 boot partition (LINUX_LIVE)")
+                        f"  2. Create {boot_gb} GB {boot_fs} boot partition (LINUX_LIVE)")
                     change_lines.append(
                         f"  3. Remaining ~{round(free_gb - boot_gb, 1)} GB for Linux installation")
                     change_lines.append(
                         f"  4. Configure UEFI/GRUB boot entry for {distro_label}")
 
-                    for p_line in get_disk_layout_text(sel_path):
+                    for p_line in facts["layout"]:
                         if "[Unallocated]" not in p_line:
                             after_lines.append(p_line.rstrip() + "  (unchanged)")
                     remain_gb = round(free_gb - boot_gb, 1)
@@ -1021,13 +4170,13 @@ class InstallerWindow(Gtk.ApplicationWindow):
                         after_lines.append(
                             f"  [Unallocated – Linux]  {remain_gb} GB  ← for Linux installer")
                     after_lines.append(
-                        f"  LINUX_LIVE (FAT32)     {boot_gb} GB  ← {distro_label} live boot")
+                        f"  {boot_row}{boot_gb} GB  ← {distro_label} live boot")
                 else:
                     plan_state["strategy"] = "shrink_root"
                     plan_state["shrink_dev"] = root_dev
                     plan_state["shrink_gb"] = total_needed_gb
 
-                    root_total, _ = get_partition_info(root_dev)
+                    root_total = facts["root_total"]
                     root_size_gb = round((root_total or 0) / 1e9, 2)
                     new_size_gb = round(root_size_gb - total_needed_gb, 2)
 
@@ -1035,82 +4184,39 @@ class InstallerWindow(Gtk.ApplicationWindow):
                         f"  1. Shrink root ({root_dev}) from "
                         f"{root_size_gb} GB to {new_size_gb} GB  (−{total_needed_gb} GB)")
                     change_lines.append(
-                        f"  2. Create {boot_gb} GB FAT32 boot partition (LINUX_LIVE)")
+                        f"  2. Create {boot_gb} GB {boot_fs} boot partition (LINUX_LIVE)")
                     change_lines.append(
                         f"  3. Leave {linux_gb} GB unallocated for Linux installation")
                     change_lines.append(
                         f"  4. Configure UEFI/GRUB boot entry for {distro_label}")
 
                     # Rebuild after layout
-                    parts, _, _ = get_disk_partitions(sel_path)
                     _, root_part_num = self._resolve_disk_and_part(root_dev)
-                    for p in parts:
-                        if p["is_free"]:
-                            continue
-                        s_gb = round(p["size_mib"] / 1024, 2)
+                    for p in facts["parts"]:
                         if p["num"] == root_part_num:
                             after_lines.append(
                                 f"  Root ({root_dev})       {new_size_gb} GB  (shrunk)")
                             after_lines.append(
                                 f"  [Unallocated – Linux]  {linux_gb} GB  ← for Linux installer")
                             after_lines.append(
-                                f"  LINUX_LIVE (FAT32)     {boot_gb} GB  ← {distro_label} live boot")
+                                f"  {boot_row}{boot_gb} GB  ← {distro_label} live boot")
                         else:
-                            dev_p = _part_dev_path(sel_path, p["num"])
-                            lbl = p["name"] or get_partition_fstype(dev_p) or "Partition"
-                            after_lines.append(f"  {lbl:<22} {s_gb} GB")
+                            after_lines.append(f"  {p['label']:<22} {p['size_gb']} GB")
 
             else:
                 # ── Other disk ──
-                # Find shrinkable partitions on target disk
-                # btrfs can be shrunk live; ext4 can be shrunk if unmounted
-                SHRINKABLE_FS = ("btrfs", "ext4", "ext3", "ext2", "ntfs")
-                shrinkable = []
-                parts, _, _ = get_disk_partitions(sel_path)
-                for p in parts:
-                    if p["is_free"] or p["num"] == 0:
-                        continue
-                    dev_p = _part_dev_path(sel_path, p["num"])
-                    fs = get_partition_fstype(dev_p)
-                    if fs in SHRINKABLE_FS:
-                        total_b, free_b = get_partition_usage(dev_p)
-                        if not total_b or not free_b:
-                            # Partition might not be mounted — try fs-specific queries
-                            if fs == "ntfs":
-                                total_b, free_b = _ntfs_info(dev_p)
-                            if not total_b or not free_b:
-                                # Fallback: estimate from parted size (assume 50% free)
-                                part_size_b = p["size_mib"] * 1024 * 1024
-                                total_b = part_size_b
-                                free_b = part_size_b // 2
-                        if free_b > total_needed_gb * 1e9:
-                            shrinkable.append({
-                                "dev": dev_p,
-                                "num": p["num"],
-                                "fstype": fs,
-                                "size_gb": round(p["size_mib"] / 1024, 2),
-                                "free_gb": round(free_b / 1e9, 2),
-                            })
-
+                # Partitions with room for the new ones once shrunk
+                shrinkable = [s for s in facts["shrinkable"]
+                              if s["free_bytes"] > total_needed_gb * 1e9]
                 has_shrinkable = len(shrinkable) > 0
-
-                # Find non-shrinkable partitions for explanation
-                non_shrinkable_fs = []
-                for p in parts:
-                    if p["is_free"] or p["num"] == 0:
-                        continue
-                    dev_p = _part_dev_path(sel_path, p["num"])
-                    fs = get_partition_fstype(dev_p)
-                    if fs and fs not in SHRINKABLE_FS and fs not in ("vfat", "swap", ""):
-                        non_shrinkable_fs.append({"dev": dev_p, "fstype": fs,
-                            "size_gb": round(p["size_mib"] / 1024, 2)})
+                non_shrinkable_fs = facts["non_shrinkable"]
 
                 if has_free:
                     radio_primary.set_label(
                         f"Use existing unallocated space ({free_gb} GB) on {sel['name']}")
                     radio_primary.set_visible(True); radio_primary.set_sensitive(True)
                     if not radio_primary.get_active() and not radio_secondary.get_active() \
-                            and not radio_wipe.get_active():
+                            and not radio_wipe.get_active() and not refreshing:
                         radio_primary.set_active(True)
                 else:
                     radio_primary.set_visible(False)
@@ -1122,7 +4228,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
                         f"Shrink {best['dev']} ({best['fstype']}, {best['size_gb']} GB, "
                         f"{best['free_gb']} GB free) to make space")
                     radio_secondary.set_visible(True); radio_secondary.set_sensitive(True)
-                    if not has_free and not radio_wipe.get_active():
+                    if not has_free and not radio_wipe.get_active() and not refreshing:
                         radio_secondary.set_active(True)
                 else:
                     radio_secondary.set_visible(False)
@@ -1149,7 +4255,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
                         radio_secondary.set_label(
                             f"Cannot shrink {fs_list} – only btrfs/ext4/NTFS can be resized")
                         radio_secondary.set_visible(True); radio_secondary.set_sensitive(False)
-                    if disk_size_ok and not radio_wipe.get_active():
+                    if disk_size_ok and not radio_wipe.get_active() and not refreshing:
                         radio_wipe.set_active(True)
 
                 strat_frame.set_visible(True)
@@ -1177,7 +4283,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
                     change_lines.append(
                         f"  3. Create 512 MB EFI System Partition (ESP)")
                     change_lines.append(
-                        f"  4. Create {boot_gb} GB FAT32 boot partition (LINUX_LIVE)")
+                        f"  4. Create {boot_gb} GB {boot_fs} boot partition (LINUX_LIVE)")
                     change_lines.append(
                         f"  5. Leave ~{usable_gb} GB unallocated for Linux installation")
                     change_lines.append(
@@ -1186,7 +4292,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
                     after_lines.append(
                         f"  EFI System (ESP)       0.5 GB  ← UEFI boot files")
                     after_lines.append(
-                        f"  LINUX_LIVE (FAT32)     {boot_gb} GB  ← {distro_label} live boot")
+                        f"  {boot_row}{boot_gb} GB  ← {distro_label} live boot")
                     after_lines.append(
                         f"  [Unallocated – Linux]  ~{usable_gb} GB  ← for Linux installer")
 
@@ -1202,27 +4308,22 @@ class InstallerWindow(Gtk.ApplicationWindow):
                         f"  2. Shrink {best['dev']} from {best['size_gb']} GB to "
                         f"{new_size_gb} GB  (−{total_needed_gb} GB)")
                     change_lines.append(
-                        f"  3. Create {boot_gb} GB FAT32 boot partition (LINUX_LIVE)")
+                        f"  3. Create {boot_gb} GB {boot_fs} boot partition (LINUX_LIVE)")
                     change_lines.append(
                         f"  4. Leave {linux_gb} GB unallocated for Linux installation")
                     change_lines.append(
                         f"  5. Configure UEFI/GRUB boot entry for {distro_label}")
 
-                    for p in parts:
-                        if p["is_free"]:
-                            continue
-                        s_gb = round(p["size_mib"] / 1024, 2)
-                        dev_p = _part_dev_path(sel_path, p["num"])
-                        if dev_p == best["dev"]:
+                    for p in facts["parts"]:
+                        if p["dev"] == best["dev"]:
                             after_lines.append(
-                                f"  {dev_p:<22} {new_size_gb} GB  (shrunk)")
+                                f"  {p['dev']:<22} {new_size_gb} GB  (shrunk)")
                             after_lines.append(
                                 f"  [Unallocated – Linux]  {linux_gb} GB  ← for Linux installer")
                             after_lines.append(
-                                f"  LINUX_LIVE (FAT32)     {boot_gb} GB  ← {distro_label} live boot")
+                                f"  {boot_row}{boot_gb} GB  ← {distro_label} live boot")
                         else:
-                            lbl = p["name"] or get_partition_fstype(dev_p) or "Partition"
-                            after_lines.append(f"  {lbl:<22} {s_gb} GB")
+                            after_lines.append(f"  {p['label']:<22} {p['size_gb']} GB")
 
                 elif has_free:
                     plan_state["strategy"] = "other_disk_free"
@@ -1231,26 +4332,21 @@ class InstallerWindow(Gtk.ApplicationWindow):
 
                     change_lines.append("  1. Root partition is NOT modified (different disk)")
                     change_lines.append(
-                        f"  2. Create {boot_gb} GB FAT32 boot partition (LINUX_LIVE) "
+                        f"  2. Create {boot_gb} GB {boot_fs} boot partition (LINUX_LIVE) "
                         f"on {sel['name']}")
                     change_lines.append(
                         f"  3. Remaining unallocated space for Linux installation")
                     change_lines.append(
                         f"  4. Configure UEFI/GRUB boot entry for {distro_label}")
 
-                    for p in parts:
-                        if p["is_free"]:
-                            continue
-                        s_gb = round(p["size_mib"] / 1024, 2)
-                        dev_p = _part_dev_path(sel_path, p["num"])
-                        lbl = p["name"] or get_partition_fstype(dev_p) or "Partition"
-                        after_lines.append(f"  {lbl:<22} {s_gb} GB  (unchanged)")
+                    for p in facts["parts"]:
+                        after_lines.append(f"  {p['label']:<22} {p['size_gb']} GB  (unchanged)")
                     remain_gb = round(free_gb - boot_gb, 1)
                     if remain_gb > 0:
                         after_lines.append(
                             f"  [Unallocated – Linux]  {remain_gb} GB  ← for Linux installer")
                     after_lines.append(
-                        f"  LINUX_LIVE (FAT32)     {boot_gb} GB  ← {distro_label} live boot")
+                        f"  {boot_row}{boot_gb} GB  ← {distro_label} live boot")
                 else:
                     plan_state["strategy"] = "blocked"
                     change_lines.append("  Cannot proceed with this disk.")
@@ -1269,38 +4365,61 @@ class InstallerWindow(Gtk.ApplicationWindow):
                     else:
                         change_lines.append("  No unallocated space available on this disk.")
 
-                    for p in parts:
-                        if p["is_free"]:
-                            continue
-                        s_gb = round(p["size_mib"] / 1024, 2)
-                        dev_p = _part_dev_path(sel_path, p["num"])
-                        lbl = p["name"] or get_partition_fstype(dev_p) or "Partition"
-                        after_lines.append(f"  {lbl:<22} {s_gb} GB  (unchanged)")
+                    for p in facts["parts"]:
+                        after_lines.append(f"  {p['label']:<22} {p['size_gb']} GB  (unchanged)")
                     after_lines.append("")
                     after_lines.append("  (No changes – disk cannot be used as-is)")
 
+            if refreshing:
+                plan_state["strategy"] = "refresh"
+                plan_state["shrink_dev"] = None
+                plan_state["shrink_gb"] = 0
+                change_lines = [
+                    "  1. No partitions are created, resized or formatted",
+                    f"  2. Rewrite the files on {live_dev} that differ from the new ISO",
+                    "     and delete the ones it no longer contains",
+                    f"  3. Configure UEFI/GRUB boot entry for {distro_label}"]
+                after_lines = [line.rstrip() + "  (unchanged)"
+                               for line in facts["layout"]]
+                after_lines.append(f"  {live_dev}: LINUX_LIVE  ← refreshed with {distro_label}")
+
             changes_text.get_buffer().set_text("\n".join(change_lines))
             after_text.get_buffer().set_text("\n".join(after_lines))
 
             # Disable confirm if blocked
             blocked = plan_state["strategy"] == "blocked"
             confirm_btn.set_sensitive(not blocked)
+            return False
 
         # Wire events
-        disk_combo.connect("changed", update_all)
-        radio_primary.connect("toggled", update_all)
-        radio_secondary.connect("toggled", update_all)
-        radio_wipe.connect("toggled", update_all)
-        size_spin.connect("value-changed", update_all)
-
-        # Initial update
+        disk_combo.connect("changed", schedule_update)
+        radio_primary.connect("toggled", schedule_update)
+        radio_secondary.connect("toggled", schedule_update)
+        radio_wipe.connect("toggled", schedule_update)
+        radio_refresh.connect("toggled", schedule_update)
+        size_spin.connect("value-changed", schedule_update)
+
+        # Initial update; the other disks are read in the background so
+        # switching to one is immediate
+        if live_dev:
+            radio_refresh.set_active(True)
         update_all()
+        for de in disk_entries:
+            request_facts(de, full=False)
 
         dialog.show_all()
         response = dialog.run()
+        if state["source"]:
+            # a change still waiting for its redraw: settle plan_state on it
+            GLib.source_remove(state["source"])
+            update_all()
+        state["closed"] = True
         dialog.destroy()
 
-        if response == Gtk.ResponseType.OK:
+        if response == Gtk.ResponseType.OK and plan_state["strategy"] == "blocked":
+            self.log("The disk plan changed before it could be confirmed – "
+                     "nothing was done.", error=True)
+        elif response == Gtk.ResponseType.OK:
             return {
                 "approved": True,
                 "strategy": plan_state["strategy"],
@@ -1308,6 +4427,8 @@ class InstallerWindow(Gtk.ApplicationWindow):
                 "shrink_dev": plan_state["shrink_dev"],
                 "shrink_gb": plan_state["shrink_gb"],
                 "linux_gb": int(size_spin.get_value()),
+                "boot_gb": boot_gb,
+                "refresh_dev": live_dev,
             }
         return None
 
@@ -1324,7 +4445,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
         finally:
             self.running = False
             GLib.idle_add(self.start_btn.set_sensitive, True)
-            GLib.idle_add(self.set_progress, 0)
+            self.set_progress(0)
 
     def _do_install(self):
         self.log("=" * 52)
@@ -1378,6 +4499,9 @@ class InstallerWindow(Gtk.ApplicationWindow):
         shrink_dev = plan.get("shrink_dev")
         shrink_gb = plan.get("shrink_gb", 0)
         linux_gb = plan.get("linux_gb", 30)
+        # the LINUX_LIVE size the user approved – not re-derived once the ISO
+        # is downloaded, when the minimal payload would come out smaller
+        boot_gb = plan["boot_gb"]
         self.log(f"Disk plan approved. Strategy: {strategy}, Target: {target_disk}")
         self.log(f"Target size : {linux_gb} GB")
 
@@ -1388,51 +4512,67 @@ class InstallerWindow(Gtk.ApplicationWindow):
                 self.log("No valid ISO selected.", error=True)
                 return
             self.log(f"Custom ISO: {iso_path}")
+            if self.loopback_check.get_active():
+                self.log("Booting the ISO file directly needs a listed distro – "
+                         "copying the custom ISO's files instead.")
         else:
-            iso_path = str(iso_cache_dir() / distro["filename"])
-            if os.path.exists(iso_path):
-                sz = os.path.getsize(iso_path)
-                self.log(f"Found cached ISO ({bytes_to_gb(sz)} GB): {iso_path}")
-                ok = self._verify_checksum(iso_path, distro["sha256"])
-                if not ok:
-                    self.log("Checksum mismatch – deleting and re-downloading.", error=True)
-                    os.unlink(iso_path)
-                    if not self._download_iso(distro, iso_path):
-                        return
+            cache_adopt_legacy(distro)
+            # a refresh diffs against the whole ISO, so it always needs a local copy
+            if (self.stream_check.get_active() and strategy != "refresh"
+                    and not cache_iso_path(distro["sha256"]).exists()):
+                iso_path = None   # downloaded while the boot partition is populated
+                self.log("Streaming mode: the ISO will be written straight to the "
+                         "boot partition as it downloads.")
             else:
-                if not self._download_iso(distro, iso_path):
+                iso_path = self._ensure_cached_iso(distro_key, distro)
+                if not iso_path:
                     return
 
+        # the plan sized an ext4 LINUX_LIVE from distro["size_gb"] if the ISO
+        # was not cached yet
+        if iso_path and strategy != "refresh" and self._loopback_mode(distro):
+            need_gb = loopback_boot_gb(os.path.getsize(iso_path))
+            if need_gb > boot_gb:
+                self.log(f"The ISO needs a {need_gb} GB boot partition, the approved "
+                         f"plan has {boot_gb} GB – please start the installation again.",
+                         error=True)
+                self.set_status("Ready")
+                return
+
         # ── 3. execute strategy ────────────────────────────────────────────
         self._boot_part_dev = None  # set by strategy if applicable
+        self._loopback_title = None # set when the boot partition holds the ISO file
 
         if strategy == "shrink_root":
             # Shrink root btrfs and create partitions on the same disk
             if fstype != "btrfs":
                 self.log(f"Cannot shrink root: filesystem is {fstype}, not btrfs.", error=True)
                 return
-            ok = self._strategy_btrfs(device, linux_gb, iso_path, distro,
-                                       distro_key, custom_mode)
+            ok = self._strategy_btrfs(device, linux_gb, boot_gb, iso_path, distro,
+                                      distro_key, custom_mode)
         elif strategy == "use_free_root":
             # Use existing unallocated space on root disk
-            ok = self._strategy_use_free(target_disk, linux_gb, iso_path,
-                                          distro, distro_key, custom_mode)
+            ok = self._strategy_use_free(target_disk, linux_gb, boot_gb, iso_path,
+                                         distro, distro_key, custom_mode)
         elif strategy == "other_disk_shrink":
             # Shrink a btrfs partition on another disk
             if not shrink_dev:
                 self.log("No partition selected to shrink.", error=True)
                 return
             ok = self._strategy_other_disk_shrink(
-                target_disk, shrink_dev, shrink_gb, linux_gb,
+                target_disk, shrink_dev, shrink_gb, linux_gb, boot_gb,
                 iso_path, distro, distro_key, custom_mode)
         elif strategy == "other_disk_free":
             # Use existing free space on another disk
-            ok = self._strategy_use_free(target_disk, linux_gb, iso_path,
-                                          distro, distro_key, custom_mode)
+            ok = self._strategy_use_free(target_disk, linux_gb, boot_gb, iso_path,
+                                         distro, distro_key, custom_mode)
         elif strategy == "wipe_disk":
             # Wipe and reformat entire secondary disk
-            ok = self._strategy_wipe_disk(target_disk, linux_gb, iso_path,
-                                           distro, distro_key, custom_mode)
+            ok = self._strategy_wipe_disk(target_disk, linux_gb, boot_gb, iso_path,
+                                          distro, distro_key, custom_mode)
+        elif strategy == "refresh":
+            # Update the files of an earlier run's LINUX_LIVE partition in place
+            ok = self._strategy_refresh(plan["refresh_dev"], iso_path, distro, distro_key)
         else:
             self.log(f"Unknown strategy: {strategy}", error=True)
             return
@@ -1444,14 +4584,16 @@ class InstallerWindow(Gtk.ApplicationWindow):
         # ── 4. cleanup ─────────────────────────────────────────────────────
         if self.delete_check.get_active() and not custom_mode:
             try:
-                os.unlink(iso_path)
+                cache_forget(distro["sha256"])
                 self.log("ISO file deleted.")
             except Exception as e:
                 self.log(f"Could not delete ISO: {e}")
 
         # ── 5. set UEFI boot entry + update GRUB + restart ────────────────
         self._update_grub()
-        if self._boot_part_dev:
+        if self._loopback_title:
+            self._set_grub_next_entry(self._loopback_title)
+        elif self._boot_part_dev:
             if custom_mode and self.custom_iso_path:
                 # Derive a label from the custom ISO filename
                 iso_basename = os.path.basename(self.custom_iso_path)
@@ -1468,61 +4610,415 @@ class InstallerWindow(Gtk.ApplicationWindow):
         self.log("=" * 52)
 
     # ── ISO download ──────────────────────────────────────────────────────────
+    def _ensure_cached_iso(self, distro_key, distro):
+        """Return the path of a verified cached ISO for distro, downloading it
+        (after making room in the cache) if needed.  None on failure."""
+        sha = distro["sha256"]
+        cache_adopt_legacy(distro)
+        iso_path = str(cache_iso_path(sha))
+        if os.path.exists(iso_path):
+            sz = os.path.getsize(iso_path)
+            self.log(f"Found cached ISO ({bytes_to_gb(sz)} GB): {iso_path}")
+            bad = []
+            if (self._verify_checksum(iso_path, sha, bad)
+                    or bad and self._repair_iso(distro, iso_path, bad)):
+                cache_touch(sha, name=distro["filename"], distro=distro_key,
+                            verified=int(time.time()))
+                return iso_path
+            self.log("Checksum mismatch – deleting and re-downloading.", error=True)
+            cache_forget(sha)
+
+        if self._delta_update(distro_key, distro, iso_path):
+            cache_touch(sha, name=distro["filename"], distro=distro_key,
+                        verified=int(time.time()))
+            self._evict_cached(0, sha)
+            return iso_path
+
+        self._evict_cached(int(distro["size_gb"] * 1e9), sha)
+        if not self._download_iso(distro, iso_path):
+            return None
+        record_verified(iso_path, sha)
+        cache_touch(sha, name=distro["filename"], distro=distro_key,
+                    verified=int(time.time()))
+        return iso_path
+
+    def _evict_cached(self, reserve_bytes, keep_sha):
+        for e in cache_evict(reserve_bytes, keep={keep_sha}):
+            self.log(f"Evicted cached ISO {e.get('name', e['sha256'])} "
+                     f"({bytes_to_gb(e.get('size', 0))} GB) to stay under "
+                     f"{ISO_CACHE_QUOTA_GB} GB")
+
+    def _delta_update(self, distro_key, distro, dest):
+        """Build dest from the most recently used cached ISO of an older release
+        of the same distro, fetching only the blocks that changed (zsync).
+        Returns True once dest is complete and verified."""
+        if not distro.get("zsync"):
+            return False
+        older = [(sha, e) for sha, e in load_cache_index().items()
+                 if e.get("distro") == distro_key and sha != distro["sha256"]]
+        if not older:
+            return False
+        md4 = md4_func()
+        if md4 is None:
+            self.log("MD4 is unavailable – cannot do a delta update.")
+            return False
+        old_sha, entry = max(older, key=lambda kv: kv[1].get("last_used", 0))
+        old_path = str(cache_iso_path(old_sha))
+        self.log(f"Delta update from cached {entry.get('name', old_sha[:12])}")
+        self.set_status("Fetching block map…")
+        try:
+            with _http_get(distro["zsync"]) as resp:
+                zs = parse_zsync(resp.read())
+        except (urllib.error.URLError, OSError, ValueError, KeyError) as e:
+            self.log(f"Could not use {_host(distro['zsync'])} block map: {e}", error=True)
+            return False
+
+        def match_cb(frac):
+            self.set_progress(frac)
+            self.set_status(f"Comparing with cached ISO… {frac*100:.0f}%")
+
+        part = f"{dest}.part.delta"
+        # part is removed however this ends, unless it has become dest
+        try:
+            try:
+                found = zsync_match(zs, old_path, md4, match_cb)
+                missing = zsync_assemble(zs, old_path, found, part)
+            except OSError as e:
+                self.log(f"Delta update failed: {e}", error=True)
+                return False
+            self.set_progress(0)
+            need, length = sum(e - s for s, e in missing), zs["length"]
+            self.log(f"{len(found)} of {len(zs['sums'])} blocks reused; "
+                     f"{round(need / 1e6, 1)} of {round(length / 1e6, 1)} MB to fetch")
+            if need > ZSYNC_MAX_FETCH * length:
+                self.log("Too little in common – downloading the whole ISO instead.")
+                return False
+
+            def fetch_cb(done):
+                self.set_progress(done / max(need, 1))
+                self.set_status(f"Fetching changed blocks {done / max(need, 1) * 100:.0f}%  "
+                                f"{round(done / 1e6, 1)} / {round(need / 1e6, 1)} MB")
+
+            urls = rank_mirrors(distro["mirrors"], load_mirror_scores())
+            ok = fetch_ranges(urls, part, missing, fetch_cb)
+            self.set_progress(0)
+            if not ok:
+                self.log("Could not fetch or write the changed blocks.", error=True)
+                return False
+            os.replace(part, dest)
+            if not self._verify_checksum(dest, distro["sha256"]):
+                self.log("Delta result does not match – downloading the whole ISO.",
+                         error=True)
+                os.unlink(dest)
+                return False
+            return True
+        finally:
+            if os.path.exists(part):
+                os.unlink(part)
+
+    def _lan_peers(self, sha256):
+        """discover_peers, asking the LAN only while this machine shares its
+        own cache; otherwise just the peers named in $ULLI_PEERS."""
+        sharing = self.peer_server is not None
+        if sharing:
+            self.set_status("Looking for LAN peers…")
+        return discover_peers(sha256, broadcast=sharing)
+
     def _download_iso(self, distro, dest):
-        for i, url in enumerate(distro["mirrors"]):
-            host = url.split("/")[2]
+        peers = self._lan_peers(distro["sha256"])
+        if peers:
+            self.log(f"Found {len(peers)} LAN peer(s) with this ISO: "
+                     + ", ".join(_host(u) for u in peers))
+            digest, leaves = self._download_segmented(distro, dest, peers)
+            if digest:
+                if self._check_digest(digest, distro["sha256"], "computed during download"):
+                    write_manifest(dest, distro["sha256"], leaves)
+                    return True
+                self.log("Checksum failed – ignoring LAN peers.", error=True)
+                os.unlink(dest)
+
+        digest, leaves = self._download_segmented(distro, dest)
+        if digest:
+            # Hashed while downloading – no second pass over the file needed
+            if self._check_digest(digest, distro["sha256"], "computed during download"):
+                write_manifest(dest, distro["sha256"], leaves)
+                return True
+            self.log("Checksum failed – retrying one mirror at a time.", error=True)
+            os.unlink(dest)
+
+        # One connection per mirror.  dest.stream is kept on failure and the
+        # next attempt – on this or another mirror, in this or a later run –
+        # continues from the offset last fsynced into dest.stream.json.
+        part, state = f"{dest}.stream", f"{dest}.stream.json"
+        mirrors = rank_mirrors(distro["mirrors"], load_mirror_scores())
+        for i, url in enumerate(mirrors):
+            host = _host(url)
             self.log(f"Trying mirror {i+1}/{len(distro['mirrors'])}: {host}")
             self.set_status(f"Connecting to {host}…")
             try:
-                req = urllib.request.Request(url, headers={"User-Agent": "linux-installer/1.0"})
-                with urllib.request.urlopen(req, timeout=30) as resp:
-                    total = int(resp.headers.get("Content-Length", 0))
-                    total_mb = round(total / 1e6, 1)
-                    done = 0
-                    with open(dest, "wb") as f:
-                        while True:
-                            chunk = resp.read(1 << 17)   # 128 KB
-                            if not chunk:
-                                break
-                            f.write(chunk)
-                            done += len(chunk)
-                            if total:
-                                frac = done / total
-                                mb = round(done / 1e6, 1)
-                                GLib.idle_add(self.progress.set_fraction, frac)
-                                self.set_status(
-                                    f"Downloading {frac*100:.0f}%  {mb} / {total_mb} MB")
-                self.log(f"Download complete: {bytes_to_gb(os.path.getsize(dest))} GB")
-                GLib.idle_add(self.progress.set_fraction, 0)
-
-                # verify
-                if not self._verify_checksum(dest, distro["sha256"]):
-                    self.log("Checksum failed – trying next mirror.", error=True)
-                    os.unlink(dest)
-                    continue
-                return True
-
+                h = self._download_stream(url, part, state, distro["sha256"])
             except Exception as e:
-                self.log(f"Download error: {e}", error=True)
-                if os.path.exists(dest):
-                    os.unlink(dest)
+                kept = os.path.getsize(part) if os.path.exists(part) else 0
+                self.log(f"Download error: {e}"
+                         + (f" – {round(kept / 1e6, 1)} MB kept for the next attempt"
+                            if kept else ""), error=True)
+                continue
+            self.log(f"Download complete: {bytes_to_gb(os.path.getsize(part))} GB")
+            self.set_progress(0)
+
+            # verify – the hash was computed as the bytes arrived
+            if not self._check_digest(h.hexdigest(), distro["sha256"],
+                                      "computed during download"):
+                self.log("Checksum failed – trying next mirror.", error=True)
+                os.unlink(part)
+                os.unlink(state)
+                continue
+            os.replace(part, dest)
+            os.unlink(state)
+            write_manifest(dest, distro["sha256"], h.leaves())
+            return True
 
         self.log("All download mirrors failed.", error=True)
         self.log(f"Please download manually and place at:\n  {dest}", error=True)
         return False
 
-    def _verify_checksum(self, path, expected):
-        self.log("Verifying SHA-256 checksum…")
+    def _download_stream(self, url, part, state_path, key):
+        """Fetch url into part over one connection.  A part left by an earlier
+        attempt for the same key is continued with a Range request from the
+        offset recorded in state_path; a server that answers with the whole
+        file (no Range support, or If-Range saw it change) starts it over.
+        Returns the ChunkHasher of the complete file."""
+        try:
+            with open(state_path) as f:
+                st = json.load(f)
+        except (OSError, ValueError):
+            st = {}
+        offset = 0
+        if st.get("key") == key and os.path.exists(part):
+            offset = min(st.get("offset", 0), os.path.getsize(part))
+
+        def save(done):
+            tmp = f"{state_path}.tmp"
+            with open(tmp, "w") as sf:
+                json.dump({"key": key, "url": url, "validator": validator,
+                           "offset": done}, sf)
+            os.replace(tmp, state_path)
+
+        headers = {"User-Agent": USER_AGENT}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if st.get("url") == url and st.get("validator"):
+                headers["If-Range"] = st["validator"]
+        req = urllib.request.Request(url, headers=headers)
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            if resp.status == 206:
+                if not (resp.headers.get("Content-Range") or "").startswith(
+                        f"bytes {offset}-"):
+                    raise ValueError("server answered a different range")
+                self.log(f"Resuming: {round(offset / 1e6, 1)} MB already on disk")
+            else:
+                offset = 0
+            validator = resp.headers.get("ETag") or resp.headers.get("Last-Modified") or ""
+            length = int(resp.headers.get("Content-Length", 0))
+            total = offset + length if length else 0
+            total_mb = round(total / 1e6, 1)
+            h = ChunkHasher()
+            with open(part, "r+b" if offset else "wb") as f:
+                # bytes past the durable offset may not have reached the disk
+                f.truncate(offset)
+                left = offset
+                while left:
+                    data = f.read(min(left, HASH_CHUNK))
+                    if not data:
+                        raise ValueError(f"{part} is shorter than recorded")
+                    h.update(data)
+                    left -= len(data)
+                save(offset)
+                done = offset
+                last_sync = time.monotonic()
+                while True:
+                    chunk = resp.read(1 << 17)   # 128 KB
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    h.update(chunk)
+                    done += len(chunk)
+                    if total:
+                        frac = done / total
+                        self.set_progress(frac)
+                        self.set_status(f"Downloading {frac*100:.0f}%  "
+                                        f"{round(done / 1e6, 1)} / {total_mb} MB")
+                    if time.monotonic() - last_sync >= STATE_SYNC_SECS:
+                        f.flush()
+                        os.fsync(f.fileno())
+                        save(done)
+                        last_sync = time.monotonic()
+                f.flush()
+                os.fsync(f.fileno())
+                save(done)
+        if total and done != total:
+            raise ValueError(f"connection closed after {done} of {total} bytes")
+        return h
+
+    def _download_segmented(self, distro, dest, mirrors=None):
+        """Download dest in parallel Range chunks from every mirror (default: the
+        distro's) that supports them, resuming from dest.part if an earlier run
+        was interrupted.
+        Returns (SHA-256 hex digest, manifest leaves), both computed in-stream,
+        or (None, None) on failure."""
+        # peers come and go – only the distro's own mirrors are scored for
+        # later runs
+        remember = not mirrors
+        mirrors = mirrors or distro["mirrors"]
+        self.set_status("Probing mirrors…")
+        with ThreadPoolExecutor(max_workers=len(mirrors)) as pool:
+            probes = dict(zip(mirrors, pool.map(probe_mirror, mirrors)))
+        scores = load_mirror_scores() if remember else {}
+        for url, pr in probes.items():
+            if pr:
+                update_mirror_score(scores, url, pr["bps"], pr["latency"])
+            else:
+                update_mirror_score(scores, url, 0)
+        counts = collections.Counter(pr["size"] for pr in probes.values() if pr)
+        if not counts:
+            if remember:
+                save_mirror_scores(scores)
+            self.log("No mirror supports Range requests – using a single connection.")
+            return None, None
+        size = counts.most_common(1)[0][0]
+        for u, pr in probes.items():
+            if pr and pr["size"] != size:
+                self.log(f"Skipping {_host(u)}: size {pr['size']} ≠ {size}", error=True)
+        urls = rank_mirrors([u for u, pr in probes.items() if pr and pr["size"] == size],
+                            scores)
+        best_bps = scores[_host(urls[0])]["bps"]
+        for rank, u in enumerate(urls, 1):
+            sc = scores[_host(u)]
+            self.log(f"  {rank}. {_host(u):<40} {sc['bps'] / 1e6:6.2f} MB/s  "
+                     f"{sc.get('latency', 0) * 1000:5.0f} ms")
+        urls = [u for u in urls if scores[_host(u)]["bps"] * MIRROR_KEEP_RATIO >= best_bps]
+
+        hosts = ", ".join(_host(u) for u in urls)
+        self.log(f"Downloading {round(size / 1e6, 1)} MB in parallel from "
+                 f"{len(urls)} mirror(s): {hosts}")
+        total_mb = round(size / 1e6, 1)
+        part, state = f"{dest}.part", f"{dest}.part.json"
+        dl = SegmentedDownload(urls, part, size, log=self.log,
+                               state_path=state, key=distro["sha256"])
+        if dl.resumed_bytes:
+            self.log(f"Resuming: {round(dl.resumed_bytes / 1e6, 1)} MB already on disk")
+        started = time.monotonic()
+
+        def progress_cb(done, total):
+            frac = done / total
+            rate = (done - dl.resumed_bytes) / max(time.monotonic() - started, 1e-3) / 1e6
+            self.set_progress(frac)
+            self.set_status(f"Downloading {frac*100:.0f}%  {round(done / 1e6, 1)} / "
+                            f"{total_mb} MB  ({rate:.1f} MB/s)")
+
+        dl.progress_cb = progress_cb
+        try:
+            ok = dl.run()
+        except OSError as e:
+            self.log(f"Download error: {e}", error=True)
+            ok = False
+        finally:
+            for u, (nbytes, secs) in dl.stats.items():
+                if secs >= 1:
+                    update_mirror_score(scores, u, nbytes / secs)
+            if remember:
+                save_mirror_scores(scores)
+        self.set_progress(0)
+        if not ok:
+            self.log("Parallel download failed on every mirror – the partial file "
+                     f"is kept and will be resumed next time: {part}", error=True)
+            return None, None
+        os.replace(part, dest)
+        os.unlink(state)
+        self.log(f"Download complete: {bytes_to_gb(size)} GB in "
+                 f"{time.monotonic() - started:.0f} s")
+        return dl.sha256, dl.leaves
+
+    def _verify_checksum(self, path, expected, bad_chunks=None):
+        """Check path against expected.  With a manifest only the chunk hashes
+        are checked, on every core; the indices of corrupt chunks are then
+        appended to bad_chunks.  Otherwise the whole file is hashed and a
+        manifest is written for next time."""
+        if is_known_verified(path, expected):
+            self.log("✓ Checksum OK (verified earlier, file unchanged since)")
+            return True
         self.set_status("Verifying ISO integrity…")
 
         def progress_cb(frac):
-            GLib.idle_add(self.progress.set_fraction, frac)
+            self.set_progress(frac)
+            self.set_status(f"Checksumming… {frac*100:.0f}%")
+
+        man = load_manifest(path, expected)
+        if man:
+            n = len(man["leaves"])
+            self.log(f"Verifying {n} chunks against the manifest on {os.cpu_count()} core(s)…")
+            bad = check_chunks(path, man, progress_cb=progress_cb)
+            if os.path.getsize(path) != man["size"]:
+                bad = sorted(set(bad) | {n - 1})
+            self.set_progress(0)
+            if not bad:
+                self.log(f"✓ Checksum OK (all {n} chunks match)")
+                record_verified(path, expected)
+                return True
+            self.log(f"✗ {len(bad)} of {n} chunks are corrupt", error=True)
+            if bad_chunks is not None:
+                bad_chunks.extend(bad)
+            return False
+
+        self.log("Verifying SHA-256 checksum…")
+        leaves = []
+        actual = sha256_file(path, progress_cb, leaves=leaves)
+        self.set_progress(0)
+        if not self._check_digest(actual, expected):
+            return False
+        record_verified(path, expected)
+        write_manifest(path, expected, leaves)
+        return True
+
+    def _repair_iso(self, distro, path, bad):
+        """Re-fetch the corrupt chunks of a cached ISO from peers and mirrors,
+        then check the whole file again.  True if it is now intact."""
+        sha = distro["sha256"]
+        man = load_manifest(path, sha)
+        if not man:
+            return False
+        cs, size = man["chunk_size"], man["size"]
+        ranges = [(i * cs, min((i + 1) * cs, size)) for i in bad]
+        need = sum(e - s for s, e in ranges)
+        self.log(f"Repairing: re-fetching {len(bad)} chunk(s), {round(need / 1e6, 1)} MB")
+
+        def fetch_cb(done):
+            self.set_progress(done / max(need, 1))
+            self.set_status(f"Repairing ISO {done / max(need, 1) * 100:.0f}%")
+
+        os.truncate(path, size)
+        urls = (self._lan_peers(sha)
+                + rank_mirrors(distro["mirrors"], load_mirror_scores()))
+        ok = fetch_ranges(urls, path, ranges, fetch_cb)
+        self.set_progress(0)
+        if not ok or check_chunks(path, man, bad):
+            self.log("Repair failed.", error=True)
+            return False
+
+        def progress_cb(frac):
+            self.set_progress(frac)
             self.set_status(f"Checksumming… {frac*100:.0f}%")
 
         actual = sha256_file(path, progress_cb)
-        GLib.idle_add(self.progress.set_fraction, 0)
+        self.set_progress(0)
+        if not self._check_digest(actual, sha, "after repair"):
+            return False
+        record_verified(path, sha)
+        return True
+
+    def _check_digest(self, actual, expected, how=""):
         if actual == expected:
-            self.log("✓ Checksum OK")
+            self.log(f"✓ Checksum OK ({how})" if how else "✓ Checksum OK")
             return True
         self.log(f"✗ Expected: {expected}", error=True)
         self.log(f"✗ Actual:   {actual}",   error=True)
@@ -1560,10 +5056,10 @@ class InstallerWindow(Gtk.ApplicationWindow):
                 return None
 
         run(["partprobe", disk_dev])
-        time.sleep(2)
+        self.disk_cache.settle(disk_dev, fallback=2)
 
         # Re-read actual end
-        parts, _, _ = get_disk_partitions(disk_dev)
+        parts, _, _ = get_disk_partitions(disk_dev, self.disk_cache)
         for p in parts:
             if not p["is_free"] and p["num"] == part_num:
                 self.log(f"Partition {part_num} now ends at {p['end_mib']} MiB.")
@@ -1612,12 +5108,12 @@ class InstallerWindow(Gtk.ApplicationWindow):
                 self.log(f"Cannot create partitions: {err2}", error=True)
                 return None
 
-        time.sleep(2)
+        self.disk_cache.settle(disk_path, fallback=2)
         run(["partprobe", disk_path])
-        time.sleep(2)
+        self.disk_cache.settle(disk_path, fallback=2)
 
         # Find newly created partitions by matching start positions
-        parts, _, _ = get_disk_partitions(disk_path)
+        parts, _, _ = get_disk_partitions(disk_path, self.disk_cache)
         boot_part_num = linux_part_num = None
         for p in parts:
             if p["is_free"] or p["num"] == 0:
@@ -1639,22 +5135,165 @@ class InstallerWindow(Gtk.ApplicationWindow):
         self.log(f"Linux partition : {linux_dev}")
         return boot_dev, linux_dev
 
-    def _format_and_populate_boot(self, boot_dev, iso_path, distro, distro_key):
-        """Format boot_dev as FAT32, mount it, copy ISO contents. Returns True on success."""
-        self.set_status("Formatting boot partition FAT32…")
-        code, _, err = run(["mkfs.fat", "-F32", "-n", "LINUX_LIVE", boot_dev])
-        if code != 0:
-            self.log(f"mkfs.fat failed: {err}", error=True)
-            return False
+    def _format_and_populate_boot(self, boot_dev, iso_path, distro, distro_key,
+                                  formatted=False):
+        """Format boot_dev as FAT32 and fill it with the ISO contents – in one
+        sequential write when possible, else via mkfs.fat (unless already
+        formatted) and the mounted partition.  Returns True on success."""
+        if self._loopback_mode(distro):
+            return self._write_loopback_boot(boot_dev, iso_path, distro, distro_key)
+        if os.path.exists(LOOPBACK_GRUB_SCRIPT):
+            os.unlink(LOOPBACK_GRUB_SCRIPT)   # left by an earlier loopback install
+        if iso_path:
+            if self._write_boot_image(boot_dev, iso_path, distro, distro_key):
+                digests = {}
+                return self._with_boot_mounted(boot_dev, lambda mnt: (
+                    self._verify_boot_copy(mnt, iso_path, distro, distro_key,
+                                           digests=digests)
+                    and self._record_live_manifest(mnt, iso_path, distro, distro_key,
+                                                   digests=digests)))
+            self.log("Falling back to mkfs.fat and copying through the mount.")
+            formatted = False
+
+        if not formatted:
+            self.set_status("Formatting boot partition FAT32…")
+            code, _, err = run(["mkfs.fat", "-F32", "-n", "LINUX_LIVE", boot_dev])
+            if code != 0:
+                self.log(f"mkfs.fat failed: {err}", error=True)
+                return False
+        return self._with_boot_mounted(
+            boot_dev, lambda mnt: self._populate_boot_mount(iso_path, mnt, distro, distro_key))
 
+    def _with_boot_mounted(self, boot_dev, fn):
         mnt = "/mnt/linux_installer_boot"
         os.makedirs(mnt, exist_ok=True)
         run(["mount", boot_dev, mnt])
         try:
-            ok = self._copy_iso_to_mount(iso_path, mnt, distro, distro_key)
+            return fn(mnt)
         finally:
             run(["umount", mnt])
-        return ok
+
+    def _write_boot_image(self, boot_dev, iso_path, distro, distro_key):
+        """Lay out the LINUX_LIVE FAT32 filesystem for the ISO's files in
+        memory and write it to boot_dev front to back.  True on success."""
+        self.log("Writing the LINUX_LIVE FAT32 filesystem in one pass…")
+        self.set_status("Writing boot partition…")
+        started = time.monotonic()
+
+        def progress_cb(done, total):
+            rate = done / max(time.monotonic() - started, 1e-3) / 1e6
+            self.set_progress(done / total)
+            self.set_status(f"Writing boot partition {done / total * 100:.0f}%  "
+                            f"{round(done / 1e6, 1)} / {round(total / 1e6, 1)} MB  "
+                            f"({rate:.1f} MB/s)")
+
+        try:
+            with open(iso_path, "rb") as src, open(boot_dev, "r+b") as dst:
+                size = os.lseek(dst.fileno(), 0, os.SEEK_END)
+                read_at = lambda off, n: os.pread(src.fileno(), n, off)
+                _, entries = iso_list(read_at, distro.get("hybrid", False))
+                plan = plan_rewrite(iso_copy_plan(entries, self.log), read_at,
+                                    self._boot_rewrites(distro_key))
+                img = fat_image_from_plan(plan_filter(plan, self._payload_skip(distro)))
+                img.write(dst.fileno(), size, src.fileno(),
+                          partition_start_sector(boot_dev), progress_cb)
+        except (IsoStreamError, IsoNeedMore, OSError, ValueError, struct.error) as e:
+            self.log(f"Could not write the boot filesystem directly: {e}", error=True)
+            return False
+        finally:
+            self.set_progress(0)
+        self.log(f"Boot partition written in {time.monotonic() - started:.0f} s.")
+        return True
+
+    def _write_loopback_boot(self, boot_dev, iso_path, distro, distro_key):
+        """Format boot_dev as ext4, put the ISO on it as a single file and add
+        a GRUB entry that loop-boots it.  Without iso_path the ISO is
+        downloaded straight onto the partition.  Returns True on success."""
+        self.set_status("Formatting boot partition ext4…")
+        # no metadata_csum_seed: GRUB before 2.12 refuses to read such volumes
+        code, _, err = run(["mkfs.ext4", "-F", "-q", "-L", "LINUX_LIVE", "-m", "0",
+                            "-T", "largefile", "-O", "^metadata_csum_seed", boot_dev])
+        if code != 0:
+            self.log(f"mkfs.ext4 failed: {err}", error=True)
+            return False
+        code, fs_uuid, err = run(["blkid", "-s", "UUID", "-o", "value", boot_dev])
+        if code != 0 or not fs_uuid.strip():
+            self.log(f"Cannot read the boot partition's UUID: {err}", error=True)
+            return False
+        return self._with_boot_mounted(boot_dev, lambda mnt: self._populate_loopback(
+            mnt, fs_uuid.strip(), iso_path, distro, distro_key))
+
+    def _populate_loopback(self, mnt, fs_uuid, iso_path, distro, distro_key):
+        dest = os.path.join(mnt, distro["filename"])
+        started = time.monotonic()
+        if iso_path is None:
+            self.log("Downloading the ISO straight onto the boot partition…")
+            ok = self._download_iso(distro, dest)
+            # the downloader's resume state and chunk manifest are kept next
+            # to its file – only the ISO itself belongs on LINUX_LIVE
+            for side in (f"{dest}.part", f"{dest}.part.json", f"{dest}.stream",
+                         f"{dest}.stream.json", _manifest_path(dest)):
+                if os.path.exists(side):
+                    os.unlink(side)
+            if not ok:
+                return False
+        else:
+            self.log("Copying the ISO onto the boot partition…")
+            size = os.path.getsize(iso_path)
+            done = [0]
+
+            def progress(n):
+                done[0] += n
+                rate = done[0] / max(time.monotonic() - started, 1e-3) / 1e6
+                self.set_progress(done[0] / size)
+                self.set_status(f"Copying ISO {done[0] / size * 100:.0f}%  "
+                                f"{round(done[0] / 1e6, 1)} / {round(size / 1e6, 1)} MB  "
+                                f"({rate:.1f} MB/s)")
+
+            try:
+                with open(iso_path, "rb") as src, open(dest, "wb") as dst:
+                    os.posix_fadvise(src.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                    copy_range(src.fileno(), dst.fileno(), 0, 0, size, progress)
+            except OSError as e:
+                self.log(f"Copying the ISO failed: {e}", error=True)
+                return False
+            finally:
+                self.set_progress(0)
+            self.log(f"ISO copied in {time.monotonic() - started:.0f} s.")
+
+        # read the file back from the disk, not the page cache
+        self.set_status("Verifying the ISO on the boot partition…")
+        os.sync()
+        with open(dest, "rb") as f:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        digest = sha256_file(dest, self.set_progress)
+        self.set_progress(0)
+        if not self._check_digest(digest, distro["sha256"], "read back from the boot partition"):
+            return False
+
+        spec = distro["loopback"]
+        try:
+            with open(dest, "rb") as f:
+                info, entries = iso_list(lambda off, n: os.pread(f.fileno(), n, off))
+        except (IsoStreamError, IsoNeedMore, OSError, ValueError, struct.error) as e:
+            self.log(f"Cannot read the ISO's file list: {e}", error=True)
+            return False
+        paths = {e["path"] for e in entries}
+        for p in (spec["kernel"], spec["initrd"]):
+            if p not in paths:
+                self.log(f"{p} not found in the ISO – cannot loop-boot it.", error=True)
+                return False
+
+        title = distro["label"].split("(")[0].strip() + " (live ISO)"
+        try:
+            write_loopback_grub_script(loopback_grub_entry(
+                title, fs_uuid, distro["filename"], spec, info["label"]))
+        except OSError as e:
+            self.log(f"Cannot write {LOOPBACK_GRUB_SCRIPT}: {e}", error=True)
+            return False
+        self._loopback_title = title
+        self.log(f"GRUB entry '{title}' added ({LOOPBACK_GRUB_SCRIPT}).")
+        return True
 
     def _finalize_strategy(self, boot_dev, linux_dev, distro_label):
         """Set _boot_part_dev, log results, write instructions."""
@@ -1666,12 +5305,13 @@ class InstallerWindow(Gtk.ApplicationWindow):
             boot_dev=boot_dev, linux_dev=linux_dev, distro_label=distro_label)
 
     # ── btrfs strategy ────────────────────────────────────────────────────────
-    def _strategy_btrfs(self, device, linux_gb, iso_path, distro, distro_key, custom_mode):
+    def _strategy_btrfs(self, device, linux_gb, boot_gb, iso_path, distro, distro_key,
+                        custom_mode):
         """Shrink root btrfs, resize partition entry, create boot+linux partitions."""
         self.log("")
         self.log("━━ Strategy: btrfs shrink + new partition ━━")
 
-        total_shrink_gb = linux_gb + MIN_BOOT_GB
+        total_shrink_gb = linux_gb + boot_gb
 
         # ── get btrfs usage ──
         self.set_status("Querying btrfs filesystem usage…")
@@ -1722,7 +5362,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
             return False
         self.log(f"Disk: {disk_dev}  Partition: {part_num}")
 
-        parts, disk_label, _ = get_disk_partitions(disk_dev)
+        parts, disk_label, _ = get_disk_partitions(disk_dev, self.disk_cache)
         is_gpt = "gpt" in disk_label.lower()
 
         part_start_mib = part_end_mib = None
@@ -1755,7 +5395,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
 
         # ── create boot + linux partitions in freed space ──
         boot_start = actual_new_end + 1
-        boot_end = boot_start + MIN_BOOT_GB * 1024
+        boot_end = boot_start + boot_gb * 1024
         linux_start = boot_end + 1
         if next_part_start_mib is not None:
             linux_end_str = f"{next_part_start_mib - 1}MiB"
@@ -1777,15 +5417,15 @@ class InstallerWindow(Gtk.ApplicationWindow):
         return True
 
     # ── use-free-space strategy (root or other disk) ─────────────────────────
-    def _strategy_use_free(self, disk_path, linux_gb, iso_path, distro,
+    def _strategy_use_free(self, disk_path, linux_gb, boot_gb, iso_path, distro,
                            distro_key, custom_mode):
         """Create partitions in existing unallocated space on disk_path."""
         self.log("")
         self.log("━━ Strategy: use existing unallocated space ━━")
 
-        total_needed_gb = linux_gb + MIN_BOOT_GB
+        total_needed_gb = linux_gb + boot_gb
 
-        parts, disk_label, _ = get_disk_partitions(disk_path)
+        parts, disk_label, _ = get_disk_partitions(disk_path, self.disk_cache)
         is_gpt = "gpt" in disk_label.lower()
 
         # Find largest free region that fits
@@ -1803,7 +5443,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
                  f"({round(best_free['size_mib'] / 1024, 1)} GB)")
 
         boot_start = best_free["start_mib"] + 1
-        boot_end = boot_start + MIN_BOOT_GB * 1024
+        boot_end = boot_start + boot_gb * 1024
         linux_start = boot_end + 1
         linux_end_str = f"{best_free['end_mib'] - 1}MiB"
 
@@ -1822,8 +5462,8 @@ class InstallerWindow(Gtk.ApplicationWindow):
     # ── filesystem shrink helpers ───────────────────────────────────────────
     def _shrink_btrfs(self, dev, shrink_bytes):
         """Shrink a btrfs filesystem by shrink_bytes. Can be done live (mounted)."""
-        code, mnt_out, _ = run(["findmnt", "-n", "-o", "TARGET", dev])
-        if code != 0 or not mnt_out.strip():
+        mountpoint = mount_target(dev)
+        if not mountpoint:
             tmp_mnt = "/mnt/linux_installer_shrink_target"
             os.makedirs(tmp_mnt, exist_ok=True)
             code, _, err = run(["mount", dev, tmp_mnt])
@@ -1833,7 +5473,6 @@ class InstallerWindow(Gtk.ApplicationWindow):
             mountpoint = tmp_mnt
             was_mounted = False
         else:
-            mountpoint = mnt_out.strip()
             was_mounted = True
 
         try:
@@ -1867,9 +5506,9 @@ class InstallerWindow(Gtk.ApplicationWindow):
     def _shrink_ext(self, dev, shrink_bytes):
         """Shrink an ext2/3/4 filesystem by shrink_bytes. Must be unmounted first."""
         # Check if currently mounted
-        code, mnt_out, _ = run(["findmnt", "-n", "-o", "TARGET", dev])
-        if code == 0 and mnt_out.strip():
-            self.log(f"{dev} is mounted at {mnt_out.strip()} — unmounting…")
+        mountpoint = mount_target(dev)
+        if mountpoint:
+            self.log(f"{dev} is mounted at {mountpoint} — unmounting…")
             code, _, err = run(["umount", dev])
             if code != 0:
                 self.log(f"Cannot unmount {dev}: {err}", error=True)
@@ -1919,9 +5558,9 @@ class InstallerWindow(Gtk.ApplicationWindow):
     def _shrink_ntfs(self, dev, shrink_bytes):
         """Shrink an NTFS filesystem by shrink_bytes using ntfsresize. Must be unmounted."""
         # Check if currently mounted
-        code, mnt_out, _ = run(["findmnt", "-n", "-o", "TARGET", dev])
-        if code == 0 and mnt_out.strip():
-            self.log(f"{dev} is mounted at {mnt_out.strip()} — unmounting…")
+        mountpoint = mount_target(dev)
+        if mountpoint:
+            self.log(f"{dev} is mounted at {mountpoint} — unmounting…")
             code, _, err = run(["umount", dev])
             if code != 0:
                 self.log(f"Cannot unmount {dev}: {err}", error=True)
@@ -1982,7 +5621,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
 
     # ── other-disk-shrink strategy ───────────────────────────────────────────
     def _strategy_other_disk_shrink(self, disk_path, shrink_dev, shrink_gb,
-                                     linux_gb, iso_path, distro, distro_key,
+                                     linux_gb, boot_gb, iso_path, distro, distro_key,
                                      custom_mode):
         """Shrink a partition on another disk and create boot+linux partitions."""
         self.log("")
@@ -2009,7 +5648,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
             self.log(f"Cannot resolve partition number for {shrink_dev}", error=True)
             return False
 
-        parts, disk_label, _ = get_disk_partitions(disk_path)
+        parts, disk_label, _ = get_disk_partitions(disk_path, self.disk_cache)
         is_gpt = "gpt" in disk_label.lower()
 
         part_start_mib = part_end_mib = None
@@ -2036,7 +5675,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
 
         # Create boot + linux partitions in freed space
         boot_start = actual_new_end + 1
-        boot_end = boot_start + MIN_BOOT_GB * 1024
+        boot_end = boot_start + boot_gb * 1024
         linux_start = boot_end + 1
         linux_end_str = f"{next_part_start_mib - 1}MiB" if next_part_start_mib else "100%"
 
@@ -2053,7 +5692,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
         return True
 
     # ── wipe-disk strategy (secondary drives only) ─────────────────────────
-    def _strategy_wipe_disk(self, disk_path, linux_gb, iso_path, distro,
+    def _strategy_wipe_disk(self, disk_path, linux_gb, boot_gb, iso_path, distro,
                             distro_key, custom_mode):
         """Wipe the entire secondary disk, create GPT, ESP, boot partition,
         and leave remaining space for the Linux installer."""
@@ -2061,7 +5700,6 @@ class InstallerWindow(Gtk.ApplicationWindow):
         self.log("━━ Strategy: wipe & reformat entire disk ━━")
         self.log(f"Target disk: {disk_path}")
 
-        boot_gb = MIN_BOOT_GB
         esp_mib = 512  # 512 MiB EFI System Partition
 
         # Safety: make sure this is NOT the root disk
@@ -2076,7 +5714,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
         # Unmount any partitions from this disk
         self.log("Unmounting any mounted partitions on target disk…")
         self.set_status("Unmounting target disk…")
-        parts, _, _ = get_disk_partitions(disk_path)
+        parts, _, _ = get_disk_partitions(disk_path, self.disk_cache)
         for p in parts:
             if p["is_free"] or p["num"] == 0:
                 continue
@@ -2089,9 +5727,9 @@ class InstallerWindow(Gtk.ApplicationWindow):
                 run(["swapoff", dev_p])
 
             # Unmount if mounted
-            code, mnt_out, _ = run(["findmnt", "-n", "-o", "TARGET", dev_p])
-            if code == 0 and mnt_out.strip():
-                self.log(f"  Unmounting {dev_p} from {mnt_out.strip()}")
+            mountpoint = mount_target(dev_p)
+            if mountpoint:
+                self.log(f"  Unmounting {dev_p} from {mountpoint}")
                 code, _, err = run(["umount", "-f", dev_p])
                 if code != 0:
                     # Try lazy unmount as last resort
@@ -2119,7 +5757,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
         # Tell the kernel to drop partition references
         self.log("Releasing kernel partition references…")
         run(["partprobe", disk_path])
-        time.sleep(1)
+        self.disk_cache.settle(disk_path)
 
         # ── Inhibit automounting BEFORE touching disk ──────────────────
         # Desktop environments (via udisks2) race to probe and mount new
@@ -2164,7 +5802,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
                     if os.path.exists(dev_p):
                         run(["wipefs", "--all", "--force", dev_p])
 
-            time.sleep(1)
+            self.disk_cache.settle(disk_path)
 
             # Wipe the partition table and create a fresh GPT
             self.log(f"Creating new GPT partition table on {disk_path}…")
@@ -2191,7 +5829,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
                     return False
 
             run(["partprobe", disk_path])
-            time.sleep(1)
+            self.disk_cache.settle(disk_path)
 
             # Partition layout:
             #   1. ESP:        1 MiB – 513 MiB  (512 MiB, FAT32, esp flag)
@@ -2223,24 +5861,23 @@ class InstallerWindow(Gtk.ApplicationWindow):
                 self.log(f"Failed to create boot partition: {err}", error=True)
                 return False
 
-            time.sleep(1)
-            run(["partprobe", disk_path])
-            if shutil.which("udevadm"):
-                run(["udevadm", "settle", "--timeout=10"])
-            time.sleep(1)
-
             # Identify the new partitions
             esp_dev = _part_dev_path(disk_path, 1)
             boot_dev = _part_dev_path(disk_path, 2)
 
+            self.disk_cache.settle(disk_path)
+            run(["partprobe", disk_path])
+            if shutil.which("udevadm"):
+                run(["udevadm", "settle", "--timeout=10"])
+            self.disk_cache.settle(disk_path, (esp_dev, boot_dev))
+
             # Verify they exist
             for dev in (esp_dev, boot_dev):
                 if not os.path.exists(dev):
-                    time.sleep(3)
                     run(["partprobe", disk_path])
                     if shutil.which("udevadm"):
                         run(["udevadm", "settle", "--timeout=10"])
-                    time.sleep(2)
+                    self.disk_cache.settle(disk_path, (dev,), fallback=5)
                     if not os.path.exists(dev):
                         self.log(f"Partition device {dev} not found after creation.",
                                  error=True)
@@ -2264,7 +5901,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
                         self.log(f"  Removing dm holder: {holder}")
                         run(["dmsetup", "remove", "--force", holder])
 
-            time.sleep(1)
+            self.disk_cache.settle(disk_path)
 
             # Wipe the first few MB of each new partition to clear any residual
             # signatures and release kernel probe locks before formatting
@@ -2274,7 +5911,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
             run(["partprobe", disk_path])
             if shutil.which("udevadm"):
                 run(["udevadm", "settle", "--timeout=5"])
-            time.sleep(1)
+            self.disk_cache.settle(disk_path)
 
             # Format partitions
             for label, dev, name in [("ESP", esp_dev, "EFI System Partition"),
@@ -2313,16 +5950,9 @@ class InstallerWindow(Gtk.ApplicationWindow):
                 self.log("Restarting udisks2 service…")
                 run(["systemctl", "start", "udisks2"])
 
-        # Mount and copy ISO to boot partition
-        mnt = "/mnt/linux_installer_boot"
-        os.makedirs(mnt, exist_ok=True)
-        run(["mount", boot_dev, mnt])
-        try:
-            ok = self._copy_iso_to_mount(iso_path, mnt, distro, distro_key)
-        finally:
-            run(["umount", mnt])
-
-        if not ok:
+        # Fill the boot partition (rewritten in one pass where possible)
+        if not self._format_and_populate_boot(boot_dev, iso_path, distro, distro_key,
+                                              formatted=True):
             return False
 
         # Log the final layout
@@ -2331,7 +5961,7 @@ class InstallerWindow(Gtk.ApplicationWindow):
         self.log(f"  Partition 1: {esp_dev}  – EFI System Partition (512 MB)")
         self.log(f"  Partition 2: {boot_dev} – LINUX_LIVE boot ({boot_gb} GB)")
         remaining_gb = round(
-            (get_disk_partitions(disk_path)[2] / 1024) - (esp_mib / 1024) - boot_gb, 1)
+            (get_disk_partitions(disk_path, self.disk_cache)[2] / 1024) - (esp_mib / 1024) - boot_gb, 1)
         if remaining_gb > 0:
             self.log(f"  Remaining:   ~{remaining_gb} GB unallocated for Linux installer")
 
@@ -2343,87 +5973,300 @@ class InstallerWindow(Gtk.ApplicationWindow):
         )
         return True
 
-    # ── GRUB integration ──────────────────────────────────────────────────────
-    def _copy_iso_to_mount(self, iso_path, mnt, distro, distro_key):
-        """Mount ISO read-only and rsync its contents to mnt."""
-        iso_mnt = "/mnt/linux_installer_iso_copy"
-        os.makedirs(iso_mnt, exist_ok=True)
-
-        hybrid = distro.get("hybrid", False)
+    # ── refresh strategy (existing LINUX_LIVE partition) ──────────────────────
+    def _strategy_refresh(self, boot_dev, iso_path, distro, distro_key):
+        """Bring an existing LINUX_LIVE partition up to date with iso_path
+        without repartitioning or reformatting it."""
+        self.log("")
+        self.log("━━ Strategy: refresh existing LINUX_LIVE partition ━━")
+        self.log(f"Boot partition: {boot_dev}")
+        if get_partition_fstype(boot_dev) != "vfat":
+            self.log(f"{boot_dev} is not a FAT partition – cannot refresh it.", error=True)
+            return False
+        if not self._with_boot_mounted(
+                boot_dev, lambda mnt: self._refresh_boot_mount(mnt, iso_path, distro, distro_key)):
+            return False
+        self._boot_part_dev = boot_dev
+        self.log(f"Boot partition refreshed at {boot_dev}.")
+        return True
 
-        if not hybrid:
-            code, _, err = run(["mount", "-o", "loop,ro", iso_path, iso_mnt])
-            if code != 0:
-                self.log(f"Cannot mount ISO: {err}", error=True)
-                return False
+    def _refresh_boot_mount(self, mnt, iso_path, distro, distro_key):
+        if not os.path.ismount(mnt):
+            self.log("Cannot mount the boot partition.", error=True)
+            return False
+        try:
+            plan = self._boot_copy_plan(iso_path, distro, distro_key)
+            self.set_status("Comparing the ISO with the boot partition…")
+            total = sum(f["size"] for f in plan["files"]) or 1
+            with open(iso_path, "rb") as f:
+                digests = plan_digests(f.fileno(), plan,
+                                       progress_cb=lambda n: self.set_progress(n / total))
+        except (IsoStreamError, IsoNeedMore, OSError, ValueError, struct.error) as e:
+            self.log(f"Cannot read the ISO: {e}", error=True)
+            return False
+        finally:
+            self.set_progress(0)
+        manifest = load_live_manifest(mnt)
+        if not manifest:
+            self.log(f"No {LIVE_MANIFEST} on the partition – every file is rewritten.")
+        changed, stale = refresh_diff(mnt, plan, digests, manifest)
+        need = sum(f["size"] for f in changed)
+        self.log(f"{len(plan['files']) - len(changed)} files unchanged, {len(changed)} to "
+                 f"write ({bytes_to_gb(need)} GB), {len(stale)} to delete.")
+
+        # check the room before deleting anything: a refresh that cannot fit
+        # must leave the old live system bootable
+        doomed = stale + [f["path"] for f in changed]
+        reclaim = 0
+        for rel in doomed:
+            try:
+                reclaim += os.lstat(os.path.join(mnt, rel)).st_blocks * 512
+            except FileNotFoundError:
+                pass
+        st = os.statvfs(mnt)
+        free = st.f_bavail * st.f_frsize
+        if free + reclaim < need:
+            self.log(f"Not enough room on the partition for the new files "
+                     f"({bytes_to_gb(free + reclaim)} GB available) – "
+                     "install to a new partition instead.", error=True)
+            return False
 
+        # a half-refreshed partition must not look up to date next time
         try:
-            if hybrid:
-                # For hybrid ISOs (Fedora), use 7z or isoinfo to extract
-                self.log("Hybrid ISO detected – extracting with 7z…")
-                code, _, err = run(["7z", "x", f"-o{mnt}", iso_path, "-y"],
-                                   capture_output=False)
-                if code not in (0, 1):
-                    self.log(f"7z extraction failed ({code}): {err}", error=True)
-                    return False
-            else:
-                self.log("Copying ISO contents to boot partition (10–20 min)…")
-                self.set_status("Copying files…")
-
-                # Detect self-referential symlinks (e.g. ubuntu -> .) that would
-                # cause rsync --copy-links to duplicate the entire tree.
-                # We exclude those but still dereference other symlinks so that
-                # paths like dists/stable -> noble are resolved on FAT32.
-                exclude_args = []
-                try:
-                    for entry in os.listdir(iso_mnt):
-                        full = os.path.join(iso_mnt, entry)
-                        if os.path.islink(full):
-                            target = os.path.realpath(full)
-                            if os.path.realpath(iso_mnt) == target:
-                                exclude_args += ["--exclude", f"/{entry}"]
-                                self.log(f"Skipping self-referential symlink: {entry} -> .")
-                except OSError:
-                    pass
+            os.unlink(os.path.join(mnt, LIVE_MANIFEST))
+        except FileNotFoundError:
+            pass
+        for rel in doomed:
+            try:
+                os.unlink(os.path.join(mnt, rel))
+            except FileNotFoundError:
+                pass
+        keep_dirs = set(plan["dirs"])
+        for root, dirs, files in os.walk(mnt, topdown=False):
+            rel = os.path.relpath(root, mnt)
+            if rel != "." and rel not in keep_dirs and not dirs and not files:
+                os.rmdir(root)
+
+        sub = {"dirs": plan["dirs"], "files": changed}
+        if changed:
+            self.set_status("Writing changed files…")
+            started = time.monotonic()
+
+            def progress_cb(done, total):
+                rate = done / max(time.monotonic() - started, 1e-3) / 1e6
+                self.set_progress(done / total)
+                self.set_status(f"Writing changed files {done / total * 100:.0f}%  "
+                                f"{round(done / 1e6, 1)} / {round(total / 1e6, 1)} MB  "
+                                f"({rate:.1f} MB/s)")
 
-                code, _, err = run(
-                    ["rsync", "-a", "--copy-links", "--info=progress2"]
-                    + exclude_args +
-                    [f"{iso_mnt}/", f"{mnt}/"],
-                    capture_output=False)
-                if code != 0:
-                    self.log(f"rsync failed: {err}", error=True)
-                    return False
+            try:
+                _makedirs_for_plan(mnt, sub)
+                with open(iso_path, "rb") as f:
+                    copy_plan_files(f.fileno(), mnt, sub, progress_cb)
+            except OSError as e:
+                self.log(f"Writing the changed files failed: {e}", error=True)
+                return False
+            finally:
+                self.set_progress(0)
+            self.log(f"Wrote {len(changed)} files in {time.monotonic() - started:.0f} s.")
+            if not self._verify_boot_copy(mnt, iso_path, distro, distro_key, sub):
+                return False
+        return self._record_live_manifest(mnt, iso_path, distro, distro_key, plan, digests)
+
+    # ── GRUB integration ──────────────────────────────────────────────────────
+    def _populate_boot_mount(self, iso_path, mnt, distro, distro_key):
+        """Fill the mounted boot partition from iso_path, or – when iso_path is
+        None – straight from the network."""
+        if iso_path is None:
+            ok = self._stream_iso_to_mount(distro, mnt, distro_key)
+            if ok is not None:
+                return ok and self._verify_boot_copy(mnt, None, distro, distro_key)
+            self.log("Falling back to downloading the ISO before copying it.")
+            iso_path = self._ensure_cached_iso(distro_key, distro)
+            if not iso_path:
+                return False
+        digests = {}
+        return (self._copy_iso_to_mount(iso_path, mnt, distro, distro_key)
+                and self._verify_boot_copy(mnt, iso_path, distro, distro_key,
+                                           digests=digests)
+                and self._record_live_manifest(mnt, iso_path, distro, distro_key,
+                                               digests=digests))
+
+    def _boot_rewrites(self, distro_key):
+        """{path: fn} for the ISO files that are changed on their way to LINUX_LIVE."""
+        if distro_key != "fedora":
+            return {}
+        return {p: lambda data: patch_boot_labels(data, "LINUX_LIVE")
+                for p in FEDORA_PATCHED_CFGS}
+
+    def _boot_copy_plan(self, iso_path, distro, distro_key):
+        """The copy plan for putting iso_path onto LINUX_LIVE, with the boot
+        images and rewritten files the copy itself uses."""
+        with open(iso_path, "rb") as f:
+            read_at = lambda off, n: os.pread(f.fileno(), n, off)
+            _, entries = iso_list(read_at, distro.get("hybrid", False))
+            return plan_filter(plan_rewrite(iso_copy_plan(entries), read_at,
+                                            self._boot_rewrites(distro_key)),
+                               self._payload_skip(distro))
+
+    def _verify_boot_copy(self, mnt, iso_path, distro, distro_key, plan=None,
+                          digests=None):
+        """Read every copied file back from the boot partition and check it
+        against the image's checksum list or, given iso_path, the ISO itself.
+        plan limits the check to the files it lists; digests, a dict, collects
+        the SHA-256 of each verified file for the manifest."""
+        if iso_path and plan is None:
+            try:
+                plan = self._boot_copy_plan(iso_path, distro, distro_key)
+            except (IsoStreamError, IsoNeedMore, OSError, ValueError, struct.error) as e:
+                self.log(f"Cannot read the ISO's file list ({e}) – "
+                         "checking against its checksum list only.", error=True)
+        copied = [os.path.relpath(os.path.join(r, n), mnt)
+                  for r, _, names in os.walk(mnt) for n in names]
+        missing = [g for g in self._payload_critical(distro)
+                   if not any(fnmatch.fnmatchcase(p, g) for p in copied)]
+        if missing:
+            self.log("The boot partition lacks files the live system needs: "
+                     + ", ".join(missing), error=True)
+            return False
+        # without a plan the rewritten files have nothing to be compared with
+        jobs = copy_check_jobs(mnt, plan, self._payload_skip(distro) + (
+            () if plan else tuple(self._boot_rewrites(distro_key))))
+        if not jobs:
+            self.log("No checksums available – copied files not verified.")
+            return True
+        total = sum(j["size"] for j in jobs) or 1
+        self.log(f"Verifying {len(jobs)} copied files…")
+        self.set_status("Verifying copied files…")
+
+        def progress_cb(done):
+            self.set_progress(done / total)
+            self.set_status(f"Verifying copied files… {min(done / total, 1) * 100:.0f}%")
+
+        started = time.monotonic()
+        bad = verify_copy(mnt, jobs, iso_path if plan else None, progress_cb=progress_cb,
+                          digests=digests)
+        self.set_progress(0)
+        for path, problem in bad[:20]:
+            self.log(f"✗ {path}: {problem}", error=True)
+        if bad:
+            self.log(f"{len(bad)} file(s) on the boot partition are damaged – "
+                     "the partition would not boot.", error=True)
+            return False
+        self.log(f"✓ All {len(jobs)} copied files verified "
+                 f"({time.monotonic() - started:.0f} s)")
+        return True
 
-            # Fix Fedora boot labels if needed
-            if distro_key == "fedora":
-                self._patch_fedora_labels(mnt, "LINUX_LIVE")
+    def _record_live_manifest(self, mnt, iso_path, distro, distro_key, plan=None,
+                              digests=None):
+        """Write the manifest a later refresh diffs against, from digests
+        gathered while verifying; only files they lack are hashed from the ISO.
+        Nothing is recorded without iso_path; a failure only costs the next
+        refresh a full rewrite, so it never fails the installation."""
+        if not iso_path:
+            return True
+        try:
+            plan = plan or self._boot_copy_plan(iso_path, distro, distro_key)
+            digests = dict(digests or {})
+            rest = [f for f in plan["files"] if f["path"] not in digests]
+            if rest:
+                self.set_status("Recording the boot partition's contents…")
+                total = sum(f["size"] for f in rest) or 1
+                with open(iso_path, "rb") as f:
+                    digests.update(plan_digests(
+                        f.fileno(), {"dirs": plan["dirs"], "files": rest},
+                        progress_cb=lambda n: self.set_progress(n / total)))
+            write_live_manifest(mnt, plan, digests, os.path.basename(iso_path))
+        except (IsoStreamError, IsoNeedMore, OSError, ValueError, struct.error) as e:
+            self.log(f"Could not record {LIVE_MANIFEST}: {e}", error=True)
+        finally:
+            self.set_progress(0)
+        return True
 
+    def _stream_iso_to_mount(self, distro, mnt, distro_key):
+        """Download the ISO and extract it into mnt in the same pass, hashing
+        it on the way.  Returns True/False, or None if the image turned out
+        not to be streamable (mnt is left empty in that case)."""
+        self.log("Streaming ISO into the boot partition…")
+        self.set_status("Connecting…")
+        stream = MirrorStream(self._lan_peers(distro["sha256"])
+                              + rank_mirrors(distro["mirrors"], load_mirror_scores()),
+                              log=self.log)
+        ex = IsoStreamExtractor(mnt, log=self.log, boot_images=distro.get("hybrid", False),
+                                rewrite=self._boot_rewrites(distro_key),
+                                skip=self._payload_skip(distro))
+        h = hashlib.sha256()
+        started = time.monotonic()
+        try:
+            for buf in stream:
+                ex.feed(buf)
+                h.update(buf)
+                if stream.size:
+                    frac = stream.pos / stream.size
+                    rate = stream.pos / max(time.monotonic() - started, 1e-3) / 1e6
+                    self.set_progress(frac)
+                    self.set_status(f"Downloading + copying {frac*100:.0f}%  "
+                                    f"{round(stream.pos / 1e6, 1)} / "
+                                    f"{round(stream.size / 1e6, 1)} MB  ({rate:.1f} MB/s)")
+            ex.close()
+        except IsoStreamError as e:
+            ex.abort()
+            self.log(f"Cannot stream this ISO: {e}", error=True)
+            self._clear_dir(mnt)
+            return None
+        except (OSError, ValueError) as e:
+            ex.abort()
+            self.log(f"Streaming failed: {e}", error=True)
+            self._clear_dir(mnt)
+            return False
         finally:
-            if not hybrid:
-                run(["umount", iso_mnt])
+            self.set_progress(0)
 
+        if not self._check_digest(h.hexdigest(), distro["sha256"], "computed while streaming"):
+            self.log("Discarding the streamed files.", error=True)
+            self._clear_dir(mnt)
+            return False
+        self.log(f"Streamed {bytes_to_gb(stream.pos)} GB in "
+                 f"{time.monotonic() - started:.0f} s.")
         self.log("ISO contents copied.")
         return True
 
-    def _patch_fedora_labels(self, mnt, label):
-        self.log(f"Patching Fedora boot config labels → {label}")
-        cfg_files = [
-            f"{mnt}/EFI/BOOT/grub.cfg",
-            f"{mnt}/boot/grub2/grub.cfg",
-            f"{mnt}/isolinux/isolinux.cfg",
-        ]
-        for p in cfg_files:
-            if not os.path.exists(p):
-                continue
-            with open(p, "r", errors="replace") as f:
-                content = f.read()
-            patched = re.sub(r"(root=live:(?:CD)?LABEL=)(\S+)", rf"\g<1>{label}", content)
-            patched = re.sub(r"(set isolabel=)(\S+)", rf"\g<1>{label}", patched)
-            if patched != content:
-                with open(p, "w") as f:
-                    f.write(patched)
-                self.log(f"  Patched: {Path(p).name}")
+    def _clear_dir(self, path):
+        for name in os.listdir(path):
+            full = os.path.join(path, name)
+            if os.path.isdir(full) and not os.path.islink(full):
+                shutil.rmtree(full, ignore_errors=True)
+            else:
+                os.unlink(full)
+
+    def _copy_iso_to_mount(self, iso_path, mnt, distro, distro_key):
+        """Copy the ISO's file tree to mnt."""
+        self.log("Copying ISO contents to boot partition…")
+        self.set_status("Copying files…")
+        started = time.monotonic()
+
+        def progress_cb(done, total):
+            rate = done / max(time.monotonic() - started, 1e-3) / 1e6
+            self.set_progress(done / total)
+            self.set_status(f"Copying files {done / total * 100:.0f}%  "
+                            f"{round(done / 1e6, 1)} / {round(total / 1e6, 1)} MB  "
+                            f"({rate:.1f} MB/s)")
+
+        try:
+            plan = iso_extract(iso_path, mnt, self.log, progress_cb,
+                               boot_images=distro.get("hybrid", False),
+                               rewrite=self._boot_rewrites(distro_key),
+                               skip=self._payload_skip(distro),
+                               first=self._payload_critical(distro))
+        except (IsoStreamError, IsoNeedMore, OSError, ValueError, struct.error) as e:
+            self.log(f"Copying the ISO failed: {e}", error=True)
+            return False
+        finally:
+            self.set_progress(0)
+        self.log(f"Copied {len(plan['files'])} files in "
+                 f"{time.monotonic() - started:.0f} s.")
+        self.log("ISO contents copied.")
+        return True
 
     def _update_grub(self):
         self.log("Updating GRUB…")
@@ -2440,6 +6283,15 @@ class InstallerWindow(Gtk.ApplicationWindow):
         self.log("Run 'sudo update-grub' or 'sudo grub2-mkconfig -o /boot/grub2/grub.cfg' manually.")
         return False
 
+    def _set_grub_next_entry(self, title):
+        """Make GRUB boot the entry called title once, on the next start."""
+        for cmd in (["grub-reboot", title], ["grub2-reboot", title]):
+            if shutil.which(cmd[0]) and run(cmd)[0] == 0:
+                self.log(f"GRUB will start '{title}' on the next boot.")
+                return True
+        self.log(f"Choose '{title}' in the GRUB menu when the computer restarts.")
+        return False
+
     def _set_uefi_boot_entry(self, boot_part_dev, distro_label):
         """
         Create a UEFI boot entry for the live boot partition and set it
@@ -2473,9 +6325,9 @@ class InstallerWindow(Gtk.ApplicationWindow):
         code, _, _ = run(["mount", "-o", "ro", boot_part_dev, mnt])
         if code != 0:
             # It might already be mounted from the copy step
-            code, mnt_out, _ = run(["findmnt", "-n", "-o", "TARGET", boot_part_dev])
-            if code == 0 and mnt_out:
-                mnt = mnt_out.strip()
+            mounted_at = mount_target(boot_part_dev)
+            if mounted_at:
+                mnt = mounted_at
             else:
                 self.log("Cannot mount boot partition to find EFI loader.", error=True)
                 return
@@ -2608,13 +6460,15 @@ class InstallerWindow(Gtk.ApplicationWindow):
 
     def _write_boot_instructions(self, boot_dev, linux_dev, distro_label):
         dest = Path.home() / "Desktop" / "Linux_Installer_Instructions.txt"
+        contents = ("ext4 – contains the ISO file, started from the GRUB menu"
+                    if self._loopback_title else "FAT32 – contains live ISO files")
         body = f"""
 Linux Installer – Boot Instructions
 ====================================
 Strategy: btrfs partition shrink + new partition
 
 Distro:          {distro_label}
-Boot partition:  {boot_dev}  (FAT32, 7 GB – contains live ISO files)
+Boot partition:  {boot_dev}  ({contents})
 Linux partition: {linux_dev}  (unformatted – installer will use this)
 
 To boot the live environment:
@@ -2649,7 +6503,7 @@ as free space and offer "Install alongside existing Linux".
 
 def check_deps():
     missing = []
-    for tool in ["parted", "rsync", "mkfs.fat",
+    for tool in ["parted", "mkfs.fat",
                  "btrfs", "blkid", "update-grub",
                  "sfdisk", "resize2fs", "e2fsck", "lsblk",
                  "ntfsresize"]:
@@ -2708,14 +6562,32 @@ if __name__ == "__main__":
             print("Missing tools:", ", ".join(m))
             print("Install with:")
             print("  sudo apt install " +
-                  "parted rsync dosfstools btrfs-progs grub-common "
+                  "parted dosfstools btrfs-progs grub-common "
                   "e2fsprogs fdisk util-linux ntfs-3g")
         else:
             print("All dependencies satisfied.")
         sys.exit(0)
 
+    if "--bench-hash" in sys.argv:
+        i = sys.argv.index("--bench-hash")
+        if i + 1 >= len(sys.argv):
+            print("Usage: --bench-hash FILE")
+            sys.exit(2)
+        bench_sha256(sys.argv[i + 1])
+        sys.exit(0)
+
     ensure_root()
 
+    if "--serve-cache" in sys.argv:
+        server = PeerCacheServer(log=lambda msg, error=False: print(msg, flush=True))
+        server.start()
+        print(f"Serving {iso_cache_dir()} – press Ctrl+C to stop.")
+        try:
+            signal.pause()
+        except KeyboardInterrupt:
+            server.stop()
+        sys.exit(0)
+
     app = InstallerApp()
     signal.signal(signal.SIGINT, signal.SIG_DFL)
     sys.exit(app.run(sys.argv))